@@ -0,0 +1,110 @@
+"""
+Benchmark of the merge of chunked get_security_metrics results: groupby().last() vs the join based engine
+
+    python -m benchmarks.bench_secapi_merge --securities 200 --days 2500 --chunks 5
+
+Peak memory is measured with tracemalloc, which also tracks numpy (and therefore pandas) allocations.
+"""
+
+import argparse
+import time
+import tracemalloc
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from merqube_client_lib.secapi.frames import (
+    concat_security_chunks,
+    merge_metric_chunks,
+)
+
+
+def _groupby_last(dfs: list[pd.DataFrame]) -> pd.DataFrame:
+    """the merge used before merge_metric_chunks / concat_security_chunks"""
+    return (
+        pd.concat(dfs)
+        .groupby(["eff_ts", "id"])
+        .last()
+        .reset_index()
+        .sort_values(["id", "eff_ts"])
+        .reset_index()
+        .drop("index", axis=1)
+    )
+
+
+def _metric_chunks(securities: int, days: int, chunks: int, metrics_per_chunk: int) -> list[pd.DataFrame]:
+    """frames shaped like a pull chunked by metrics: same keys in every chunk, disjoint metric columns"""
+    eff_ts = pd.date_range("2010-01-01", periods=days).strftime("%Y-%m-%dT%H:%M:%S").tolist()
+    ids = [f"id-{i:05d}" for i in range(securities)]
+    keys = {"eff_ts": np.tile(np.array(eff_ts, dtype=object), securities), "id": np.repeat(np.array(ids), days)}
+    rng = np.random.default_rng(0)
+    return [
+        pd.DataFrame(
+            {
+                **keys,
+                "name": keys["id"],
+                **{f"m{c}_{m}": rng.random(securities * days) for m in range(metrics_per_chunk)},
+            }
+        )
+        for c in range(chunks)
+    ]
+
+
+def _security_chunks(securities: int, days: int, chunks: int, metrics_per_chunk: int) -> list[pd.DataFrame]:
+    """frames shaped like a pull chunked by securities: disjoint keys, same metric columns"""
+    per_chunk = max(1, securities // chunks)
+    eff_ts = pd.date_range("2010-01-01", periods=days).strftime("%Y-%m-%dT%H:%M:%S").tolist()
+    rng = np.random.default_rng(0)
+    dfs = []
+    for c in range(chunks):
+        ids = [f"id-{c:03d}-{i:05d}" for i in range(per_chunk)]
+        dfs.append(
+            pd.DataFrame(
+                {
+                    "eff_ts": np.tile(np.array(eff_ts, dtype=object), per_chunk),
+                    "id": np.repeat(np.array(ids), days),
+                    **{f"m{m}": rng.random(per_chunk * days) for m in range(metrics_per_chunk)},
+                }
+            )
+        )
+    return dfs
+
+
+def _measure(merge: Callable[[list[pd.DataFrame]], pd.DataFrame], dfs: list[pd.DataFrame]) -> tuple[float, float]:
+    """returns (seconds, peak MiB allocated on top of the inputs)"""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    merge(dfs)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2**20
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--securities", type=int, default=200)
+    parser.add_argument("--days", type=int, default=2500)
+    parser.add_argument("--chunks", type=int, default=5)
+    parser.add_argument("--metrics-per-chunk", type=int, default=4)
+    args = parser.parse_args()
+
+    for label, builder, engine in [
+        ("metric chunks", _metric_chunks, merge_metric_chunks),
+        ("security chunks", _security_chunks, concat_security_chunks),
+    ]:
+        sizes = (args.securities, args.days, args.chunks, args.metrics_per_chunk)
+        # fresh inputs for every run; merge_metric_chunks indexes its inputs in place
+        old_s, old_mib = _measure(_groupby_last, builder(*sizes))
+        new_s, new_mib = _measure(engine, builder(*sizes))
+        print(
+            f"{label:16s} groupby-last: {old_s:7.3f}s {old_mib:9.1f} MiB peak | "
+            f"join engine: {new_s:7.3f}s {new_mib:9.1f} MiB peak | "
+            f"memory -{100 * (1 - new_mib / old_mib):.0f}%"
+        )
+
+
+if __name__ == "__main__":
+    main()
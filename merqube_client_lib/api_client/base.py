@@ -2,41 +2,128 @@
 Base class for all Merqube API Clients
 """
 
+import datetime
 import logging
-import operator
-from collections import abc
+import threading
+import time
+from collections import abc, defaultdict
 from copy import deepcopy
-from functools import wraps
-from typing import Any, Callable, Iterable, Optional, cast
+from functools import partial, wraps
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    Literal,
+    Mapping,
+    Optional,
+    cast,
+    overload,
+)
 
 import pandas as pd
-from cachetools import TTLCache, cachedmethod
+from cachetools import LRUCache, TTLCache
+from pydantic import ValidationError
 
 # import like this so monkeypatch works as expected:
 from merqube_client_lib import session
 from merqube_client_lib.constants import DEFAULT_CACHE_TTL
+from merqube_client_lib.exceptions import APIError
+from merqube_client_lib.indexapi.catalog import IndexCatalog
+from merqube_client_lib.indexapi.manifests import LazyIndexList
 from merqube_client_lib.logging import get_module_logger
-from merqube_client_lib.pydantic_v2_types import EquityBasketPortfolio
+from merqube_client_lib.pydantic_v2_types import (
+    EquityBasketPortfolio,
+)
 from merqube_client_lib.pydantic_v2_types import IndexDefinitionPatchPutGet as Index
-from merqube_client_lib.pydantic_v2_types import IndexDefinitionPost, RunState
+from merqube_client_lib.pydantic_v2_types import (
+    IndexDefinitionPost,
+    NewSecurity,
+    RunState,
+    SecurityCreationResponse,
+)
+from merqube_client_lib.secapi.arrow import (
+    concat_security_tables,
+    import_pyarrow,
+    merge_metric_tables,
+    records_to_table,
+    to_parquet_dataset,
+)
+from merqube_client_lib.secapi.asof import PointInTimeIndex
+from merqube_client_lib.secapi.bulk import (
+    batch_encoded,
+    describe_error,
+    encode_records,
+    iter_records,
+    send_batches,
+    send_with_retries,
+)
+from merqube_client_lib.secapi.cache import DateRange, SecAPIMetricsCache
+from merqube_client_lib.secapi.extract import SecAPIExtractionJob
+from merqube_client_lib.secapi.frames import (
+    compact_frame,
+    concat_security_chunks,
+    csv_to_frame,
+    merge_metric_chunks,
+    records_to_frame,
+    records_to_wide,
+)
+from merqube_client_lib.secapi.loader import SecAPIMetricsLoader
+from merqube_client_lib.secapi.metadata import (
+    MetricDefinitionInterner,
+    SecAPIMetadataCache,
+)
+from merqube_client_lib.secapi.resolver import SecurityResolver
+from merqube_client_lib.secapi.watch import HighWaterMarks, merge_new_rows
 from merqube_client_lib.session import MerqubeAPISession
 from merqube_client_lib.types import Manifest, ManifestList, ResponseJson
+from merqube_client_lib.types.indexapi import (
+    IndexPatchSummary,
+    TargetPortfolioUploadSummary,
+)
 from merqube_client_lib.types.secapi import (
     AddlSecapiOptions,
+    BulkWriteSummary,
+    ExtractionSummary,
     MappingTable,
+    SecAPILayout,
     SecapiMetricDefinition,
+    SecAPIMetricsRequest,
+    SecAPIOutput,
     SecAPIRecordsResponse,
+    SecAPIWireFormat,
+    SecurityCreationSummary,
 )
 from merqube_client_lib.util import (
-    batch_post_payload,
     freezable_utcnow_ts,
+    iter_batches,
+    iter_concurrently,
     pydantic_to_dict,
+    to_utc_naive_ts,
 )
 
 EMPTY_RES: ResponseJson = {}
+# the manifest fields needed to write to an index
+INDEX_STATUS_FIELDS = ["id", "name", "status"]
+# status codes with which the indexapi rejects a write with a stale status
+WRITE_CONFLICT_CODES = frozenset({409, 412})
+# bounds of one batch of a bulk secapi write
+DEFAULT_BULK_MAX_BYTES = 4 << 20
+DEFAULT_BULK_MAX_ROWS = 5000
+SECURITY_METRICS_KEYS = ["id", "metric", "eff_ts", "prov_ts", "value"]
+SECURITY_METRICS_DELETION_KEYS = ["id", "metric", "eff_ts", "prov_ts", "source"]
 logger = get_module_logger(__name__, level=logging.DEBUG)
 
 
+def _join_query_options(query_options: dict[str, str | Iterable[str] | None] | None) -> dict[str, str | list[str]]:
+    """drops None options and joins lists with commas"""
+    options: dict[str, str | list[str]] = {}
+    for qo, v in (query_options or {}).items():
+        if v is not None:
+            options[qo] = v if isinstance(v, str) else ",".join(v)
+    return options
+
+
 def _name_or_id(func: Callable[..., Any]) -> Callable[..., Any]:
     """
     decorator to allow passing either id or name to a function
@@ -77,12 +164,7 @@ class _MerqubeApiClientBase:
         """
         common function to /security metrics and definitions
         """
-        options: dict[str, str | list[str]] = {}
-
-        for qo, v in (query_options or {}).items():
-            if v is not None:
-                options[qo] = v if isinstance(v, str) else ",".join(v)
-
+        options = _join_query_options(query_options)
         return self.session.get_collection(url=url, options=options, raise_perm_errors=raise_perm_errors)
 
 
@@ -91,6 +173,30 @@ class _IndexAPIClient(_MerqubeApiClientBase):
     Indexapi class that contains methods that deal with multiple indices, creation of indices etc
     """
 
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        # index id -> {id, name, status} as last read, for optimistic patches
+        self.index_status_tokens: TTLCache[str, Manifest] = TTLCache(maxsize=100_000, ttl=DEFAULT_CACHE_TTL)
+        self._status_tokens_lock = threading.Lock()
+
+    def _remember_statuses(self, manifests: Iterable[Manifest]) -> None:
+        """keeps the status (write token) of manifests that were just read"""
+        with self._status_tokens_lock:
+            for m in manifests:
+                if "id" in m and "status" in m:
+                    self.index_status_tokens[m["id"]] = {"id": m["id"], "name": m.get("name"), "status": m["status"]}
+
+    def _cached_status(self, index_id: str) -> Manifest | None:
+        with self._status_tokens_lock:
+            return self.index_status_tokens.get(index_id)
+
+    def _patched(self, index_id: str, response: Any) -> None:
+        """a patch makes the status we sent stale; keep the new one if the response has it"""
+        with self._status_tokens_lock:
+            self.index_status_tokens.pop(index_id, None)
+        if isinstance(response, dict) and "status" in response:
+            self._remember_statuses([{"id": index_id, **response}])
+
     def get_index_defs(
         self,
         index_names: str | list[str] | None = None,
@@ -113,7 +219,9 @@ class _IndexAPIClient(_MerqubeApiClientBase):
             endpoint += "?stage=prod"
 
         if not index_names:
-            all_indices = self.session.get_collection(endpoint)
+            all_options = {"fields": ",".join(sorted(set(fields)))} if fields else None
+            all_indices = self.session.get_collection(endpoint, options=all_options)
+            self._remember_statuses(all_indices)
             return {i["id"]: i for i in all_indices}
 
         options: dict[str, str] = {"names": (index_names if isinstance(index_names, str) else ",".join(index_names))}
@@ -124,16 +232,141 @@ class _IndexAPIClient(_MerqubeApiClientBase):
         url = "/index"
 
         res = self.session.get_collection(url, options=options)
+        self._remember_statuses(res)
         return {i["id"]: i for i in res}
 
+    def _index_statuses(self, index_names: list[str] | None = None) -> dict[str, Manifest]:
+        """id -> {id, name, status} of the given (or all, in every stage) indices, in one request"""
+        return self.get_index_defs(index_names=index_names, include_nonprod=True, fields=INDEX_STATUS_FIELDS)
+
+    def _statuses_of(self, index_ids: list[str], max_workers: int) -> tuple[dict[str, Manifest], dict[str, str]]:
+        """
+        ({id: {id, name, status}}, {id: error}) of index_ids; ids that do not exist (or are not permissioned) are in
+        neither. The index collection can only be filtered by name, so the indices whose name is known from an earlier
+        read are read in one request, and the rest (or any that were renamed) with one GET each.
+        """
+        names = {token["name"] for i in index_ids if (token := self._cached_status(i)) and token.get("name")}
+        found = self._index_statuses(index_names=sorted(names)) if names else {}
+        statuses = {i: found[i] for i in index_ids if i in found}
+
+        def read(index_id: str) -> tuple[str, Manifest | None, Exception | None]:
+            try:
+                manifest = self.get_index_manifest(index_id=index_id)
+            except APIError as e:
+                return index_id, None, None if e.code in (403, 404) else e
+            return index_id, {k: manifest[k] for k in INDEX_STATUS_FIELDS if k in manifest}, None
+
+        errors = {}
+        unread = [i for i in index_ids if i not in statuses]
+        for index_id, status, error in iter_concurrently(read, unread, max_workers=max_workers, ordered=False):
+            if status is not None:
+                statuses[index_id] = status
+            elif error is not None:
+                errors[index_id] = describe_error(error)
+        return statuses, errors
+
+    def bulk_patch_indices(
+        self,
+        updates: Mapping[str, Manifest],
+        max_workers: int = 8,
+        retries: int = 3,
+        conflict_retries: int = 3,
+        optimistic: bool = False,
+    ) -> IndexPatchSummary:
+        """
+        patch_index for many indices: updates is {index id: partial manifest}.
+
+        Only the statuses (write tokens) of the indices being patched are read: in one projected request by name for
+        those whose name is known from an earlier read, with one GET each for the rest. The PATCHes are sent with up to
+        max_workers in flight, each retried on transient errors (see secapi.bulk.send_with_retries). A PATCH rejected
+        because its status was stale (a write conflict) is retried with a freshly read status, up to conflict_retries
+        times; only the conflicted indices are re-read. That includes a conflict on a retried PATCH: it is never taken
+        to mean an earlier attempt was applied.
+
+        updates are not modified. Failures are reported in the summary rather than raised; ids that do not exist (or
+        are not permissioned), including ones deleted while being patched, are listed as missing.
+
+        optimistic: if every index has a status from a recent read (see patch_index), skip the status request
+        """
+        todo = {index_id: upd for index_id, upd in updates.items() if upd}
+        statuses = {i: token for i in todo if optimistic and (token := self._cached_status(i)) is not None}
+        summary: IndexPatchSummary = {"patched": {}, "failed": {}, "missing": [], "conflicts": 0}
+        if len(statuses) < len(todo):
+            statuses, summary["failed"] = self._statuses_of(list(todo), max_workers=max_workers)
+        summary["missing"] = [i for i in todo if i not in statuses and i not in summary["failed"]]
+        todo = {index_id: upd for index_id, upd in todo.items() if index_id in statuses}
+
+        def patch(index_id: str) -> tuple[str, Any, Exception | None]:
+            body = {**todo[index_id], "status": statuses[index_id]["status"]}
+            response, _, error = send_with_retries(
+                lambda headers: self.session.patch(f"/index/{index_id}", json=body, headers=headers).json(),
+                retries=retries,
+            )
+            return index_id, response, error
+
+        pending = list(todo)
+        for attempt in range(conflict_retries + 1):
+            conflicted = []
+            for index_id, response, error in iter_concurrently(patch, pending, max_workers=max_workers, ordered=False):
+                if error is None:
+                    summary["patched"][index_id] = response
+                    self._patched(index_id, response)
+                elif isinstance(error, APIError) and error.code in WRITE_CONFLICT_CODES and attempt < conflict_retries:
+                    conflicted.append(index_id)
+                else:
+                    summary["failed"][index_id] = describe_error(error)
+            if not conflicted:
+                break
+
+            logger.info(f"{len(conflicted)} indices had a stale status, re-reading them and retrying")
+            summary["conflicts"] += len(conflicted)
+            reread, failed = self._statuses_of(conflicted, max_workers=max_workers)
+            statuses.update(reread)
+            summary["failed"].update(failed)
+            summary["missing"].extend(i for i in conflicted if i not in reread and i not in failed)
+            pending = [i for i in conflicted if i in reread]
+
+        if summary["failed"]:
+            logger.error(f"Failed to patch {len(summary['failed'])} indices: {summary['failed']}")
+        return summary
+
     def get_indices_in_namespace(self, namespace: str) -> list[Index]:
         """
         Get all indices in a given namespace
         """
-        return [
-            Index.parse_obj(x)
-            for x in self.session.get_collection(f"/index?namespace={namespace}", raise_perm_errors=True)
-        ]
+        return self.get_lazy_indices_in_namespace(namespace).validate_all(parallel=False)
+
+    def get_lazy_indices_in_namespace(self, namespace: str, strict: bool = False) -> LazyIndexList:
+        """
+        Get all indices in a given namespace, as get_indices_in_namespace, but each manifest is only validated into an
+        Index when it is first accessed; strict=True validates them all now.
+        See LazyIndexList (.raw holds the manifests, validate_all(parallel=True) validates the rest on a process pool).
+        """
+        manifests = self.session.get_collection(f"/index?namespace={namespace}", raise_perm_errors=True)
+        return LazyIndexList(manifests, strict=strict)
+
+    def _fetch_for_catalog(self, options: dict[str, str]) -> ManifestList:
+        manifests = self.session.get_collection("/index", options=options)
+        self._remember_statuses(manifests)
+        return manifests
+
+    def index_catalog(
+        self,
+        fields: list[str] | None = None,
+        include_nonprod: bool = False,
+        ttl: float = DEFAULT_CACHE_TTL,
+    ) -> IndexCatalog:
+        """
+        An IndexCatalog of the permissioned indices: loaded with one request on first use, then looked up by id, name,
+        namespace or stage from memory, and refreshed incrementally once older than ttl. Keep it for as long as the
+        lookups should share it.
+        """
+        return IndexCatalog(
+            fetch=self._fetch_for_catalog,
+            fields=fields,
+            include_nonprod=include_nonprod,
+            ttl=ttl,
+        )
 
     def create_index(self, index_def: IndexDefinitionPost) -> ResponseJson:
         """
@@ -160,6 +393,8 @@ class _IndexAPIClient(_MerqubeApiClientBase):
         Moreover, future portfolios can be posted at any time, but wont be considered by the index until that day.
 
         (You can get the index id by doing get_index_manifest(index_name)["id"])
+
+        For long histories, see upload_target_portfolios, which uploads concurrently.
         """
 
         for itp in target_portfolio:
@@ -167,14 +402,68 @@ class _IndexAPIClient(_MerqubeApiClientBase):
             logger.info(f"Pushing target portfolio for {itp.timestamp}")
             self.session.put(f"/index/{index_id}/target_portfolio", json=pydantic_to_dict(itp))
 
+    def upload_target_portfolios(
+        self,
+        index_id: str,
+        target_portfolio: Iterable[EquityBasketPortfolio],
+        max_workers: int = 8,
+        retries: int = 3,
+    ) -> TargetPortfolioUploadSummary:
+        """
+        replace_target_portfolio for many timestamps (e.g. a daily rebalance history): the PUTs are sent with up to
+        max_workers in flight, and each is retried on transient errors (see secapi.bulk.send_with_retries). A 409 on a
+        retried PUT is reported as failed: nothing shows that the earlier attempt was applied.
+
+        Portfolios for different timestamps are independent, so their order does not matter. When several portfolios
+        share a timestamp, only the last one is sent, which keeps "last one wins" correct without ordering the PUTs.
+
+        The portfolios are not modified. Failures are reported in the summary rather than raised; call again with the
+        failed timestamps' portfolios to retry them.
+        """
+        by_timestamp: dict[str, Manifest] = {}
+        total = 0
+        for itp in target_portfolio:
+            body = pydantic_to_dict(itp)
+            body["timestamp"] = pd.Timestamp(itp.timestamp).isoformat()
+            # re-inserted, so a later duplicate also takes the later position
+            by_timestamp.pop(body["timestamp"], None)
+            by_timestamp[body["timestamp"]] = body
+            total += 1
+
+        def put(body: Manifest) -> tuple[str, Exception | None]:
+            _, _, error = send_with_retries(
+                lambda headers: self.session.put(f"/index/{index_id}/target_portfolio", json=body, headers=headers),
+                retries=retries,
+            )
+            return body["timestamp"], error
+
+        summary: TargetPortfolioUploadSummary = {"uploaded": [], "failed": {}, "superseded": total - len(by_timestamp)}
+        for timestamp, error in iter_concurrently(put, by_timestamp.values(), max_workers=max_workers, ordered=False):
+            if error is None:
+                summary["uploaded"].append(timestamp)
+            else:
+                summary["failed"][timestamp] = describe_error(error)
+        summary["uploaded"].sort()
+
+        logger.info(
+            f"Uploaded {len(summary['uploaded'])} target portfolios for {index_id}, {len(summary['failed'])} failed, "
+            f"{summary['superseded']} superseded by a later portfolio for the same timestamp"
+        )
+        if summary["failed"]:
+            logger.error(f"Failed target portfolio uploads: {summary['failed']}")
+        return summary
+
     @_name_or_id
     def get_index_manifest(self, index_name: str | None = None, index_id: str | None = None) -> Manifest:
         """
         Get the model for a given index
         """
         if index_name:
-            return cast(Manifest, self.session.get_collection_single(f"/index?name={index_name}"))
-        return cast(Manifest, self.session.get_json(f"/index/{index_id}"))
+            manifest = cast(Manifest, self.session.get_collection_single(f"/index?name={index_name}"))
+        else:
+            manifest = cast(Manifest, self.session.get_json(f"/index/{index_id}"))
+        self._remember_statuses([manifest])
+        return manifest
 
     @_name_or_id
     def get_index_model(self, index_name: str | None = None, index_id: str | None = None) -> Index:
@@ -272,6 +561,7 @@ class _IndexAPIClient(_MerqubeApiClientBase):
         index_id: str | None = None,
         updates: Manifest | None = None,
         auto_status: bool = True,
+        optimistic: bool = False,
     ) -> ResponseJson:
         """
         Patch an index - updates is a partial index manifest
@@ -279,14 +569,32 @@ class _IndexAPIClient(_MerqubeApiClientBase):
 
         auto_status:  status is required on all PUT/PATCH to prevent write conflicts, its a write token certifying that
         the object youre updating is the latest version. You probably always want this to be set
+
+        optimistic: with auto_status, rather than reading the index first, send the status from a recent read (by this
+        client: get_index_manifest, get_index_defs, an index_catalog etc.), and only read it and retry if the server
+        rejects that status as stale. Without a recent status (or with index_name), the index is read first as usual.
         """
         if not updates:
             return EMPTY_RES
 
+        if auto_status and optimistic and index_id and (token := self._cached_status(index_id)) is not None:
+            updates["status"] = token["status"]
+            try:
+                res = self.session.patch(f"/index/{index_id}", json=updates).json()
+                self._patched(index_id, res)
+                return cast(ResponseJson, res)
+            except APIError as exc:
+                if exc.code not in WRITE_CONFLICT_CODES:
+                    raise
+                logger.info(f"The status of {index_id} was stale, reading it and retrying")
+
         if auto_status:
             updates["status"] = self.get_index_manifest(index_name=index_name, index_id=index_id)["status"]
 
-        return cast(ResponseJson, self.session.patch(f"/index/{index_id}", json=updates).json())
+        res = self.session.patch(f"/index/{index_id}", json=updates).json()
+        if index_id:
+            self._patched(index_id, res)
+        return cast(ResponseJson, res)
 
 
 class _SecAPIClient(_MerqubeApiClientBase):
@@ -298,11 +606,27 @@ class _SecAPIClient(_MerqubeApiClientBase):
         self,
         user_session: Optional[MerqubeAPISession] = None,
         token: Optional[str] = None,
+        metrics_cache: SecAPIMetricsCache | None = None,
+        security_resolver_path: str | None = None,
         **session_kwargs: Any,
     ):
+        """
+        metrics_cache: opt-in on disk cache; when set, get_security_metrics calls by sec_ids with a start_date only fetch
+        the date ranges that are not cached yet (see SecAPIMetricsCache)
+        security_resolver_path: json file to persist the name <-> id index used by resolve_security_ids/names
+        """
         super().__init__(user_session=user_session, token=token, **session_kwargs)
 
-        self.type_cache = TTLCache(1, ttl=DEFAULT_CACHE_TTL)  # type: ignore
+        # supported security types and metric definitions
+        self.metadata_cache = SecAPIMetadataCache()
+        self.metrics_cache = metrics_cache
+        # the most recent get_point_in_time_index results
+        self.point_in_time_cache: LRUCache[tuple[Any, ...], PointInTimeIndex] = LRUCache(maxsize=8)
+        # late bound, so that a patched get_security_definitions_mapping_table is used
+        self.security_resolver = SecurityResolver(
+            fetch=lambda **kwargs: self.get_security_definitions_mapping_table(**kwargs),
+            path=security_resolver_path,
+        )
 
     def get_supported_secapi_types(self) -> list[dict[str, str]]:
         """
@@ -310,11 +634,18 @@ class _SecAPIClient(_MerqubeApiClientBase):
         """
         return self.session.get_collection(url="/security")
 
-    @cachedmethod(operator.attrgetter("type_cache"))
+    def _supported_secapi_type_names(self) -> list[str]:
+        """cached names of the supported security types"""
+        return self.metadata_cache.get("types", lambda: [x["name"] for x in self.get_supported_secapi_types()])
+
     def _validate_secapi_type(self, sec_type: str) -> None:
         """Validate asset_type"""
+        if sec_type in self._supported_secapi_type_names():
+            return
+        # the type may have been added since the list was cached
+        self.metadata_cache.invalidate("types")
         assert sec_type in (
-            supported_types := [x["name"] for x in self.get_supported_secapi_types()]
+            supported_types := self._supported_secapi_type_names()
         ), f"sec_type must be one of {supported_types}"
 
     def _validate_single(self, *, sec_type: str, sec_id: str | None = None, sec_name: str | None = None) -> None:
@@ -393,7 +724,54 @@ class _SecAPIClient(_MerqubeApiClientBase):
         """
         if sec_names and sec_ids are both []/None, it gets ALL securities.
         """
+        query_options = self._security_metrics_query_options(
+            metrics=metrics,
+            sec_names=sec_names,
+            sec_ids=sec_ids,
+            start_date=start_date,
+            end_date=end_date,
+            addl_options=addl_options,
+        )
+        return self._collection_helper(
+            url=f"/security/{sec_type}", query_options=query_options, raise_perm_errors=raise_perm_errors
+        )
+
+    def _get_security_metrics_csv(
+        self,
+        *,
+        sec_type: str,
+        metrics: str | Iterable[str],
+        sec_names: str | Iterable[str] | None = None,
+        sec_ids: str | Iterable[str] | None = None,
+        start_date: str | pd.Timestamp | None = None,
+        end_date: str | pd.Timestamp | None = None,
+        addl_options: AddlSecapiOptions | None = None,
+        raise_perm_errors: bool = False,
+    ) -> str:
+        """_get_security_metrics_helper with format=csv; returns the csv text"""
+        # a csv body has no error_codes to check
+        assert not raise_perm_errors, "raise_perm_errors is not supported with wire_format='csv'"
+        query_options = self._security_metrics_query_options(
+            metrics=metrics,
+            sec_names=sec_names,
+            sec_ids=sec_ids,
+            start_date=start_date,
+            end_date=end_date,
+            addl_options={**(addl_options or {}), "format": "csv"},
+        )
+        return self.session.get_data(f"/security/{sec_type}", options=_join_query_options(query_options))
 
+    @staticmethod
+    def _security_metrics_query_options(
+        *,
+        metrics: str | Iterable[str],
+        sec_names: str | Iterable[str] | None = None,
+        sec_ids: str | Iterable[str] | None = None,
+        start_date: str | pd.Timestamp | None = None,
+        end_date: str | pd.Timestamp | None = None,
+        addl_options: AddlSecapiOptions | None = None,
+    ) -> dict[str, Any]:
+        """the query options of a /security/{sec_type} metrics pull"""
         metrics_list = [metrics] if isinstance(metrics, str) else list(metrics)
 
         # Join did not work correctly for KeyViews and Tuples are badly behaved, so we'll remap them to lists.
@@ -409,26 +787,58 @@ class _SecAPIClient(_MerqubeApiClientBase):
         }
         if addl_options:
             query_options.update(addl_options)
-
-        return self._collection_helper(
-            url=f"/security/{sec_type}", query_options=query_options, raise_perm_errors=raise_perm_errors
-        )
+        return query_options
 
     def get_metrics_for_security(
         self,
         sec_type: str,
         sec_id: str | None = None,
         sec_name: str | None = None,
+        use_cache: bool = True,
     ) -> list[SecapiMetricDefinition]:
         """
         Get the list of metrics that are currently available for a security
         Can query by id or name
+        use_cache: definitions are cached (and refreshed in the background) for DEFAULT_CACHE_TTL
         """
         self._validate_single(sec_type=sec_type, sec_id=sec_id, sec_name=sec_name)
 
-        return self.session.get_collection(
-            f"/security/{sec_type}/{sec_id}/metrics" if sec_id else f"/security/{sec_type}/metrics?name={sec_name}"
-        )
+        url = f"/security/{sec_type}/{sec_id}/metrics" if sec_id else f"/security/{sec_type}/metrics?name={sec_name}"
+        if not use_cache:
+            return self.session.get_collection(url)
+
+        # a copy, so callers cannot modify the cached list
+        return list(self.metadata_cache.get(("metrics", url), lambda: self.session.get_collection(url)))
+
+    def get_metrics_for_securities(
+        self,
+        sec_type: str,
+        sec_ids: str | Iterable[str] | None = None,
+        sec_names: str | Iterable[str] | None = None,
+        max_workers: int = 8,
+        use_cache: bool = True,
+    ) -> dict[str, tuple[SecapiMetricDefinition, ...]]:
+        """
+        get_metrics_for_security for many securities, with up to max_workers requests in flight.
+        Returns security (id or name, as given) -> its metric definitions.
+        Identical definitions (and identical lists of them) are shared between securities; do not modify them.
+        """
+        self._validate_multiple(sec_type=sec_type, sec_names=sec_names, sec_ids=sec_ids)
+        assert sec_ids or sec_names, "Must provide either sec_ids or sec_names"
+
+        kind = "sec_id" if sec_ids else "sec_name"
+        keys = cast(str | Iterable[str], sec_ids or sec_names)
+        securities = list(dict.fromkeys([keys] if isinstance(keys, str) else keys))
+
+        intern = MetricDefinitionInterner()
+
+        def fetch(sec: str) -> list[SecapiMetricDefinition]:
+            return self.get_metrics_for_security(sec_type=sec_type, use_cache=use_cache, **{kind: sec})
+
+        return {
+            sec: intern(definitions)
+            for sec, definitions in zip(securities, iter_concurrently(fetch, securities, max_workers=max_workers))
+        }
 
     def get_security_definitions_mapping_table(
         self,
@@ -458,26 +868,133 @@ class _SecAPIClient(_MerqubeApiClientBase):
 
         return {c["id"]: c["name"] for c in rec_data} if sec_ids else {c["name"]: c["id"] for c in rec_data}
 
-    def get_security_metrics(
+    def _security_metrics_chunk_params(
+        self,
+        *,
+        params: dict[str, Any],
+        metrics_chunk_size: int | None = None,
+        securities_chunk_size: int | None = None,
+    ) -> Iterator[dict[str, Any]]:
+        """
+        yields the _get_security_metrics_helper params for each request that a (possibly chunked) pull is split into
+        """
+        if metrics_chunk_size is not None:
+            for chunk in iter_batches(list(params["metrics"]), metrics_chunk_size):
+                yield {**params, "metrics": chunk}
+        elif securities_chunk_size is not None:
+            key = "sec_names" if params["sec_names"] else "sec_ids"
+            for chunk in iter_batches(list(params[key]), securities_chunk_size):
+                yield {**params, key: chunk}
+        else:
+            yield params
+
+    def _fetch_security_metrics_chunk(
+        self,
+        params: dict[str, Any],
+        normalize_level: int | None = None,
+        fill_metrics: Iterable[str] | None = None,
+        output: SecAPIOutput | Literal["records"] = "pandas",
+        wire_format: SecAPIWireFormat = "json",
+        csv_dtypes: Mapping[str, Any] | None = None,
+    ) -> Any:
+        """
+        fetches and normalizes a single chunk into a DataFrame (or a pyarrow Table, or leaves the records as they are)
+        fill_metrics: when we chunk by metrics, we may be missing some because the secapi doesnt return a metric if its None for all records
+        """
+        if wire_format == "csv":
+            df = csv_to_frame(self._get_security_metrics_csv(**params), dtypes=csv_dtypes)
+        else:
+            data = self._get_security_metrics_helper(**params)
+            if output == "records":
+                return data
+            if output == "arrow":
+                return records_to_table(data, fill_metrics=fill_metrics)
+
+            df = records_to_frame(data, normalize_level=normalize_level)
+
+        for m in fill_metrics or []:
+            if m not in df:
+                df[m] = None
+        return df
+
+    @overload
+    def iter_security_metrics(
         self,
         sec_type: str,
-        metrics: str | Iterable[str],  # Secapi doesnt support fetching all metrics yet; cant be None
+        metrics: str | Iterable[str],
+        sec_names: str | Iterable[str] | None = ...,
+        sec_ids: str | Iterable[str] | None = ...,
+        start_date: str | pd.Timestamp | None = ...,
+        end_date: str | pd.Timestamp | None = ...,
+        addl_options: AddlSecapiOptions | None = ...,
+        normalize_level: int | None = ...,
+        metrics_chunk_size: int | None = ...,
+        securities_chunk_size: int | None = ...,
+        raise_perm_errors: bool = ...,
+        max_workers: int = ...,
+        ordered: bool = ...,
+        output: Literal["pandas"] = ...,
+        wire_format: SecAPIWireFormat = ...,
+        csv_dtypes: Mapping[str, Any] | None = ...,
+    ) -> Iterator[pd.DataFrame]: ...
+
+    @overload
+    def iter_security_metrics(
+        self,
+        sec_type: str,
+        metrics: str | Iterable[str],
+        sec_names: str | Iterable[str] | None = ...,
+        sec_ids: str | Iterable[str] | None = ...,
+        start_date: str | pd.Timestamp | None = ...,
+        end_date: str | pd.Timestamp | None = ...,
+        addl_options: AddlSecapiOptions | None = ...,
+        normalize_level: int | None = ...,
+        metrics_chunk_size: int | None = ...,
+        securities_chunk_size: int | None = ...,
+        raise_perm_errors: bool = ...,
+        max_workers: int = ...,
+        ordered: bool = ...,
+        *,
+        output: SecAPIOutput | Literal["records"],
+        wire_format: SecAPIWireFormat = ...,
+        csv_dtypes: Mapping[str, Any] | None = ...,
+    ) -> Iterator[Any]: ...
+
+    def iter_security_metrics(
+        self,
+        sec_type: str,
+        metrics: str | Iterable[str],
         sec_names: str | Iterable[str] | None = None,
         sec_ids: str | Iterable[str] | None = None,
         start_date: str | pd.Timestamp | None = None,
         end_date: str | pd.Timestamp | None = None,
         addl_options: AddlSecapiOptions | None = None,
-        # if the secapi value is JSON, by default, pandas will flatten it into a dotted namespace
-        # set this to control max_level: https://pandas.pydata.org/docs/reference/api/pandas.json_normalize.html
-        # 0 means "dont normalize any JSONs
         normalize_level: int | None = None,
         metrics_chunk_size: int | None = None,
         securities_chunk_size: int | None = None,
         raise_perm_errors: bool = False,
-    ) -> pd.DataFrame:
-        """fetch security metrics from the SecAPI"""
+        max_workers: int = 1,
+        ordered: bool = True,
+        output: SecAPIOutput | Literal["records"] = "pandas",
+        wire_format: SecAPIWireFormat = "json",
+        csv_dtypes: Mapping[str, Any] | None = None,
+    ) -> Iterator[Any]:
+        """
+        Streaming version of get_security_metrics: yields one DataFrame per chunk as soon as that chunk is fetched,
+        so that the caller can process (e.g., persist) chunk N while chunk N+1 is being fetched.
+        Without a chunk size, a single DataFrame is yielded.
+
+        Unlike get_security_metrics, the chunks are not merged; when chunking by metrics, the same (eff_ts, id) will appear in several chunks.
 
-        # Input validation
+        max_workers: the number of chunks fetched concurrently. Memory is bounded by roughly max_workers + 1 chunks.
+        ordered: if True (default), chunks are yielded in request order, otherwise in completion order
+        output: "pandas" yields DataFrames, "arrow" yields pyarrow Tables (see get_security_metrics), "records" yields the
+        records as the secapi returned them
+        wire_format, csv_dtypes: see get_security_metrics
+        """
+        # validate eagerly, rather than on the first next()
+        if wire_format == "csv" and output != "pandas":
+            raise ValueError("wire_format='csv' is only supported for (long) pandas output")
         self._validate_multiple(
             sec_type=sec_type,
             sec_names=sec_names,
@@ -486,6 +1003,16 @@ class _SecAPIClient(_MerqubeApiClientBase):
         )
         assert metrics is not None, "Metrics cannot be None"
 
+        if metrics_chunk_size is not None or securities_chunk_size is not None:
+            self._validate_chunking_options(
+                addl_options=addl_options,
+                metrics=metrics,
+                sec_names=sec_names,
+                sec_ids=sec_ids,
+                metrics_chunk_size=metrics_chunk_size,
+                securities_chunk_size=securities_chunk_size,
+            )
+
         params = {
             "sec_type": sec_type,
             "metrics": metrics,
@@ -496,60 +1023,751 @@ class _SecAPIClient(_MerqubeApiClientBase):
             "addl_options": addl_options,
             "raise_perm_errors": raise_perm_errors,
         }
+        fill_metrics = list(metrics) if metrics_chunk_size is not None else None
+        if output == "arrow":
+            import_pyarrow()  # fail now rather than in the first chunk
+
+        return iter_concurrently(
+            partial(
+                self._fetch_security_metrics_chunk,
+                normalize_level=normalize_level,
+                fill_metrics=fill_metrics,
+                output=output,
+                wire_format=wire_format,
+                csv_dtypes=csv_dtypes,
+            ),
+            self._security_metrics_chunk_params(
+                params=params, metrics_chunk_size=metrics_chunk_size, securities_chunk_size=securities_chunk_size
+            ),
+            max_workers=max_workers,
+            ordered=ordered,
+        )
+
+    def resolve_security_ids(
+        self, sec_type: str, sec_names: str | Iterable[str], refresh: bool = False
+    ) -> MappingTable:
+        """
+        Returns name -> id, like get_security_definitions_mapping_table(sec_names=...), but through an index that is
+        kept for the lifetime of the client: only names that were never resolved are requested, in large batches.
+        Unknown (or unpermissioned) names are left out.
+        """
+        return self.security_resolver.ids_for_names(sec_type, sec_names, refresh=refresh)
+
+    def resolve_security_names(
+        self, sec_type: str, sec_ids: str | Iterable[str], refresh: bool = False
+    ) -> MappingTable:
+        """Returns id -> name; see resolve_security_ids"""
+        return self.security_resolver.names_for_ids(sec_type, sec_ids, refresh=refresh)
+
+    @overload
+    def get_security_metrics(
+        self,
+        sec_type: str,
+        metrics: str | Iterable[str],
+        sec_names: str | Iterable[str] | None = ...,
+        sec_ids: str | Iterable[str] | None = ...,
+        start_date: str | pd.Timestamp | None = ...,
+        end_date: str | pd.Timestamp | None = ...,
+        addl_options: AddlSecapiOptions | None = ...,
+        normalize_level: int | None = ...,
+        metrics_chunk_size: int | None = ...,
+        securities_chunk_size: int | None = ...,
+        raise_perm_errors: bool = ...,
+        output: Literal["pandas"] = ...,
+        use_cache: bool = ...,
+        layout: Literal["long"] = ...,
+        wire_format: SecAPIWireFormat = ...,
+        csv_dtypes: Mapping[str, Any] | None = ...,
+        compact: bool = ...,
+        float32: bool = ...,
+    ) -> pd.DataFrame: ...
+
+    @overload
+    def get_security_metrics(
+        self,
+        sec_type: str,
+        metrics: str | Iterable[str],
+        sec_names: str | Iterable[str] | None = ...,
+        sec_ids: str | Iterable[str] | None = ...,
+        start_date: str | pd.Timestamp | None = ...,
+        end_date: str | pd.Timestamp | None = ...,
+        addl_options: AddlSecapiOptions | None = ...,
+        normalize_level: int | None = ...,
+        metrics_chunk_size: int | None = ...,
+        securities_chunk_size: int | None = ...,
+        raise_perm_errors: bool = ...,
+        output: Literal["pandas"] = ...,
+        use_cache: bool = ...,
+        *,
+        layout: Literal["wide"],
+        wire_format: SecAPIWireFormat = ...,
+        csv_dtypes: Mapping[str, Any] | None = ...,
+        compact: bool = ...,
+        float32: bool = ...,
+    ) -> dict[str, pd.DataFrame]: ...
+
+    @overload
+    def get_security_metrics(
+        self,
+        sec_type: str,
+        metrics: str | Iterable[str],
+        sec_names: str | Iterable[str] | None = ...,
+        sec_ids: str | Iterable[str] | None = ...,
+        start_date: str | pd.Timestamp | None = ...,
+        end_date: str | pd.Timestamp | None = ...,
+        addl_options: AddlSecapiOptions | None = ...,
+        normalize_level: int | None = ...,
+        metrics_chunk_size: int | None = ...,
+        securities_chunk_size: int | None = ...,
+        raise_perm_errors: bool = ...,
+        *,
+        output: Literal["arrow"],
+        use_cache: bool = ...,
+        layout: Literal["long"] = ...,
+        wire_format: SecAPIWireFormat = ...,
+        csv_dtypes: Mapping[str, Any] | None = ...,
+        compact: bool = ...,
+        float32: bool = ...,
+    ) -> Any: ...
+
+    @overload
+    def get_security_metrics(
+        self,
+        sec_type: str,
+        metrics: str | Iterable[str],
+        sec_names: str | Iterable[str] | None = ...,
+        sec_ids: str | Iterable[str] | None = ...,
+        start_date: str | pd.Timestamp | None = ...,
+        end_date: str | pd.Timestamp | None = ...,
+        addl_options: AddlSecapiOptions | None = ...,
+        normalize_level: int | None = ...,
+        metrics_chunk_size: int | None = ...,
+        securities_chunk_size: int | None = ...,
+        raise_perm_errors: bool = ...,
+        output: SecAPIOutput = ...,
+        use_cache: bool = ...,
+        layout: SecAPILayout = ...,
+        wire_format: SecAPIWireFormat = ...,
+        csv_dtypes: Mapping[str, Any] | None = ...,
+        compact: bool = ...,
+        float32: bool = ...,
+    ) -> Any: ...
+
+    def get_security_metrics(
+        self,
+        sec_type: str,
+        metrics: str | Iterable[str],  # Secapi doesnt support fetching all metrics yet; cant be None
+        sec_names: str | Iterable[str] | None = None,
+        sec_ids: str | Iterable[str] | None = None,
+        start_date: str | pd.Timestamp | None = None,
+        end_date: str | pd.Timestamp | None = None,
+        addl_options: AddlSecapiOptions | None = None,
+        # if the secapi value is JSON, by default, pandas will flatten it into a dotted namespace
+        # set this to control max_level: https://pandas.pydata.org/docs/reference/api/pandas.json_normalize.html
+        # 0 means "dont normalize any JSONs
+        normalize_level: int | None = None,
+        metrics_chunk_size: int | None = None,
+        securities_chunk_size: int | None = None,
+        raise_perm_errors: bool = False,
+        output: SecAPIOutput = "pandas",
+        use_cache: bool = True,
+        layout: SecAPILayout = "long",
+        wire_format: SecAPIWireFormat = "json",
+        csv_dtypes: Mapping[str, Any] | None = None,
+        compact: bool = False,
+        float32: bool = False,
+    ) -> Any:
+        """
+        fetch security metrics from the SecAPI
+
+        output: "pandas" (default) returns a DataFrame.
+        "arrow" returns a pyarrow.Table built straight from the decoded records (requires the optional pyarrow dependency);
+        JSON metrics are kept as struct columns, so normalize_level does not apply.
+
+        use_cache: if the client has a metrics_cache, pulls by sec_ids with a start_date (and no addl_options) go through it;
+        set to False to bypass it for this call.
+
+        layout: "long" (default) returns one row per (eff_ts, id).
+        "wide" returns {metric: DataFrame} with a datetime64 eff_ts index and one column per security id, i.e.
+        df.pivot(index="eff_ts", columns="id", values=metric) for each metric, built straight from the records.
+        JSON metrics are not normalized, and the cache is not used.
+
+        wire_format: "csv" asks the secapi for csv and parses it with pandas' C parser, which avoids building a python
+        dict per record and is much faster (and lighter) on large pulls. Only for flat metrics (JSON metrics arrive as
+        strings) and long pandas output; the cache is not used.
+        csv_dtypes: {metric: dtype} to parse csv columns as, rather than inferring them; see secapi.frames.csv_dtypes to
+        build it from get_metrics_for_security
+
+        compact: return datetime64 eff_ts, categorical id/name and float64 metrics (float32 with float32=True), which is
+        a fraction of the memory of the default object columns on large pulls; see secapi.frames.compact_frame and
+        memory_report. Only for long pandas output.
+        """
+        if compact:
+            if output != "pandas" or layout != "long":
+                raise ValueError("compact is only supported for (long) pandas output")
+            df = self.get_security_metrics(
+                sec_type=sec_type,
+                metrics=metrics,
+                sec_names=sec_names,
+                sec_ids=sec_ids,
+                start_date=start_date,
+                end_date=end_date,
+                addl_options=addl_options,
+                normalize_level=normalize_level,
+                metrics_chunk_size=metrics_chunk_size,
+                securities_chunk_size=securities_chunk_size,
+                raise_perm_errors=raise_perm_errors,
+                use_cache=use_cache,
+                wire_format=wire_format,
+                csv_dtypes=csv_dtypes,
+            )
+            return compact_frame(df, float32=float32)
+
+        if layout == "wide":
+            if wire_format == "csv":
+                raise ValueError("wire_format='csv' is only supported for (long) pandas output")
+            assert output == "pandas", "layout='wide' is only supported for pandas output"
+            metrics_list = [metrics] if isinstance(metrics, str) else list(dict.fromkeys(metrics))
+            chunks = self.iter_security_metrics(
+                sec_type=sec_type,
+                metrics=metrics_list,
+                sec_names=sec_names,
+                sec_ids=sec_ids,
+                start_date=start_date,
+                end_date=end_date,
+                addl_options=addl_options,
+                metrics_chunk_size=metrics_chunk_size,
+                securities_chunk_size=securities_chunk_size,
+                raise_perm_errors=raise_perm_errors,
+                output="records",
+            )
+            return records_to_wide(chunks, metrics_list)
+
+        if (
+            use_cache
+            and self.metrics_cache is not None
+            and sec_ids
+            and not sec_names
+            and start_date is not None
+            and not addl_options
+            and output == "pandas"
+            and wire_format == "json"
+        ):
+            return self._get_security_metrics_cached(
+                cache=self.metrics_cache,
+                sec_type=sec_type,
+                metrics=metrics,
+                sec_ids=sec_ids,
+                start_date=start_date,
+                end_date=end_date,
+                normalize_level=normalize_level,
+                metrics_chunk_size=metrics_chunk_size,
+                securities_chunk_size=securities_chunk_size,
+                raise_perm_errors=raise_perm_errors,
+            )
+
+        dfs = list(
+            self.iter_security_metrics(
+                sec_type=sec_type,
+                metrics=metrics,
+                sec_names=sec_names,
+                sec_ids=sec_ids,
+                start_date=start_date,
+                end_date=end_date,
+                addl_options=addl_options,
+                normalize_level=normalize_level,
+                metrics_chunk_size=metrics_chunk_size,
+                securities_chunk_size=securities_chunk_size,
+                raise_perm_errors=raise_perm_errors,
+                output=output,
+                wire_format=wire_format,
+                csv_dtypes=csv_dtypes,
+            )
+        )
 
         if metrics_chunk_size is None and securities_chunk_size is None:
             # no chunking
-            data = self._get_security_metrics_helper(**params)  # type: ignore
-            return pd.json_normalize(data, max_level=normalize_level)
+            return dfs[0]
 
-        self._validate_chunking_options(
-            addl_options=addl_options,
+        if output == "arrow":
+            return merge_metric_tables(dfs) if metrics_chunk_size is not None else concat_security_tables(dfs)
+
+        if metrics_chunk_size is not None:
+            return merge_metric_chunks(dfs)
+        return concat_security_chunks(dfs)
+
+    def get_security_metrics_multi(
+        self,
+        requests: Iterable[SecAPIMetricsRequest],
+        max_workers: int = 4,
+        concat: bool = False,
+    ) -> dict[str, pd.DataFrame] | pd.DataFrame:
+        """
+        get_security_metrics for several security types at once (e.g. index, equity and fx metrics for one job):
+        the requests, one per sec_type, are run concurrently with up to max_workers in flight.
+
+        Returns {sec_type: DataFrame}, or with concat=True, one DataFrame with a sec_type column first.
+        The first request that fails raises.
+        """
+        requests = list(requests)
+        sec_types = [r["sec_type"] for r in requests]
+        if dupes := sorted({t for t in sec_types if sec_types.count(t) > 1}):
+            raise ValueError(f"More than one request for {dupes}; combine their securities into one request")
+        for req in requests:
+            # validate them all before sending any
+            self._validate_multiple(
+                sec_type=req["sec_type"],
+                metrics=req["metrics"],
+                sec_ids=req.get("sec_ids"),
+                sec_names=req.get("sec_names"),
+            )
+
+        def fetch(req: SecAPIMetricsRequest) -> pd.DataFrame:
+            return self.get_security_metrics(**req)
+
+        frames = dict(zip(sec_types, iter_concurrently(fetch, requests, max_workers=max_workers)))
+        if not concat:
+            return frames
+
+        non_empty = [df.assign(sec_type=sec_type) for sec_type, df in frames.items() if not df.empty]
+        if not non_empty:
+            return pd.DataFrame(columns=["sec_type"])
+        combined = pd.concat(non_empty, ignore_index=True)
+        return combined[["sec_type"] + [c for c in combined.columns if c != "sec_type"]]
+
+    def _get_security_metrics_cached(
+        self,
+        *,
+        cache: SecAPIMetricsCache,
+        sec_type: str,
+        metrics: str | Iterable[str],
+        sec_ids: str | Iterable[str],
+        start_date: str | pd.Timestamp,
+        end_date: str | pd.Timestamp | None = None,
+        normalize_level: int | None = None,
+        metrics_chunk_size: int | None = None,
+        securities_chunk_size: int | None = None,
+        raise_perm_errors: bool = False,
+    ) -> pd.DataFrame:
+        """
+        get_security_metrics through the on disk cache:
+        work out which ranges are missing per (id, metric), fetch them (grouping series that miss the same ranges into
+        one pull), store them, and build the result from the cache
+        """
+        self._validate_multiple(sec_type=sec_type, sec_ids=sec_ids, metrics=metrics)
+
+        metrics_list = [metrics] if isinstance(metrics, str) else list(dict.fromkeys(metrics))
+        ids = [sec_ids] if isinstance(sec_ids, str) else list(dict.fromkeys(sec_ids))
+        # the cache holds unlocalized utc timestamps
+        start = to_utc_naive_ts(start_date)
+        end = to_utc_naive_ts(end_date) if end_date is not None else freezable_utcnow_ts()
+
+        # nothing is evicted until the result is built, even if this pull is larger than the cache
+        with cache.evict_later():
+            missing: dict[tuple[DateRange, ...], list[tuple[str, str]]] = defaultdict(list)
+            for sec_id in ids:
+                for metric in metrics_list:
+                    if gaps := tuple(cache.missing_ranges(sec_type, sec_id, metric, start, end)):
+                        missing[gaps].append((sec_id, metric))
+
+            for gaps, pairs in missing.items():
+                g_ids = list(dict.fromkeys(i for i, _ in pairs))
+                g_metrics = list(dict.fromkeys(m for _, m in pairs))
+
+                for g_start, g_end in gaps:
+                    logger.debug(f"Fetching {len(g_ids)} securities x {len(g_metrics)} metrics for {g_start} - {g_end}")
+                    fetched = self.get_security_metrics(
+                        sec_type=sec_type,
+                        metrics=g_metrics,
+                        sec_ids=g_ids,
+                        start_date=g_start,
+                        end_date=g_end,
+                        # store JSON metrics as is; they are normalized when the result is built
+                        normalize_level=0,
+                        metrics_chunk_size=metrics_chunk_size if len(g_metrics) > 1 else None,
+                        securities_chunk_size=securities_chunk_size if len(g_ids) > 1 else None,
+                        raise_perm_errors=raise_perm_errors,
+                        use_cache=False,
+                    )
+                    by_id = dict(list(fetched.groupby("id"))) if not fetched.empty else {}
+
+                    # everything we asked for is now known for this range, including series with no data
+                    for sec_id in g_ids:
+                        sec_df = by_id.get(sec_id, pd.DataFrame(columns=["eff_ts"])).set_index("eff_ts")
+                        for metric in g_metrics + ["name"]:
+                            values = sec_df[metric].dropna() if metric in sec_df else pd.Series(dtype=object)
+                            cache.put(sec_type, sec_id, metric, g_start, g_end, values)
+
+            frames = []
+            for sec_id in ids:
+                cols = {m: ser for m in metrics_list if len(ser := cache.get(sec_type, sec_id, m, start, end))}
+                if not cols:
+                    continue
+                sec_df = pd.DataFrame(cols).infer_objects()
+                if len(names := cache.get(sec_type, sec_id, "name", start, end)):
+                    sec_df["name"] = names.iloc[-1]
+                sec_df.index.name = "eff_ts"
+                sec_df = sec_df.reset_index()
+                sec_df["id"] = sec_id
+                frames.append(sec_df)
+
+        if not frames:
+            return pd.DataFrame()
+
+        # same column order as the secapi records, and the same row order as chunked pulls
+        res = pd.concat(frames, ignore_index=True)
+        res = res[sorted(res.columns)].sort_values(["id", "eff_ts"], ignore_index=True)
+
+        if normalize_level != 0 and any(isinstance(v, dict) for col in res.select_dtypes("object") for v in res[col]):
+            return records_to_frame(res.to_dict(orient="records"), normalize_level=normalize_level)
+        return res
+
+    def security_metrics_to_parquet_dataset(
+        self,
+        path: str,
+        sec_type: str,
+        metrics: str | Iterable[str],
+        partition_by: list[str] | None = None,
+        **kwargs: Any,
+    ) -> int:
+        """
+        Streams a (typically chunked) get_security_metrics pull into a parquet dataset at path, writing each chunk as it
+        arrives, so memory is bounded by the chunk size rather than the size of the pull.
+        kwargs are passed to iter_security_metrics (sec_ids, start_date, securities_chunk_size, max_workers, ...).
+
+        Chunks are not merged: prefer securities_chunk_size, since with metrics_chunk_size the same (eff_ts, id) is
+        written once per chunk with that chunk's metrics.
+
+        Returns the number of rows written.
+        """
+        chunks = self.iter_security_metrics(sec_type=sec_type, metrics=metrics, output="arrow", **kwargs)
+        return to_parquet_dataset(chunks, path=path, partition_by=partition_by)
+
+    def extract_security_metrics(
+        self,
+        path: str,
+        sec_type: str,
+        metrics: str | Iterable[str],
+        sec_ids: str | Iterable[str] | None = None,
+        sec_names: str | Iterable[str] | None = None,
+        start_date: str | pd.Timestamp | None = None,
+        end_date: str | pd.Timestamp | None = None,
+        addl_options: AddlSecapiOptions | None = None,
+        securities_chunk_size: int = 500,
+        **run_kwargs: Any,
+    ) -> ExtractionSummary:
+        """
+        Runs (or resumes) a checkpointed extraction of a large pull into parquet parts under path; see
+        secapi.extract.SecAPIExtractionJob. Calling it again with the same arguments after a crash, or with failed
+        chunks, only fetches what is missing. run_kwargs (max_workers, retries, backoff, progress) go to
+        SecAPIExtractionJob.run; use SecAPIExtractionJob(...).read() to load the result.
+        """
+        job = SecAPIExtractionJob(
+            self,
+            path=path,
+            sec_type=sec_type,
             metrics=metrics,
-            sec_names=sec_names,
             sec_ids=sec_ids,
-            metrics_chunk_size=metrics_chunk_size,
+            sec_names=sec_names,
+            start_date=start_date,
+            end_date=end_date,
+            addl_options=addl_options,
             securities_chunk_size=securities_chunk_size,
         )
+        return job.run(**run_kwargs)
 
-        dfs: list[pd.DataFrame] = []
+    def _send_json(self, method: str, url: str, body: bytes, headers: dict[str, str]) -> Any:
+        """sends an already serialized json body; used by the bulk writers"""
+        return getattr(self.session, method)(url, data=body, headers=headers).json()
 
-        if metrics_chunk_size is not None:
-            for chunk in batch_post_payload(rows=list(metrics), batch_size=metrics_chunk_size):
-                params["metrics"] = chunk
-                data = self._get_security_metrics_helper(**params)  # type: ignore
-                df = pd.json_normalize(data, max_level=normalize_level)
+    def post_security_metrics(
+        self,
+        sec_type: str,
+        records: Any,
+        max_bytes: int = DEFAULT_BULK_MAX_BYTES,
+        max_rows: int = DEFAULT_BULK_MAX_ROWS,
+        max_workers: int = 4,
+        retries: int = 3,
+    ) -> BulkWriteSummary:
+        """
+        Uploads metric values, one SecurityMetrics record (id, metric, eff_ts, prov_ts, value, optional source) per row.
+        records may be a DataFrame or pyarrow Table with those columns, or any iterable (e.g. a generator) of dicts or
+        SecurityMetrics models; it is consumed lazily, so inputs larger than memory can be streamed.
+        Rows with a missing (None/NaN) value are skipped.
+
+        Records are sent in batches of at most max_bytes / max_rows, with up to max_workers batches in flight; see
+        secapi.bulk.send_batches for the retry behavior. Returns the per batch results; failed batches do not raise.
+        A record without a required field raises a ValueError when it is reached, after the batches before it were sent.
+        """
+        self._validate_secapi_type(sec_type=sec_type)
 
-                # when we chunk by metrics, we may be missing some becuase the secapi doesnt return it if its None for all records
-                for m in metrics:
-                    if m not in df:
-                        df[m] = None
-                dfs.append(df)
+        encoded = encode_records(iter_records(records), required=SECURITY_METRICS_KEYS, drop_missing="value")
+        return send_batches(
+            partial(self._send_json, "post", f"/security/{sec_type}/metrics"),
+            batch_encoded(encoded, max_bytes=max_bytes, max_rows=max_rows),
+            max_workers=max_workers,
+            retries=retries,
+            conflict_means_applied=True,
+        )
 
-        elif securities_chunk_size is not None:
-            if sec_names:
-                for chunk in batch_post_payload(rows=list(sec_names), batch_size=securities_chunk_size):
-                    params["sec_names"] = chunk
-                    data = self._get_security_metrics_helper(**params)  # type: ignore
-                    dfs.append(pd.json_normalize(data, max_level=normalize_level))
-            elif sec_ids:
-                for chunk in batch_post_payload(rows=list(sec_ids), batch_size=securities_chunk_size):
-                    params["sec_ids"] = chunk
-                    data = self._get_security_metrics_helper(**params)  # type: ignore
-                    dfs.append(pd.json_normalize(data, max_level=normalize_level))
-
-        # the groupbys below squashes
-        # eff1 id1 m1=NAN m2=x
-        # eff2 id1 m1=Y  m2=NAN
-        # into
-        # eff1 id1 m1=Y m2=x
-        # also:
-        # for chunked, we return a consistent sort order of id, eff_ts
-        return (
-            pd.concat(dfs)
-            .groupby(["eff_ts", "id"])
-            .last()
-            .reset_index()
-            .sort_values(["id", "eff_ts"])
-            .reset_index()
-            .drop("index", axis=1)
+    def delete_security_metrics(
+        self,
+        sec_type: str,
+        keys: Any,
+        max_bytes: int = DEFAULT_BULK_MAX_BYTES,
+        max_rows: int = DEFAULT_BULK_MAX_ROWS,
+        max_workers: int = 4,
+        retries: int = 3,
+    ) -> BulkWriteSummary:
+        """
+        Deletes metric values, one SecurityMetricsDeletion (id, metric, eff_ts, optional prov_ts/source) per row, e.g.
+        before re-uploading restated data.
+        keys may be a DataFrame or pyarrow Table with those columns, or an iterable of dicts or SecurityMetricsDeletion
+        models; duplicate rows of a DataFrame are dropped. Other columns (e.g. value) are ignored.
+
+        Batching, concurrency, retries and the returned summary are as in post_security_metrics.
+        """
+        self._validate_secapi_type(sec_type=sec_type)
+
+        if isinstance(keys, pd.DataFrame):
+            keys = keys[[c for c in keys.columns if c in SECURITY_METRICS_DELETION_KEYS]].drop_duplicates()
+
+        records = ({k: v for k, v in rec.items() if k in SECURITY_METRICS_DELETION_KEYS} for rec in iter_records(keys))
+        encoded = encode_records(records, required=["id", "metric", "eff_ts"])
+        return send_batches(
+            partial(self._send_json, "delete", f"/security/{sec_type}/metrics"),
+            batch_encoded(encoded, max_bytes=max_bytes, max_rows=max_rows),
+            max_workers=max_workers,
+            retries=retries,
+        )
+
+    def create_securities(
+        self,
+        sec_type: str,
+        securities: Iterable[NewSecurity | dict[str, Any]],
+        max_workers: int = 8,
+        retries: int = 3,
+    ) -> SecurityCreationSummary:
+        """
+        Creates many securities of sec_type, e.g. to onboard a custom universe.
+
+        All securities are validated against NewSecurity before anything is created (a ValueError lists every invalid
+        one). Names that appear more than once are created once (and reported as duplicates), and names that already
+        exist are looked up in batches through the security resolver and skipped, so a partially failed onboarding can
+        simply be rerun. The rest are POSTed with up to max_workers in flight, each retried as in
+        secapi.bulk.send_with_retries; failures are reported rather than raised.
+        """
+        self._validate_secapi_type(sec_type=sec_type)
+
+        models: list[NewSecurity] = []
+        errors: list[str] = []
+        for i, sec in enumerate(securities):
+            try:
+                models.append(sec if isinstance(sec, NewSecurity) else NewSecurity.model_validate(sec))
+            except ValidationError as exc:
+                errors.append(f"security {i}: {exc}")
+        if errors:
+            raise ValueError(f"{len(errors)} invalid securities:\n" + "\n".join(errors))
+
+        by_name: dict[str, NewSecurity] = {}
+        duplicates: list[str] = []
+        for model in models:
+            if model.name in by_name:
+                duplicates.append(model.name)
+            else:
+                by_name[model.name] = model
+
+        existing = self.security_resolver.ids_for_names(sec_type, list(by_name), refresh=True)
+        url = f"/security/{sec_type}"
+
+        def create(model: NewSecurity) -> tuple[str, Any, Exception | None]:
+            body = pydantic_to_dict(model)
+            response, _, error = send_with_retries(
+                lambda headers: self.session.post(url, json=body, headers=headers).json(),
+                retries=retries,
+                conflict_means_applied=True,
+            )
+            return model.name, response, error
+
+        created: dict[str, SecurityCreationResponse] = {}
+        failed: dict[str, str] = {}
+        # names that exist now, but whose id we did not get back
+        lookup: dict[str, bool] = {}  # name -> created by us
+        for name, response, error in iter_concurrently(
+            create, [m for n, m in by_name.items() if n not in existing], max_workers=max_workers, ordered=False
+        ):
+            if error is None and response is None:
+                lookup[name] = True  # an earlier attempt was applied
+            elif error is None:
+                created[name] = SecurityCreationResponse.model_validate(response)
+            elif isinstance(error, APIError) and error.code == 409:
+                lookup[name] = False  # created by someone else in the meantime
+            else:
+                failed[name] = describe_error(error)
+
+        if lookup:
+            for name, sec_id in self.security_resolver.ids_for_names(sec_type, list(lookup), refresh=True).items():
+                if lookup[name]:
+                    created[name] = SecurityCreationResponse(id=sec_id)
+                else:
+                    existing[name] = sec_id
+
+        self.security_resolver.add(sec_type, {name: res.id for name, res in created.items() if res.id})
+        logger.debug(f"Created {len(created)} {sec_type} securities, {len(existing)} existed, {len(failed)} failed")
+
+        return {
+            "created": created,
+            "existing": existing,
+            "duplicates": duplicates,
+            "failed": failed,
+            "inserts": sum(res.inserts or 0 for res in created.values()),
+        }
+
+    def watch_security_metrics(
+        self,
+        sec_type: str,
+        metrics: str | Iterable[str],
+        start_date: str | pd.Timestamp,
+        sec_ids: str | Iterable[str] | None = None,
+        sec_names: str | Iterable[str] | None = None,
+        poll_interval: float = 60,
+        max_poll_interval: float | None = None,
+        backoff: float = 2,
+        max_polls: int | None = None,
+        lookback: str | pd.Timedelta = pd.Timedelta(days=7),
+        sleep: Callable[[float], None] = time.sleep,
+        **kwargs: Any,
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Polls for new metric values and yields them as they are published, as get_security_metrics style frames that
+        only hold the rows with a new (or changed) value for at least one metric. The first frame holds everything
+        from start_date on.
+
+        A high-water mark (the latest eff_ts seen) is kept per (security, metric), and every poll only requests data from
+        lookback before the marks on (securities/metrics whose marks are equal are requested together), so a poll costs
+        about one request for the latest points rather than the whole window. Securities without data are marked at the
+        time of the last successful poll. See secapi.watch.HighWaterMarks.
+
+        lookback: how far back from the marks points are polled again, so that late publications and restatements within
+        it are yielded; restatements of older points are not
+
+        poll_interval: seconds between polls while new data keeps arriving. After a poll without new data the interval
+        grows by backoff, up to max_poll_interval (default 10 x poll_interval), and it resets when data arrives.
+        max_polls: stop after this many polls (by default, poll forever)
+        sleep: injectable for tests
+        kwargs: passed to get_security_metrics (addl_options, raise_perm_errors, chunk sizes, ...)
+        """
+        self._validate_multiple(sec_type=sec_type, sec_names=sec_names, sec_ids=sec_ids, metrics=metrics)
+        assert sec_ids or sec_names, "Must provide either sec_ids or sec_names"
+
+        metrics_list = [metrics] if isinstance(metrics, str) else list(dict.fromkeys(metrics))
+        key, secs = ("id", sec_ids) if sec_ids else ("name", sec_names)
+        securities = [secs] if isinstance(secs, str) else list(dict.fromkeys(cast(Iterable[str], secs)))
+        max_interval = max_poll_interval if max_poll_interval is not None else 10 * poll_interval
+
+        def poll() -> Iterator[pd.DataFrame]:
+            marks = HighWaterMarks(to_utc_naive_ts(start_date), lookback=pd.Timedelta(lookback))
+            interval = poll_interval
+            polls = 0
+            while True:
+                polled_at = freezable_utcnow_ts()
+                frames = []
+                for since, series in marks.poll_groups(securities, metrics_list).items():
+                    g_secs = list(dict.fromkeys(s for s, _ in series))
+                    g_metrics = list(dict.fromkeys(m for _, m in series))
+                    g_kwargs: dict[str, Any] = {"sec_ids" if key == "id" else "sec_names": g_secs, **kwargs}
+                    df = self.get_security_metrics(
+                        sec_type=sec_type, metrics=g_metrics, start_date=since, use_cache=False, **g_kwargs
+                    )
+                    frames.append(marks.new_rows(df, key=key, metrics=g_metrics))
+                marks.advance(securities, metrics_list, polled_at)
+
+                polls += 1
+                if not (new := merge_new_rows(frames)).empty:
+                    interval = poll_interval
+                    yield new
+                else:
+                    interval = min(interval * backoff, max_interval)
+
+                if max_polls is not None and polls >= max_polls:
+                    return
+                logger.debug(f"Polling {sec_type} metrics again in {interval}s")
+                sleep(interval)
+
+        return poll()
+
+    def security_metrics_loader(self, window: float = 0.005, max_securities: int = 1000) -> SecAPIMetricsLoader:
+        """
+        Returns a dataloader that merges compatible get_security_metrics calls made within window seconds of each other
+        into one request (see SecAPIMetricsLoader); share it between the callers whose reads should be merged.
+        """
+        return SecAPIMetricsLoader(self, window=window, max_securities=max_securities)
+
+    def get_point_in_time_index(
+        self,
+        sec_type: str,
+        metrics: str | Iterable[str],
+        sec_ids: str | Iterable[str] | None = None,
+        sec_names: str | Iterable[str] | None = None,
+        start_date: str | pd.Timestamp | None = None,
+        end_date: str | pd.Timestamp | None = None,
+        securities_chunk_size: int | None = None,
+        max_workers: int = 1,
+        raise_perm_errors: bool = False,
+        use_cache: bool = True,
+    ) -> PointInTimeIndex:
+        """
+        Pulls every version (raw=true) of the given metrics once, and indexes them by prov_ts (see PointInTimeIndex).
+        The last few indexes are kept on the client, so repeated as-of queries over the same universe do not pull again;
+        use_cache=False forces a new pull.
+        securities_chunk_size / max_workers: split the raw pull into concurrent requests by securities
+        """
+        self._validate_multiple(sec_type=sec_type, sec_names=sec_names, sec_ids=sec_ids, metrics=metrics)
+
+        metrics_list = [metrics] if isinstance(metrics, str) else list(dict.fromkeys(metrics))
+        kind, secs = ("sec_names", sec_names) if sec_names else ("sec_ids", sec_ids)
+        securities = ([secs] if isinstance(secs, str) else list(dict.fromkeys(secs))) if secs else []
+        start = pd.Timestamp(start_date) if start_date is not None else None
+        end = pd.Timestamp(end_date) if end_date is not None else None
+
+        key = (sec_type, kind, tuple(securities), tuple(metrics_list), start, end)
+        if use_cache and (index := self.point_in_time_cache.get(key)) is not None:
+            return index
+
+        def fetch(chunk: list[str]) -> SecAPIRecordsResponse:
+            return self._get_security_metrics_helper(
+                sec_type=sec_type,
+                metrics=metrics_list,
+                start_date=start,
+                end_date=end,
+                addl_options={"raw": "true"},
+                raise_perm_errors=raise_perm_errors,
+                **{kind: chunk},
+            )
+
+        chunks = (
+            iter_batches(securities, securities_chunk_size) if securities and securities_chunk_size else [securities]
         )
+        records = [rec for data in iter_concurrently(fetch, chunks, max_workers=max_workers) for rec in data]
+
+        index = PointInTimeIndex(records)
+        self.point_in_time_cache[key] = index
+        return index
+
+    def get_security_metrics_as_of(
+        self,
+        sec_type: str,
+        metrics: str | Iterable[str],
+        as_of: str | pd.Timestamp | Iterable[str | pd.Timestamp],
+        **kwargs: Any,
+    ) -> pd.DataFrame:
+        """
+        The metrics as they were known at the provenance time as_of: for each (eff_ts, id), the latest version with
+        prov_ts <= as_of, in the shape of get_security_metrics.
+        With several as_of timestamps, the results are concatenated with an as_of column; they are all answered from one
+        raw pull (see get_point_in_time_index, which takes the other kwargs).
+        """
+        index = self.get_point_in_time_index(sec_type=sec_type, metrics=metrics, **kwargs)
+        if isinstance(as_of, (str, datetime.date)):
+            return index.as_of(as_of)
+        return index.as_of_many(as_of)
@@ -0,0 +1,156 @@
+"""
+In memory catalog of index manifests, indexed by id, name, namespace and stage
+"""
+
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Iterable
+
+from merqube_client_lib.constants import DEFAULT_CACHE_TTL
+from merqube_client_lib.logging import get_module_logger
+from merqube_client_lib.types import Manifest, ManifestList
+from merqube_client_lib.util import iter_batches
+
+logger = get_module_logger(__name__)
+
+# the fields the catalog itself needs, whatever projection was asked for
+CATALOG_FIELDS = ["id", "name", "namespace", "stage", "status"]
+# the projection used to find out what changed since the last load
+CHANGE_FIELDS = ["id", "name", "status"]
+
+# the type of a function that gets /index with the given query options
+IndexFetcher = Callable[[dict[str, str]], ManifestList]
+
+
+def _last_modified(manifest: Manifest) -> str | None:
+    status = manifest.get("status") or {}
+    return status.get("last_modified")
+
+
+class IndexCatalog:
+    """
+    The permissioned index manifests, loaded once and then looked up by id, name, namespace or stage with dictionary
+    hits instead of a /index request per lookup.
+
+    fields: only load these manifest fields (plus id, name, namespace, stage and status), which makes a large catalog
+    much cheaper to load and hold.
+    include_nonprod: also catalog test/development indices.
+
+    Once the catalog is older than ttl seconds, the next lookup refreshes it incrementally: the catalog is listed with
+    just id, name and status, and only the manifests that are new or whose status.last_modified changed are fetched
+    (in batches of batch_size names); deleted indices are dropped.
+    """
+
+    def __init__(
+        self,
+        fetch: IndexFetcher,
+        fields: Iterable[str] | None = None,
+        include_nonprod: bool = False,
+        ttl: float = DEFAULT_CACHE_TTL,
+        batch_size: int = 100,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._fetch = fetch
+        self.fields = sorted(set(fields) | set(CATALOG_FIELDS)) if fields else None
+        self.include_nonprod = include_nonprod
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self._clock = clock
+
+        self._lock = threading.RLock()
+        self._loaded_at: float | None = None
+        self._by_id: dict[str, Manifest] = {}
+        self._by_name: dict[str, Manifest] = {}
+        self._by_namespace: dict[str, list[Manifest]] = {}
+        self._by_stage: dict[str, list[Manifest]] = {}
+
+    def _list_options(self, fields: list[str] | None) -> dict[str, str]:
+        options = {} if self.include_nonprod else {"stage": "prod"}
+        if fields:
+            options["fields"] = ",".join(fields)
+        return options
+
+    def _fetch_names(self, names: list[str]) -> ManifestList:
+        manifests = []
+        for batch in iter_batches(names, self.batch_size):
+            options = {"names": ",".join(batch)}
+            if self.include_nonprod:
+                options["type"] = "all"
+            if self.fields:
+                options["fields"] = ",".join(self.fields)
+            manifests.extend(self._fetch(options))
+        return manifests
+
+    def _reindex(self) -> None:
+        """rebuilds the name, namespace and stage indexes from the manifests by id"""
+        by_namespace: dict[str, list[Manifest]] = defaultdict(list)
+        by_stage: dict[str, list[Manifest]] = defaultdict(list)
+        for manifest in self._by_id.values():
+            by_namespace[manifest["namespace"]].append(manifest)
+            by_stage[manifest["stage"]].append(manifest)
+
+        self._by_name = {m["name"]: m for m in self._by_id.values()}
+        self._by_namespace = dict(by_namespace)
+        self._by_stage = dict(by_stage)
+
+    def refresh(self, full: bool = False) -> None:
+        """
+        brings the catalog up to date now: incrementally, or with a full reload when full=True (or on the first load)
+        """
+        with self._lock:
+            if full or self._loaded_at is None:
+                manifests = self._fetch(self._list_options(self.fields))
+                self._by_id = {m["id"]: m for m in manifests}
+                logger.debug(f"Loaded {len(self._by_id)} indices into the catalog")
+            else:
+                listing = {m["id"]: m for m in self._fetch(self._list_options(CHANGE_FIELDS))}
+                changed = [
+                    m["name"]
+                    for index_id, m in listing.items()
+                    if index_id not in self._by_id or _last_modified(self._by_id[index_id]) != _last_modified(m)
+                ]
+                removed = self._by_id.keys() - listing.keys()
+
+                for index_id in removed:
+                    del self._by_id[index_id]
+                for manifest in self._fetch_names(changed) if changed else []:
+                    self._by_id[manifest["id"]] = manifest
+                logger.debug(f"Refreshed the catalog: {len(changed)} new or changed, {len(removed)} removed")
+
+            self._reindex()
+            self._loaded_at = self._clock()
+
+    def _fresh(self) -> None:
+        with self._lock:
+            if self._loaded_at is None or self._clock() - self._loaded_at >= self.ttl:
+                self.refresh()
+
+    def by_id(self, index_id: str) -> Manifest | None:
+        """the manifest of the index with this id, or None"""
+        self._fresh()
+        return self._by_id.get(index_id)
+
+    def by_name(self, index_name: str) -> Manifest | None:
+        """the manifest of the index with this name, or None"""
+        self._fresh()
+        return self._by_name.get(index_name)
+
+    def in_namespace(self, namespace: str) -> ManifestList:
+        """the manifests of the indices in namespace"""
+        self._fresh()
+        return list(self._by_namespace.get(namespace, []))
+
+    def in_stage(self, stage: str) -> ManifestList:
+        """the manifests of the indices in stage (prod, test, development)"""
+        self._fresh()
+        return list(self._by_stage.get(stage, []))
+
+    def ids(self, names: Iterable[str]) -> dict[str, str]:
+        """name -> id for the given names; unknown names are left out"""
+        self._fresh()
+        return {name: m["id"] for name in names if (m := self._by_name.get(name)) is not None}
+
+    def __len__(self) -> int:
+        self._fresh()
+        return len(self._by_id)
@@ -0,0 +1,89 @@
+"""
+Lazily validated collections of index manifests
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterator, Sequence, overload
+
+from merqube_client_lib.pydantic_v2_types import IndexDefinitionPatchPutGet as Index
+from merqube_client_lib.types import ManifestList
+from merqube_client_lib.util import iter_batches
+
+# manifests per task when validating in parallel
+VALIDATION_BATCH_SIZE = 200
+
+
+def _validate_batch(manifests: ManifestList) -> list[Index]:
+    return [Index.parse_obj(m) for m in manifests]
+
+
+class LazyIndexList(Sequence[Index]):
+    """
+    A list of Index models that holds the raw manifests and only validates a manifest when its model is first accessed
+    (by index or while iterating); each model is validated once.
+
+    Validation dominates listing a large namespace, so callers that only look at a few indices, or only need the raw
+    manifests (.raw), do not pay for the rest.
+    strict=True validates everything up front, so an invalid manifest raises here rather than where it is used.
+    """
+
+    def __init__(self, manifests: ManifestList, strict: bool = False):
+        self.raw = manifests
+        self._models: list[Index | None] = [None] * len(manifests)
+        if strict:
+            self.validate_all(parallel=False)
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def _model(self, i: int) -> Index:
+        model = self._models[i]
+        if model is None:
+            model = self._models[i] = Index.parse_obj(self.raw[i])
+        return model
+
+    @overload
+    def __getitem__(self, i: int) -> Index: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> list[Index]: ...
+
+    def __getitem__(self, i: int | slice) -> Index | list[Index]:
+        if isinstance(i, slice):
+            return [self._model(j) for j in range(len(self.raw))[i]]
+        return self._model(range(len(self.raw))[i])  # range handles negative and out of range indices
+
+    def __iter__(self) -> Iterator[Index]:
+        return (self._model(i) for i in range(len(self.raw)))
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (LazyIndexList, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"LazyIndexList({len(self)} manifests, {self.validated} validated)"
+
+    @property
+    def validated(self) -> int:
+        """the number of models validated so far"""
+        return sum(m is not None for m in self._models)
+
+    def validate_all(self, parallel: bool = True, max_workers: int | None = None) -> list[Index]:
+        """
+        validates every manifest not validated yet and returns all the models; the first invalid one raises
+        parallel: validate in batches on a process pool of max_workers (pydantic validation holds the GIL, so threads
+        would not help); worth it for thousands of manifests
+        """
+        todo = [i for i, m in enumerate(self._models) if m is None]
+        if parallel and len(todo) > VALIDATION_BATCH_SIZE:
+            batches = list(iter_batches(todo, VALIDATION_BATCH_SIZE))
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                results = pool.map(_validate_batch, [[self.raw[i] for i in batch] for batch in batches])
+                for batch, models in zip(batches, results):
+                    for i, model in zip(batch, models):
+                        self._models[i] = model
+        else:
+            for i in todo:
+                self._model(i)
+        return [self._model(i) for i in range(len(self.raw))]
@@ -0,0 +1,150 @@
+"""
+Arrow output for secapi metric pulls
+
+pyarrow is an optional dependency: pip install "merqube-client-lib[arrow]"
+"""
+
+import os
+from typing import TYPE_CHECKING, Any, Iterable
+
+import pandas as pd
+
+from merqube_client_lib.logging import get_module_logger
+from merqube_client_lib.secapi.frames import KEY_COLUMNS, merge_metric_chunks
+from merqube_client_lib.types.secapi import SecAPIRecordsResponse
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+logger = get_module_logger(__name__)
+
+
+def import_pyarrow() -> Any:
+    """imports pyarrow, with a helpful message if the optional dependency is not installed"""
+    try:
+        import pyarrow  # pylint: disable=import-outside-toplevel
+    except ImportError as exc:
+        raise ImportError(
+            'pyarrow is required for arrow/parquet output; install it with pip install "merqube-client-lib[arrow]"'
+        ) from exc
+    return pyarrow
+
+
+def _sort_table(table: "pa.Table") -> "pa.Table":
+    """for chunked pulls, we return a consistent sort order of id, eff_ts"""
+    return table.sort_by([("id", "ascending"), ("eff_ts", "ascending")])
+
+
+def records_to_table(data: SecAPIRecordsResponse, fill_metrics: Iterable[str] | None = None) -> "pa.Table":
+    """
+    Builds a pyarrow Table straight from secapi records, without an intermediate (object dtype) DataFrame.
+    JSON metrics become struct columns rather than being flattened.
+
+    fill_metrics: metrics to add as null columns if the secapi did not return them (it omits metrics that are None for all records)
+    """
+    pa = import_pyarrow()
+
+    # pa.Table.from_pylist infers the schema from the first record only, so build the columns ourselves
+    keys = dict.fromkeys(k for rec in data for k in rec)
+    columns = {k: pa.array([rec.get(k) for rec in data]) for k in keys}
+
+    for m in fill_metrics or []:
+        if m not in columns:
+            columns[m] = pa.nulls(len(data))
+
+    return pa.table(columns) if columns else pa.table({k: pa.array([], type=pa.string()) for k in KEY_COLUMNS})
+
+
+def _empty_table(tables: list["pa.Table"]) -> "pa.Table":
+    """an empty table with the keys and then every other column of tables, in the order they were first seen"""
+    pa = import_pyarrow()
+    types: dict[str, Any] = {k: pa.string() for k in KEY_COLUMNS}
+    for t in tables:
+        for field in t.schema:
+            if field.name not in KEY_COLUMNS:
+                types.setdefault(field.name, field.type)
+    return pa.table({name: pa.array([], type=typ) for name, typ in types.items()})
+
+
+def merge_metric_tables(tables: list["pa.Table"]) -> "pa.Table":
+    """
+    Arrow version of frames.merge_metric_chunks.
+    When every chunk has the same keys in the same order (the normal case for chunks of one query), the metric columns
+    are simply placed side by side without copying; otherwise, this falls back to the pandas merge.
+    """
+    pa = import_pyarrow()
+    import pyarrow.compute as pc  # pylint: disable=import-outside-toplevel
+
+    with_keys = [t for t in tables if set(KEY_COLUMNS).issubset(t.column_names)]
+    if not with_keys:
+        return _empty_table(tables)
+
+    ref = with_keys[0].select(KEY_COLUMNS)
+    if not all(t.num_rows == ref.num_rows and t.select(KEY_COLUMNS).equals(ref) for t in with_keys[1:]):
+        logger.debug("Chunk keys are not aligned, merging via pandas")
+        merged = merge_metric_chunks([t.to_pandas() for t in tables])
+        return pa.Table.from_pandas(merged, preserve_index=False)
+
+    columns: dict[str, Any] = {k: ref.column(k) for k in KEY_COLUMNS}
+    for t in tables:
+        for name in t.column_names:
+            if name in KEY_COLUMNS:
+                continue
+            col = t.column(name)
+            if t.num_rows != ref.num_rows:  # a chunk without records
+                col = pa.nulls(ref.num_rows)
+            if name not in columns or columns[name].null_count == len(columns[name]):
+                columns[name] = col
+            elif col.null_count < len(col):
+                # like groupby().last(), the last non null value wins
+                columns[name] = pc.coalesce(col, columns[name])
+
+    return _sort_table(pa.table(columns))
+
+
+def concat_security_tables(tables: list["pa.Table"]) -> "pa.Table":
+    """Arrow version of frames.concat_security_chunks"""
+    pa = import_pyarrow()
+
+    with_keys = [t for t in tables if set(KEY_COLUMNS).issubset(t.column_names)]
+    if not with_keys:
+        return _empty_table(tables)
+
+    return _sort_table(pa.concat_tables(with_keys, promote_options="default"))
+
+
+def to_parquet_dataset(
+    chunks: Iterable["pa.Table | pd.DataFrame"],
+    path: str,
+    partition_by: list[str] | None = None,
+    basename_prefix: str = "part",
+) -> int:
+    """
+    Sink that writes each chunk to a parquet dataset at path as soon as it arrives, so that only one chunk at a time is held in memory.
+    Each chunk is written to its own file(s), e.g., {path}/{partition dirs}/part-{chunk}-0.parquet.
+    Chunks may be pyarrow Tables or DataFrames.
+
+    Returns the number of rows written.
+    """
+    pa = import_pyarrow()
+    import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+
+    os.makedirs(path, exist_ok=True)
+    rows = 0
+
+    for i, chunk in enumerate(chunks):
+        table = chunk if isinstance(chunk, pa.Table) else pa.Table.from_pandas(chunk, preserve_index=False)
+        if table.num_rows == 0:
+            continue
+
+        pq.write_to_dataset(
+            table,
+            root_path=path,
+            partition_cols=partition_by,
+            basename_template=f"{basename_prefix}-{i}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        rows += table.num_rows
+        logger.debug(f"Wrote chunk {i} ({table.num_rows} rows) to {path}")
+
+    return rows
@@ -0,0 +1,78 @@
+"""
+Point-in-time (as-of prov_ts) lookups over raw secapi metric versions
+"""
+
+from typing import Any, Iterable
+
+import numpy as np
+import pandas as pd
+
+from merqube_client_lib.types.secapi import SecAPIRecordsResponse
+
+RAW_KEY_COLUMNS = ["id", "metric", "eff_ts"]
+
+
+class PointInTimeIndex:
+    """
+    Every version of every (id, metric, eff_ts) point, as returned by raw=true pulls, sorted by prov_ts, so that the
+    values as they were known at any provenance time can be looked up without pulling again.
+
+    Versions are kept in one array sorted by (point, prov_ts), with each (point, prov_ts rank) encoded as a single int64,
+    so an as-of lookup for all points at once is one np.searchsorted.
+    """
+
+    def __init__(self, records: SecAPIRecordsResponse):
+        df = pd.DataFrame(records, columns=RAW_KEY_COLUMNS + ["prov_ts", "value"])
+        prov_ts = pd.to_datetime(df["prov_ts"], format="ISO8601").to_numpy()
+
+        if df.empty:  # a MultiIndex cannot factorize to no levels
+            point_codes, self.points = np.empty(0, dtype="int64"), pd.MultiIndex.from_frame(df[RAW_KEY_COLUMNS])
+        else:
+            point_codes, points = pd.MultiIndex.from_frame(df[RAW_KEY_COLUMNS]).factorize()
+            self.points = points.set_names(RAW_KEY_COLUMNS)
+        # dense rank of prov_ts, so the composite key cannot overflow
+        self._prov_ts, prov_rank = np.unique(prov_ts, return_inverse=True)
+        self._stride = len(self._prov_ts) + 1
+
+        keys = point_codes.astype("int64") * self._stride + prov_rank
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._point_codes = point_codes[order]
+        self._values = df["value"].to_numpy(dtype=object)[order]
+
+    def __len__(self) -> int:
+        """the number of versions"""
+        return len(self._keys)
+
+    def as_of_long(self, as_of: str | pd.Timestamp) -> pd.DataFrame:
+        """the latest version of every point with prov_ts <= as_of, one row per (id, metric, eff_ts)"""
+        known = np.searchsorted(self._prov_ts, pd.Timestamp(as_of).to_datetime64(), side="right")
+        codes = np.arange(len(self.points), dtype="int64")
+        # the last version whose key is <= (point, rank of the last prov_ts known at as_of)
+        pos = np.searchsorted(self._keys, codes * self._stride + known - 1, side="right") - 1
+        found = (pos >= 0) & (self._point_codes[np.maximum(pos, 0)] == codes)
+
+        res = self.points[found].to_frame(index=False)
+        res["value"] = self._values[pos[found]]
+        return res
+
+    def as_of(self, as_of: str | pd.Timestamp) -> pd.DataFrame:
+        """
+        like get_security_metrics, as it would have returned at as_of: one row per (eff_ts, id), one column per metric,
+        sorted by id, eff_ts
+        """
+        long = self.as_of_long(as_of)
+        if long.empty:
+            return pd.DataFrame(columns=["eff_ts", "id"])
+
+        wide = long.pivot(index=["eff_ts", "id"], columns="metric", values="value")
+        wide.columns.name = None
+        return wide.reset_index().infer_objects().sort_values(["id", "eff_ts"], ignore_index=True)
+
+    def as_of_many(self, as_ofs: Iterable[str | pd.Timestamp]) -> pd.DataFrame:
+        """as_of for each timestamp, concatenated with an as_of column"""
+        frames: list[Any] = [self.as_of(ts).assign(as_of=pd.Timestamp(ts)) for ts in as_ofs]
+        if not frames:
+            return pd.DataFrame(columns=["as_of", "eff_ts", "id"])
+        res = pd.concat(frames, ignore_index=True)
+        return res[["as_of"] + [c for c in res.columns if c != "as_of"]]
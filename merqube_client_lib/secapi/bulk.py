@@ -0,0 +1,198 @@
+"""
+Bulk writes to the secapi: records are serialized once, grouped into batches bounded by bytes and rows, and sent
+concurrently with retries
+"""
+
+import datetime
+import json
+import time
+import uuid
+from typing import Any, Callable, Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import Timeout
+
+from merqube_client_lib.constants import MERQ_CLIENT_PREFIX, REQUEST_ID_HEADER
+from merqube_client_lib.exceptions import APIError
+from merqube_client_lib.logging import get_module_logger
+from merqube_client_lib.types.secapi import BulkBatchResult, BulkWriteSummary
+from merqube_client_lib.util import iter_batches, iter_concurrently, pydantic_to_dict
+
+logger = get_module_logger(__name__)
+
+# DataFrames and Arrow tables are converted to records this many rows at a time
+RECORD_SLICE_ROWS = 10_000
+
+# status codes on which a batch is retried
+RETRY_STATUS_CODES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+# the type of a function that sends one batch: (json body, headers) -> the response json
+BatchSender = Callable[[bytes, dict[str, str]], Any]
+
+
+def iter_records(data: Any) -> Iterator[dict[str, Any]]:
+    """
+    yields dict records from a DataFrame (one row per record), a pyarrow Table, or an iterable of dicts / pydantic models;
+    DataFrames and tables are converted a slice at a time, so a large input is never copied as a whole
+    """
+    if isinstance(data, pd.DataFrame):
+        for rows in iter_batches(data, RECORD_SLICE_ROWS):
+            yield from rows.to_dict("records")
+    elif hasattr(data, "to_batches") and hasattr(data, "schema"):  # pyarrow Table, without importing pyarrow
+        for batch in data.to_batches(max_chunksize=RECORD_SLICE_ROWS):
+            yield from batch.to_pylist()
+    else:
+        for rec in data:
+            yield rec if isinstance(rec, dict) else pydantic_to_dict(rec)
+
+
+def _json_default(obj: Any) -> Any:
+    """json.dumps hook for the non json types that come out of DataFrames and tables"""
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _is_missing(value: Any) -> bool:
+    return value is None or value is pd.NaT or (isinstance(value, float) and np.isnan(value))
+
+
+def encode_records(
+    records: Iterable[dict[str, Any]], required: Iterable[str], drop_missing: str | None = None
+) -> Iterator[bytes]:
+    """
+    serializes each record to json once; the same bytes are used to size the batches and as the request body
+    required: keys every record must have (a ValueError is raised otherwise)
+    drop_missing: records where this key is None/NaN are skipped (e.g. the gaps of a long DataFrame)
+    """
+    required = list(required)
+    dropped = 0
+    for i, rec in enumerate(records):
+        if drop_missing is not None and _is_missing(rec.get(drop_missing)):
+            dropped += 1
+            continue
+        if missing := [k for k in required if _is_missing(rec.get(k))]:
+            raise ValueError(f"record {i} is missing {missing}: {rec}")
+        yield json.dumps({k: v for k, v in rec.items() if not _is_missing(v)}, default=_json_default).encode()
+
+    if dropped:
+        logger.debug(f"Skipped {dropped} records without a {drop_missing}")
+
+
+def batch_encoded(encoded: Iterable[bytes], max_bytes: int, max_rows: int) -> Iterator[list[bytes]]:
+    """
+    groups serialized records into batches whose json array body is at most max_bytes and that have at most max_rows
+    records; a record that is larger than max_bytes on its own is sent as a batch of one
+    """
+    # [a,b,c]: a comma per record, plus the brackets, minus the last comma
+    return iter_batches(encoded, batch_size=max_rows, max_bytes=max_bytes, item_overhead=1, batch_overhead=1)
+
+
+def _retryable(exc: Exception) -> bool:
+    if isinstance(exc, APIError):
+        return exc.code in RETRY_STATUS_CODES
+    return isinstance(exc, (RequestsConnectionError, Timeout))
+
+
+def new_request_id() -> str:
+    """a request id in the format the session generates"""
+    return f"{MERQ_CLIENT_PREFIX}_{uuid.uuid4().hex}"
+
+
+def describe_error(exc: Exception) -> str:
+    """a short description of a failed request"""
+    return f"{exc.code}: {exc.response_json}" if isinstance(exc, APIError) else repr(exc)
+
+
+def send_with_retries(
+    send: Callable[[dict[str, str]], Any],
+    retries: int = 3,
+    backoff: float = 0.5,
+    sleep: Callable[[float], None] = time.sleep,
+    conflict_means_applied: bool = False,
+) -> tuple[Any, int, Exception | None]:
+    """
+    Calls send(headers) until it succeeds, fails with an error that is not retryable, or has been retried retries times.
+    headers hold a request id that is kept across the retries, so the server (and its logs) can tell a retry from a new
+    write. Retries back off exponentially.
+
+    conflict_means_applied: for secapi inserts, where a 409 on a retry can mean that an earlier attempt was applied but
+    its response was lost. It then counts as a success (with a None response), but only if an earlier attempt failed
+    without a response (a timeout or a connection error); after a clean rejection (e.g. a 503) nothing was applied, so
+    the 409 is an error. Otherwise a 409 is an error like any other.
+
+    Returns (response, attempts, the final error or None); errors are returned rather than raised.
+    """
+    headers = {"Content-Type": "application/json", REQUEST_ID_HEADER: new_request_id()}
+    attempts = 0
+    # whether an earlier attempt may have been applied without us getting the response
+    maybe_applied = False
+    while True:
+        attempts += 1
+        try:
+            return send(headers), attempts, None
+        except Exception as exc:  # pylint: disable=broad-except
+            if conflict_means_applied and maybe_applied and isinstance(exc, APIError) and exc.code == 409:
+                return None, attempts, None
+            maybe_applied |= isinstance(exc, (RequestsConnectionError, Timeout))
+            if attempts > retries or not _retryable(exc):
+                return None, attempts, exc
+            sleep(backoff * 2 ** (attempts - 1))
+
+
+def send_batches(
+    send: BatchSender,
+    batches: Iterable[list[bytes]],
+    max_workers: int = 4,
+    retries: int = 3,
+    backoff: float = 0.5,
+    sleep: Callable[[float], None] = time.sleep,
+    conflict_means_applied: bool = False,
+) -> BulkWriteSummary:
+    """
+    Sends each batch (as a json array) with up to max_workers in flight, and summarizes the outcome.
+    Each batch is retried as in send_with_retries (conflict_means_applied is passed on; only inserts should set it).
+    Failed batches are reported (and logged) rather than raised, so one bad batch does not abandon the rest.
+    """
+
+    def send_one(numbered: tuple[int, list[bytes]]) -> BulkBatchResult:
+        num, batch = numbered
+        body = b"[" + b",".join(batch) + b"]"
+
+        request_ids: list[str] = []
+
+        def attempt(headers: dict[str, str]) -> Any:
+            request_ids.append(headers[REQUEST_ID_HEADER])
+            return send(body, headers)
+
+        response, attempts, error = send_with_retries(
+            attempt, retries=retries, backoff=backoff, sleep=sleep, conflict_means_applied=conflict_means_applied
+        )
+        result: BulkBatchResult = {
+            "batch": num,
+            "rows": len(batch),
+            "bytes": len(body),
+            "request_id": request_ids[0],
+            "attempts": attempts,
+            "ok": error is None,
+        }
+        if error is None:
+            result["response"] = response
+        else:
+            result["error"] = describe_error(error)
+            logger.error(f"Batch {num} ({len(batch)} rows, request id {request_ids[0]}) failed: {result['error']}")
+        return result
+
+    results = sorted(
+        iter_concurrently(send_one, enumerate(batches), max_workers=max_workers, ordered=False),
+        key=lambda r: r["batch"],
+    )
+    ok_rows = sum(r["rows"] for r in results if r["ok"])
+    rows = sum(r["rows"] for r in results)
+    return {"rows": rows, "ok_rows": ok_rows, "failed_rows": rows - ok_rows, "batches": results}
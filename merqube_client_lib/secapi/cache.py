@@ -0,0 +1,273 @@
+"""
+Opt-in, on disk cache of secapi metric time series, so repeated pulls of the same history only fetch what is missing
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator
+from urllib.parse import quote
+
+import pandas as pd
+
+from merqube_client_lib.logging import get_module_logger
+from merqube_client_lib.util import freezable_utcnow_ts
+
+logger = get_module_logger(__name__)
+
+DateRange = tuple[pd.Timestamp, pd.Timestamp]
+
+
+def merge_ranges(ranges: Iterable[DateRange]) -> list[DateRange]:
+    """merges overlapping or touching (inclusive) ranges"""
+    merged: list[DateRange] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_ranges(start: pd.Timestamp, end: pd.Timestamp, covered: Iterable[DateRange]) -> list[DateRange]:
+    """
+    the parts of [start, end] that are not covered.
+    gaps are returned inclusive of the bordering covered timestamps; refetching a boundary point is harmless
+    """
+    gaps: list[DateRange] = []
+    cursor = start
+    for c_start, c_end in merge_ranges(covered):
+        if c_end < cursor:
+            continue
+        if c_start > end:
+            break
+        if c_start > cursor:
+            gaps.append((cursor, c_start))
+        cursor = c_end
+        if cursor >= end:
+            return gaps
+    gaps.append((cursor, end))
+    return gaps
+
+
+class SecAPIMetricsCache:
+    """
+    Stores fetched metric values and the date ranges that were fetched, per (sec_type, id, metric), as json files under
+    directory ({directory}/{sec_type}/{id}/{metric}.json).
+
+    On a later request, only the gaps between the requested range and the ranges already fetched need to be pulled.
+    The most recent settle_period of any fetch is never marked as fetched, so values published late (e.g. today's
+    close) are picked up by the next pull.
+
+    Eviction is size based: when the files exceed max_bytes, the least recently used series are deleted (but not while
+    a pull is being served from them; see evict_later).
+    Restated data is not detected; use invalidate().
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 1 << 30,
+        settle_period: pd.Timedelta = pd.Timedelta(days=1),
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.settle_period = settle_period
+
+        self._lock = threading.RLock()
+        # path -> (size, last access)
+        self._files: dict[str, tuple[int, float]] = {}
+        # the number of evict_later blocks in progress
+        self._holds = 0
+
+        os.makedirs(directory, exist_ok=True)
+        for root, _, files in os.walk(directory):
+            for f in files:
+                path = os.path.join(root, f)
+                stat = os.stat(path)
+                self._files[path] = (stat.st_size, stat.st_mtime)
+
+    def _path(self, sec_type: str, sec_id: str | None = None, metric: str | None = None) -> str:
+        parts = [self.directory, quote(sec_type, safe="")]
+        if sec_id is not None:
+            parts.append(quote(sec_id, safe=""))
+        if metric is not None:
+            parts.append(quote(metric, safe="") + ".json")
+        return os.path.join(*parts)
+
+    def _read(self, path: str) -> dict[str, Any]:
+        if path not in self._files:
+            return {"ranges": [], "values": []}
+        with open(path, encoding="utf-8") as f:
+            entry: dict[str, Any] = json.load(f)
+        self._files[path] = (self._files[path][0], time.time())
+        return entry
+
+    def _write(self, path: str, entry: dict[str, Any]) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+        self._files[path] = (os.path.getsize(path), time.time())
+
+    @staticmethod
+    def _ranges(entry: dict[str, Any]) -> list[DateRange]:
+        return [(pd.Timestamp(s), pd.Timestamp(e)) for s, e in entry["ranges"]]
+
+    @property
+    def size_bytes(self) -> int:
+        """total size of the cached files"""
+        return sum(size for size, _ in self._files.values())
+
+    def missing_ranges(
+        self, sec_type: str, sec_id: str, metric: str, start: pd.Timestamp, end: pd.Timestamp
+    ) -> list[DateRange]:
+        """the parts of [start, end] that have not been fetched yet for this series"""
+        with self._lock:
+            entry = self._read(self._path(sec_type, sec_id, metric))
+        return subtract_ranges(start, end, self._ranges(entry))
+
+    def get(self, sec_type: str, sec_id: str, metric: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.Series:
+        """cached values in [start, end], indexed by eff_ts (as returned by the secapi)"""
+        with self._lock:
+            values = self._read(self._path(sec_type, sec_id, metric))["values"]
+
+        if not values:
+            return pd.Series(dtype=object)
+        ser = pd.Series([v for _, v in values], index=[e for e, _ in values], dtype=object)
+        ts = pd.to_datetime(ser.index)
+        return ser[(ts >= start) & (ts <= end)]
+
+    def put(
+        self,
+        sec_type: str,
+        sec_id: str,
+        metric: str,
+        start: pd.Timestamp,
+        end: pd.Timestamp,
+        values: pd.Series,
+    ) -> None:
+        """
+        stores the result of fetching [start, end] for this series; values is indexed by eff_ts, and may be empty
+        (which records that there is no data in that range)
+        """
+        settled_end = min(end, freezable_utcnow_ts() - self.settle_period)
+
+        with self._lock:
+            path = self._path(sec_type, sec_id, metric)
+            entry = self._read(path)
+
+            merged = dict(entry["values"])
+            # tolist() converts numpy scalars to json serializable python ones
+            merged.update(zip(values.index, values.tolist()))
+
+            ranges = self._ranges(entry)
+            if settled_end >= start:
+                ranges.append((start, settled_end))
+
+            entry = {
+                "ranges": [[s.isoformat(), e.isoformat()] for s, e in merge_ranges(ranges)],
+                "values": sorted(merged.items(), key=lambda kv: pd.Timestamp(kv[0])),
+            }
+            self._write(path, entry)
+            self._evict()
+
+    @contextmanager
+    def evict_later(self) -> Iterator[None]:
+        """
+        defers eviction until the block exits, so that a pull larger than max_bytes does not evict the series it has
+        just written before its result is built from them
+        """
+        with self._lock:
+            self._holds += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._holds -= 1
+                self._evict()
+
+    def invalidate(
+        self,
+        sec_type: str,
+        sec_ids: Iterable[str] | None = None,
+        metrics: Iterable[str] | None = None,
+        start: str | pd.Timestamp | None = None,
+        end: str | pd.Timestamp | None = None,
+    ) -> None:
+        """
+        Forget cached data, e.g., after a restatement, so that the next pull refetches it.
+        Without sec_ids, all securities of sec_type are invalidated; without metrics, all of their metrics.
+        With start and/or end, only that part of each series is forgotten.
+        """
+        type_dir = self._path(sec_type)
+        id_dirs = {self._path(sec_type, i) for i in sec_ids} if sec_ids is not None else None
+        metric_files = {quote(m, safe="") + ".json" for m in metrics} if metrics is not None else None
+
+        with self._lock:
+            for path in list(self._files):
+                id_dir = os.path.dirname(path)
+                if (id_dirs is not None and id_dir not in id_dirs) or os.path.dirname(id_dir) != type_dir:
+                    continue
+                if metric_files is not None and os.path.basename(path) not in metric_files:
+                    continue
+
+                if start is None and end is None:
+                    self._remove(path)
+                else:
+                    self._forget_range(
+                        path,
+                        pd.Timestamp(start) if start is not None else pd.Timestamp.min,
+                        pd.Timestamp(end) if end is not None else pd.Timestamp.max,
+                    )
+
+    def clear(self) -> None:
+        """removes everything"""
+        with self._lock:
+            for sec_type in os.listdir(self.directory):
+                self._remove_tree(os.path.join(self.directory, sec_type))
+
+    def _forget_range(self, path: str, start: pd.Timestamp, end: pd.Timestamp) -> None:
+        entry = self._read(path)
+
+        ranges: list[DateRange] = []
+        for r_start, r_end in self._ranges(entry):
+            if r_end < start or r_start > end:
+                ranges.append((r_start, r_end))
+                continue
+            # ranges are inclusive, so stop just short of the forgotten part
+            if r_start < start:
+                ranges.append((r_start, start - pd.Timedelta(1, "ns")))
+            if r_end > end:
+                ranges.append((end + pd.Timedelta(1, "ns"), r_end))
+
+        entry["ranges"] = [[s.isoformat(), e.isoformat()] for s, e in ranges]
+        entry["values"] = [[k, v] for k, v in entry["values"] if not start <= pd.Timestamp(k) <= end]
+        self._write(path, entry)
+
+    def _remove(self, path: str) -> None:
+        if os.path.exists(path):
+            os.remove(path)
+        self._files.pop(path, None)
+
+    def _remove_tree(self, directory: str) -> None:
+        shutil.rmtree(directory, ignore_errors=True)
+        for path in [p for p in self._files if p.startswith(directory + os.sep)]:
+            self._files.pop(path)
+
+    def _evict(self) -> None:
+        """deletes least recently used series until the cache fits in max_bytes"""
+        total = self.size_bytes
+        if self._holds or total <= self.max_bytes:
+            return
+
+        for path, (size, _) in sorted(self._files.items(), key=lambda kv: kv[1][1]):
+            if total <= self.max_bytes:
+                break
+            logger.debug(f"Evicting {path} from the secapi cache")
+            self._remove(path)
+            total -= size
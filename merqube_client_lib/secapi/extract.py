@@ -0,0 +1,231 @@
+"""
+Checkpointed, resumable bulk extraction of secapi metrics into a directory of parquet parts
+
+pyarrow is an optional dependency: pip install "merqube-client-lib[arrow]"
+"""
+
+import json
+import os
+import time
+from typing import TYPE_CHECKING, Any, Callable, Iterable
+
+import pandas as pd
+
+from merqube_client_lib.logging import get_module_logger
+from merqube_client_lib.secapi.arrow import import_pyarrow
+from merqube_client_lib.secapi.bulk import describe_error, send_with_retries
+from merqube_client_lib.types.secapi import (
+    AddlSecapiOptions,
+    ExtractionChunk,
+    ExtractionProgress,
+    ExtractionSummary,
+)
+from merqube_client_lib.util import iter_batches, iter_concurrently
+
+if TYPE_CHECKING:
+    from merqube_client_lib.api_client.base import _SecAPIClient
+
+logger = get_module_logger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+
+
+def _write_atomically(path: str, write: Callable[[str], None]) -> None:
+    """write(tmp path), then renames it over path, so a crash never leaves a half written file behind"""
+    tmp = f"{path}.tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def log_progress(progress: ExtractionProgress) -> None:
+    """the default progress reporter"""
+    logger.info(
+        f"Extracted {progress['done']}/{progress['total']} chunks ({progress['failed']} failed), "
+        f"{progress['rows']} rows, {progress['rows_per_second']:.0f} rows/s, ETA {progress['eta_seconds']:.0f}s"
+    )
+
+
+class SecAPIExtractionJob:
+    """
+    A long get_security_metrics pull, split by securities into chunks that are each written to their own parquet file
+    under path as soon as they are fetched.
+
+    path/manifest.json holds the job parameters and the state of every chunk, and is rewritten after each chunk. Running
+    the job again (e.g. after a crash, or after some chunks failed) skips the finished chunks and only fetches the rest;
+    a directory can only be resumed with the same parameters.
+
+    Each chunk is retried with exponential backoff on retryable errors (see secapi.bulk.send_with_retries); a chunk that
+    still fails is marked failed in the manifest and the job carries on with the others.
+    """
+
+    def __init__(
+        self,
+        client: "_SecAPIClient",
+        path: str,
+        sec_type: str,
+        metrics: str | Iterable[str],
+        sec_ids: str | Iterable[str] | None = None,
+        sec_names: str | Iterable[str] | None = None,
+        start_date: str | pd.Timestamp | None = None,
+        end_date: str | pd.Timestamp | None = None,
+        addl_options: AddlSecapiOptions | None = None,
+        securities_chunk_size: int = 500,
+    ):
+        assert bool(sec_ids) != bool(sec_names), "Must provide either sec_ids or sec_names"
+        import_pyarrow()  # fail now rather than after the first chunk
+
+        self.client = client
+        self.path = path
+        self.kind = "sec_ids" if sec_ids else "sec_names"
+        given = sec_ids or sec_names or []
+        securities = [given] if isinstance(given, str) else list(dict.fromkeys(given))
+        self.params: dict[str, Any] = {
+            "sec_type": sec_type,
+            "metrics": [metrics] if isinstance(metrics, str) else list(dict.fromkeys(metrics)),
+            self.kind: securities,
+            "start_date": pd.Timestamp(start_date).isoformat() if start_date is not None else None,
+            "end_date": pd.Timestamp(end_date).isoformat() if end_date is not None else None,
+            "addl_options": addl_options,
+            "securities_chunk_size": securities_chunk_size,
+        }
+        client._validate_multiple(
+            sec_type=sec_type,
+            metrics=self.params["metrics"],
+            sec_ids=securities if sec_ids else None,
+            sec_names=None if sec_ids else securities,
+        )
+
+        self.chunks = self._load_or_plan()
+
+    @property
+    def manifest_path(self) -> str:
+        """the path of the manifest"""
+        return os.path.join(self.path, MANIFEST_FILE)
+
+    def _load_or_plan(self) -> list[ExtractionChunk]:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest["params"] != self.params:
+                raise ValueError(f"{self.path} holds a different extraction job: {manifest['params']}")
+            chunks: list[ExtractionChunk] = manifest["chunks"]
+            logger.info(f"Resuming extraction in {self.path}: {sum(c['status'] == 'done' for c in chunks)} chunks done")
+            return chunks
+
+        os.makedirs(self.path, exist_ok=True)
+        chunks = [
+            {"chunk": i, "securities": list(securities), "status": "pending", "attempts": 0}
+            for i, securities in enumerate(iter_batches(self.params[self.kind], self.params["securities_chunk_size"]))
+        ]
+        self._save(chunks)
+        return chunks
+
+    def _save(self, chunks: list[ExtractionChunk]) -> None:
+        def write(tmp: str) -> None:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"params": self.params, "chunks": chunks}, f)
+
+        _write_atomically(self.manifest_path, write)
+
+    def _fetch(self, chunk: ExtractionChunk) -> Any:
+        params: dict[str, Any] = {k: v for k, v in self.params.items() if k != "securities_chunk_size"}
+        params[self.kind] = chunk["securities"]
+        return self.client.get_security_metrics(**params, output="arrow")
+
+    def _run_chunk(
+        self, chunk: ExtractionChunk, retries: int, backoff: float, sleep: Callable[[float], None]
+    ) -> ExtractionChunk:
+        """fetches and writes one chunk; returns its new manifest entry"""
+        import_pyarrow()
+        import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+
+        table, attempts, error = send_with_retries(
+            lambda _headers: self._fetch(chunk), retries=retries, backoff=backoff, sleep=sleep
+        )
+        attempts += chunk["attempts"]
+        if error is not None:
+            return {**chunk, "status": "failed", "attempts": attempts, "error": describe_error(error)}
+
+        file = None
+        if table.num_rows:
+            file = f"part-{chunk['chunk']:05d}.parquet"
+            _write_atomically(os.path.join(self.path, file), lambda tmp: pq.write_table(table, tmp))
+        return {
+            "chunk": chunk["chunk"],
+            "securities": chunk["securities"],
+            "status": "done",
+            "attempts": attempts,
+            "rows": table.num_rows,
+            "file": file,
+        }
+
+    def run(
+        self,
+        max_workers: int = 1,
+        retries: int = 3,
+        backoff: float = 1.0,
+        progress: Callable[[ExtractionProgress], None] | None = log_progress,
+        sleep: Callable[[float], None] = time.sleep,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> ExtractionSummary:
+        """
+        Fetches every chunk that is not done yet, with up to max_workers in flight, checkpointing after each one.
+        progress is called after each chunk with the counts so far, the throughput of this run and an ETA.
+        Returns a summary; failed chunks do not raise, run the job again to retry them.
+        """
+        todo = [c for c in self.chunks if c["status"] != "done"]
+        started, run_rows, processed = clock(), 0, 0
+
+        results = iter_concurrently(
+            lambda c: self._run_chunk(c, retries=retries, backoff=backoff, sleep=sleep),
+            todo,
+            max_workers=max_workers,
+            ordered=False,
+        )
+        for result in results:
+            self.chunks[result["chunk"]] = result
+            self._save(self.chunks)
+            processed += 1
+
+            if result["status"] == "done":
+                run_rows += result["rows"]
+            else:
+                logger.error(f"Chunk {result['chunk']} failed after {result['attempts']} attempts: {result['error']}")
+
+            if progress is not None:
+                elapsed = max(clock() - started, 1e-9)
+                progress(
+                    {
+                        "done": sum(c["status"] == "done" for c in self.chunks),
+                        "failed": sum(c["status"] == "failed" for c in self.chunks),
+                        "total": len(self.chunks),
+                        "rows": sum(c.get("rows", 0) for c in self.chunks),
+                        "rows_per_second": run_rows / elapsed,
+                        "eta_seconds": elapsed / processed * (len(todo) - processed),
+                    }
+                )
+
+        return self.summary()
+
+    def summary(self) -> ExtractionSummary:
+        """the state of the job"""
+        return {
+            "path": self.path,
+            "total": len(self.chunks),
+            "done": sum(c["status"] == "done" for c in self.chunks),
+            "failed": sum(c["status"] == "failed" for c in self.chunks),
+            "rows": sum(c.get("rows", 0) for c in self.chunks),
+            "errors": {c["chunk"]: c["error"] for c in self.chunks if c["status"] == "failed"},
+        }
+
+    def read(self) -> pd.DataFrame:
+        """the rows extracted so far, as one DataFrame sorted by id, eff_ts"""
+        pa = import_pyarrow()
+        import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+
+        files = [f for c in self.chunks if c["status"] == "done" and (f := c.get("file"))]
+        if not files:
+            return pd.DataFrame()
+        tables = [pq.read_table(os.path.join(self.path, f)) for f in files]
+        df = pa.concat_tables(tables, promote_options="default").to_pandas()
+        return df.sort_values(["id", "eff_ts"], ignore_index=True)
@@ -0,0 +1,279 @@
+"""
+Helpers for building and combining the DataFrames returned by secapi metric pulls
+"""
+
+import io
+from typing import Any, Iterable, Mapping
+
+import numpy as np
+import pandas as pd
+
+from merqube_client_lib.types.secapi import (
+    SecapiMetricDefinition,
+    SecAPIRecordsResponse,
+)
+
+KEY_COLUMNS: list[str] = ["eff_ts", "id"]
+
+# the pandas dtype a csv column is parsed as, by metric data_type; datetimes are left as strings, as in json pulls
+CSV_DTYPES: dict[str, Any] = {
+    "string": object,
+    "datetime64": object,
+    "number64": "float64",
+    "float64": "float64",
+    "int64": "Int64",
+    "bool": "boolean",
+}
+
+
+def _is_flat(data: SecAPIRecordsResponse) -> bool:
+    """true if no value is itself a json object, ie there is nothing for json_normalize to flatten"""
+    return not any(isinstance(v, dict) for rec in data for v in rec.values())
+
+
+def _build_columns(data: SecAPIRecordsResponse) -> dict[str, list[Any]]:
+    """
+    transposes records into columns; keys missing from a record become NaN, exactly as they do when pandas builds
+    a frame from records
+    """
+    first_keys = data[0].keys()
+    if all(rec.keys() == first_keys for rec in data):
+        # the common case; every record has the same metrics
+        return {k: [rec[k] for rec in data] for k in first_keys}
+
+    keys = dict.fromkeys(k for rec in data for k in rec)
+    return {k: [rec.get(k, np.nan) for rec in data] for k in keys}
+
+
+def _apply_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """datetime64 eff_ts, categorical id and float64 numeric metrics"""
+    if "eff_ts" in df:
+        df["eff_ts"] = pd.to_datetime(df["eff_ts"])
+    if "id" in df:
+        df["id"] = df["id"].astype("category")
+    for col in df.columns:
+        if (
+            col not in KEY_COLUMNS
+            and pd.api.types.is_numeric_dtype(df[col])
+            and not pd.api.types.is_bool_dtype(df[col])
+        ):
+            df[col] = df[col].astype("float64", copy=False)
+    return df
+
+
+def records_to_frame(
+    data: SecAPIRecordsResponse, normalize_level: int | None = None, typed: bool = False
+) -> pd.DataFrame:
+    """
+    Builds a DataFrame from secapi records.
+
+    Most metrics are flat (strings and numbers), in which case the frame is built column by column, which is much
+    faster than pd.json_normalize walking every record; the result is the same frame json_normalize would produce.
+    json_normalize is only used when some metric is a JSON object that needs flattening (normalize_level != 0).
+
+    typed: also convert eff_ts to datetime64, id to a categorical and numeric metrics to float64
+    """
+    if not data:
+        return pd.DataFrame()
+
+    if normalize_level == 0 or _is_flat(data):
+        df = pd.DataFrame(_build_columns(data))
+    else:
+        df = pd.json_normalize(data, max_level=normalize_level)
+
+    return _apply_dtypes(df) if typed else df
+
+
+def compact_frame(df: pd.DataFrame, float32: bool = False) -> pd.DataFrame:
+    """
+    Converts a long metrics frame to a compact representation, in place: datetime64 eff_ts, categorical id and name,
+    and float64 numeric metrics (or float32 with float32=True, which halves them at the cost of precision beyond ~7
+    significant digits). On large pulls this is typically a fraction of the memory of the object columns.
+    """
+    df = _apply_dtypes(df)
+    if "name" in df:
+        df["name"] = df["name"].astype("category")
+    if float32:
+        for col in df.columns:
+            if col not in KEY_COLUMNS and df[col].dtype == "float64":
+                df[col] = df[col].astype("float32")
+    return df
+
+
+def memory_report(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The memory used by each column of df (including the contents of object columns), largest first, with a Total row:
+    dtype, bytes and share of the total
+    """
+    usage = df.memory_usage(deep=True).sort_values(ascending=False)
+    total = int(usage.sum())
+    report = pd.DataFrame(
+        {
+            "dtype": [str(df[c].dtype) if c in df.columns else str(df.index.dtype) for c in usage.index],
+            "bytes": usage.to_numpy(),
+            "share": usage.to_numpy() / total if total else 0.0,
+        },
+        index=usage.index,
+    )
+    report.loc["Total"] = ["", total, 1.0]
+    return report
+
+
+def csv_dtypes(definitions: Iterable[SecapiMetricDefinition]) -> dict[str, Any]:
+    """
+    the dtypes to parse csv pulls of these metrics with, from their definitions (see get_metrics_for_security)
+    raises a ValueError for JSON (object) metrics, which csv cannot carry
+    """
+    dtypes = {}
+    for d in definitions:
+        data_type = d.get("data_type", "string")
+        if data_type == "object":
+            raise ValueError(f"{d['name']} is a JSON metric; use the json wire format")
+        dtypes[d["name"]] = CSV_DTYPES.get(data_type, object)
+    return dtypes
+
+
+def csv_to_frame(text: str, dtypes: Mapping[str, Any] | None = None) -> pd.DataFrame:
+    """
+    Builds a DataFrame from a format=csv secapi response with pandas' C parser, without decoding a record at a time.
+    The keys (eff_ts, id, name) are kept as strings, as in json pulls; other columns are parsed as dtypes says, or
+    inferred. Only empty fields are missing values (so e.g. a name "NA" stays a string).
+    """
+    if not text:
+        return pd.DataFrame()
+    return pd.read_csv(
+        io.StringIO(text),
+        dtype={"eff_ts": object, "id": object, "name": object, **(dtypes or {})},
+        keep_default_na=False,
+        na_values=[""],
+        engine="c",
+    )
+
+
+def _sort_records(df: pd.DataFrame) -> pd.DataFrame:
+    """for chunked pulls, we return a consistent sort order of id, eff_ts"""
+    return df.sort_values(["id", "eff_ts"], ignore_index=True)
+
+
+def merge_metric_chunks(dfs: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Combines the frames of a pull chunked by metrics.
+
+    Every chunk covers the same securities but a different set of metrics, so rather than concatenating and
+    squashing with a groupby, each chunk is indexed by (eff_ts, id) and the metric columns are joined side by side:
+        eff1 id1 m1=NAN m2=x
+        eff1 id1 m1=Y  m2=NAN
+    becomes
+        eff1 id1 m1=Y m2=x
+    Columns returned by more than one chunk (e.g., name) keep the last non null value, like groupby().last() did, and
+    columns are in the order they were first seen in (including in chunks with no records), as concatenating did.
+    """
+    columns: dict[str, pd.Series] = {}
+    order = dict.fromkeys(c for df in dfs for c in df.columns if c not in KEY_COLUMNS)
+    # columns of chunks that returned no records at all (only the filled in metrics)
+    empty_columns: list[str] = []
+    ref_index: pd.Index | None = None
+
+    for df in dfs:
+        if not set(KEY_COLUMNS).issubset(df.columns):
+            empty_columns.extend(c for c in df.columns if c not in KEY_COLUMNS)
+            continue
+
+        # we own these frames, so index them in place rather than copying
+        df.set_index(KEY_COLUMNS, inplace=True)
+        if not df.index.is_unique:
+            df = df.groupby(level=KEY_COLUMNS).last()
+
+        # chunks of the same query almost always return the same keys in the same order; sharing one index object
+        # lets pandas skip all alignment (and the costly object comparisons) below
+        if ref_index is None:
+            ref_index = df.index
+        elif df.index.equals(ref_index):
+            df.index = ref_index
+
+        for col in df.columns:
+            ser = df[col]
+            if col not in columns or not columns[col].notna().any():
+                columns[col] = ser
+            elif ser.notna().any():
+                prev = columns[col]
+                columns[col] = ser.where(ser.notna(), prev) if ser.index is prev.index else ser.combine_first(prev)
+
+    if not columns:
+        return pd.DataFrame(columns=KEY_COLUMNS + list(order))
+
+    merged = pd.concat(columns, axis=1, copy=False)
+    merged.index.names = KEY_COLUMNS
+    for col in empty_columns:
+        if col not in merged:
+            merged[col] = None
+
+    return _sort_records(merged[list(order)].reset_index())
+
+
+def concat_security_chunks(dfs: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Combines the frames of a pull chunked by securities.
+
+    Chunks hold disjoint securities, so a plain concatenation is enough; the same security is only returned twice if the
+    caller passed it twice, in which case the last record wins.
+    """
+    non_empty = [df for df in dfs if set(KEY_COLUMNS).issubset(df.columns)]
+    if not non_empty:
+        return pd.DataFrame(columns=KEY_COLUMNS)
+
+    combined = pd.concat(non_empty, ignore_index=True, copy=False)
+    if (dupes := combined.duplicated(KEY_COLUMNS, keep="last")).any():
+        combined = combined[~dupes]
+
+    # keys first, as for metric chunks
+    return _sort_records(combined[KEY_COLUMNS + [c for c in combined.columns if c not in KEY_COLUMNS]])
+
+
+def _is_numeric(values: list[Any]) -> bool:
+    """true if every value is a number (or None); bools and numeric strings are not numbers here"""
+    return all(v is None or type(v) in (int, float) for v in values)
+
+
+def records_to_wide(chunks: Iterable[SecAPIRecordsResponse], metrics: list[str]) -> dict[str, pd.DataFrame]:
+    """
+    Builds one eff_ts x id frame per metric straight from the records of a (possibly chunked) pull, which is what
+    pivoting the long frame of each metric gives, without building the long frame.
+
+    All frames share the same (sorted, datetime64) eff_ts index and (sorted) id columns. Numeric metrics are float64
+    arrays with NaN for missing points; other metrics (strings, bools, JSON) are object arrays with None.
+    """
+    records = [rec for chunk in chunks for rec in chunk]
+    if not records:
+        return {
+            m: pd.DataFrame(index=pd.DatetimeIndex([], name="eff_ts"), columns=pd.Index([], name="id")) for m in metrics
+        }
+
+    ts_codes, ts_uniq = pd.factorize(np.array([rec["eff_ts"] for rec in records], dtype=object), sort=True)
+    id_codes, id_uniq = pd.factorize(np.array([rec["id"] for rec in records], dtype=object), sort=True)
+    index = pd.DatetimeIndex(pd.to_datetime(ts_uniq), name="eff_ts")
+    columns = pd.Index(id_uniq, name="id")
+
+    wide = {}
+    for metric in metrics:
+        # with metric chunks, a record only holds the metrics of its chunk
+        if all(metric in rec for rec in records):
+            rows, cols, values = ts_codes, id_codes, [rec[metric] for rec in records]
+        else:
+            has = np.fromiter((metric in rec for rec in records), dtype=bool, count=len(records))
+            rows, cols = ts_codes[has], id_codes[has]
+            values = [rec[metric] for rec in records if metric in rec]
+
+        if _is_numeric(values):
+            arr = np.full((len(index), len(columns)), np.nan)
+            arr[rows, cols] = np.asarray(values, dtype="float64")
+        else:
+            # element by element, so that list values stay single objects rather than becoming a dimension
+            objects = np.empty(len(values), dtype=object)
+            for i, v in enumerate(values):
+                objects[i] = v
+            arr = np.full((len(index), len(columns)), None, dtype=object)
+            arr[rows, cols] = objects
+
+        wide[metric] = pd.DataFrame(arr, index=index, columns=columns, copy=False)
+    return wide
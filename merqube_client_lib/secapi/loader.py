@@ -0,0 +1,128 @@
+"""
+Opt-in request coalescing for secapi metric reads: compatible get_security_metrics calls made within a short window
+are merged into one request, and each caller gets its own part of the result
+"""
+
+import json
+import threading
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Any, Iterable
+
+import pandas as pd
+
+from merqube_client_lib.logging import get_module_logger
+from merqube_client_lib.secapi.frames import KEY_COLUMNS
+
+if TYPE_CHECKING:
+    from merqube_client_lib.api_client.base import _SecAPIClient
+
+logger = get_module_logger(__name__)
+
+# (sec_type, "sec_ids"|"sec_names", metrics, start_date, end_date, json of the other get_security_metrics kwargs)
+_BatchKey = tuple[str, str, tuple[str, ...], str | None, str | None, str]
+
+
+class _Batch:
+    """the requests of one window that will be sent together"""
+
+    def __init__(self) -> None:
+        self.securities: dict[str, None] = {}
+        self.waiters: list[tuple[Future[pd.DataFrame], list[str]]] = []
+
+
+def _split(df: pd.DataFrame, column: str, securities: list[str]) -> pd.DataFrame:
+    """one caller's part of a merged result, as the secapi would have returned it to that caller alone"""
+    if df.empty or column not in df:
+        return pd.DataFrame()
+    part = df[df[column].isin(securities)].reset_index(drop=True)
+    if part.empty:
+        return pd.DataFrame()
+    # the secapi leaves out metrics that are None for every record of a request
+    return part[[c for c in part.columns if c in KEY_COLUMNS or c == "name" or part[c].notna().any()]]
+
+
+class SecAPIMetricsLoader:
+    """
+    Dataloader for get_security_metrics.
+
+    Calls to load() (from any number of threads) that ask for the same sec_type, metrics, dates and options within
+    window seconds of the first one are sent as a single request for the union of their securities, and the result is
+    split back to each caller. This turns many small reads, e.g. one per request handler, into one round trip.
+
+    Batches hold at most max_securities securities; beyond that a new batch is started.
+    Get one with client.security_metrics_loader().
+    """
+
+    def __init__(self, client: "_SecAPIClient", window: float = 0.005, max_securities: int = 1000):
+        self.client = client
+        self.window = window
+        self.max_securities = max_securities
+
+        self._lock = threading.Lock()
+        self._pending: dict[_BatchKey, _Batch] = {}
+
+    def submit(
+        self,
+        sec_type: str,
+        metrics: str | Iterable[str],
+        sec_names: str | Iterable[str] | None = None,
+        sec_ids: str | Iterable[str] | None = None,
+        start_date: str | pd.Timestamp | None = None,
+        end_date: str | pd.Timestamp | None = None,
+        **kwargs: Any,
+    ) -> "Future[pd.DataFrame]":
+        """like load, but returns a Future instead of waiting for the result"""
+        assert bool(sec_ids) != bool(sec_names), "Must provide either sec_ids or sec_names"
+        if "output" in kwargs or "layout" in kwargs:
+            raise ValueError("the loader only returns (long) DataFrames")
+
+        kind, secs = ("sec_ids", sec_ids) if sec_ids else ("sec_names", sec_names)
+        securities = [secs] if isinstance(secs, str) else list(dict.fromkeys(secs or []))
+        key: _BatchKey = (
+            sec_type,
+            kind,
+            (metrics,) if isinstance(metrics, str) else tuple(dict.fromkeys(metrics)),
+            pd.Timestamp(start_date).isoformat() if start_date is not None else None,
+            pd.Timestamp(end_date).isoformat() if end_date is not None else None,
+            json.dumps(kwargs, sort_keys=True, default=str),
+        )
+
+        fut: Future[pd.DataFrame] = Future()
+        with self._lock:
+            batch = self._pending.get(key)
+            if batch is None or len(batch.securities.keys() | securities) > self.max_securities:
+                batch = self._pending[key] = _Batch()
+                timer = threading.Timer(self.window, self._dispatch, args=(key, batch, kwargs))
+                timer.daemon = True
+                timer.start()
+            batch.securities.update(dict.fromkeys(securities))
+            batch.waiters.append((fut, securities))
+        return fut
+
+    def load(self, *args: Any, **kwargs: Any) -> pd.DataFrame:
+        """get_security_metrics(...) for sec_ids or sec_names, through the loader; takes the same arguments"""
+        return self.submit(*args, **kwargs).result()
+
+    def _dispatch(self, key: _BatchKey, batch: _Batch, kwargs: dict[str, Any]) -> None:
+        with self._lock:
+            if self._pending.get(key) is batch:
+                del self._pending[key]
+
+        sec_type, kind, metrics, start_date, end_date, _ = key
+        logger.debug(f"Loading {len(batch.securities)} {sec_type} securities for {len(batch.waiters)} callers")
+        try:
+            df = self.client.get_security_metrics(
+                sec_type=sec_type,
+                metrics=list(metrics),
+                start_date=start_date,
+                end_date=end_date,
+                **{kind: list(batch.securities), **kwargs},
+            )
+        except Exception as exc:  # pylint: disable=broad-except
+            for fut, _ in batch.waiters:
+                fut.set_exception(exc)
+            return
+
+        column = "id" if kind == "sec_ids" else "name"
+        for fut, securities in batch.waiters:
+            fut.set_result(_split(df, column, securities))
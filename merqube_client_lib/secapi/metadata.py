@@ -0,0 +1,117 @@
+"""
+In memory cache of secapi metadata (the supported security types, metric definitions) with refresh ahead of expiry
+"""
+
+import json
+import threading
+import time
+from typing import Any, Callable, Hashable, Iterable, TypeVar
+
+from cachetools import TTLCache
+
+from merqube_client_lib.constants import DEFAULT_CACHE_TTL
+from merqube_client_lib.logging import get_module_logger
+from merqube_client_lib.types.secapi import SecapiMetricDefinition
+
+logger = get_module_logger(__name__)
+
+V = TypeVar("V")
+
+
+class SecAPIMetadataCache:
+    """
+    Multi key TTL cache for metadata that rarely changes.
+
+    Entries older than refresh_after (a fraction of ttl) are still returned, but are reloaded in a background thread,
+    so a frequently used entry is reloaded before it expires and callers never wait for it.
+    Only entries that are missing, or were not refreshed within ttl (e.g. because the reload failed), are loaded on the
+    calling thread.
+    At most maxsize entries are kept (the least recently used are dropped first), and expired entries are dropped.
+    """
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_CACHE_TTL,
+        refresh_after: float = 0.8,
+        clock: Callable[[], float] = time.monotonic,
+        maxsize: int = 10_000,
+    ):
+        self.ttl = ttl
+        self.refresh_after = refresh_after
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        # key -> (value, loaded at)
+        self._entries: TTLCache[Hashable, tuple[Any, float]] = TTLCache(maxsize=maxsize, ttl=ttl, timer=clock)
+        self._refreshing: dict[Hashable, threading.Thread] = {}
+
+    def get(self, key: Hashable, load: Callable[[], V]) -> V:
+        """the cached value of key, loading it with load() if it is missing or expired"""
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is None:
+            return self._load(key, load)
+
+        if now - entry[1] >= self.ttl * self.refresh_after:
+            self._refresh_in_background(key, load)
+
+        value: V = entry[0]
+        return value
+
+    def _load(self, key: Hashable, load: Callable[[], V]) -> V:
+        value = load()
+        with self._lock:
+            self._entries[key] = (value, self._clock())
+        return value
+
+    def _refresh_in_background(self, key: Hashable, load: Callable[[], Any]) -> None:
+        def refresh() -> None:
+            try:
+                self._load(key, load)
+            except Exception as exc:  # pylint: disable=broad-except
+                # the stale value is kept until ttl, then the next get() loads (and raises) on the calling thread
+                logger.warning(f"Background refresh of {key} failed: {exc}")
+            finally:
+                with self._lock:
+                    self._refreshing.pop(key, None)
+
+        with self._lock:
+            if key in self._refreshing:
+                return
+            thread = self._refreshing[key] = threading.Thread(
+                target=refresh, name=f"secapi-metadata-{key}", daemon=True
+            )
+        thread.start()
+
+    def invalidate(self, key: Hashable | None = None) -> None:
+        """forgets key, or everything"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def wait(self, timeout: float | None = None) -> None:
+        """waits for background refreshes that are in flight"""
+        with self._lock:
+            threads = list(self._refreshing.values())
+        for thread in threads:
+            thread.join(timeout)
+
+
+class MetricDefinitionInterner:
+    """
+    De-duplicates metric schemas across securities: identical definitions become one shared SecapiMetricDefinition, and
+    securities with identical metric lists share one tuple, so a universe of similar securities costs little memory.
+    The shared objects must not be modified.
+    """
+
+    def __init__(self) -> None:
+        self._definitions: dict[str, SecapiMetricDefinition] = {}
+        self._schemas: dict[tuple[int, ...], tuple[SecapiMetricDefinition, ...]] = {}
+
+    def __call__(self, definitions: Iterable[SecapiMetricDefinition]) -> tuple[SecapiMetricDefinition, ...]:
+        shared = [self._definitions.setdefault(json.dumps(d, sort_keys=True, default=str), d) for d in definitions]
+        return self._schemas.setdefault(tuple(id(d) for d in shared), tuple(shared))
@@ -0,0 +1,160 @@
+"""
+In memory (optionally disk backed) name <-> id index of secapi securities
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Iterable, Protocol
+
+from merqube_client_lib.logging import get_module_logger
+from merqube_client_lib.types.secapi import MappingTable
+from merqube_client_lib.util import iter_batches, iter_concurrently
+
+logger = get_module_logger(__name__)
+
+
+class MappingTableFetcher(Protocol):
+    """the signature of _SecAPIClient.get_security_definitions_mapping_table"""
+
+    def __call__(
+        self, *, sec_type: str, sec_names: Iterable[str] | None = None, sec_ids: Iterable[str] | None = None
+    ) -> MappingTable: ...
+
+
+class SecurityResolver:
+    """
+    Bidirectional name <-> id index of securities per sec_type.
+
+    Only names/ids that are not in the index yet are requested, as comma joined batches of batch_size, so resolving
+    a large universe costs a handful of requests once, and dictionary lookups after that.
+    Names/ids that the secapi does not know (or that are not permissioned) are remembered for missing_ttl seconds so
+    they are not requested on every call.
+
+    With path, the index is also stored as json so it survives restarts.
+    """
+
+    def __init__(
+        self,
+        fetch: MappingTableFetcher,
+        path: str | None = None,
+        batch_size: int = 500,
+        max_workers: int = 4,
+        missing_ttl: float = 600,
+    ):
+        self._fetch = fetch
+        self.path = path
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.missing_ttl = missing_ttl
+
+        self._lock = threading.RLock()
+        # sec_type -> name -> id, and the reverse
+        self._ids: dict[str, dict[str, str]] = {}
+        self._names: dict[str, dict[str, str]] = {}
+        # (sec_type, "names"|"ids", key) -> when it was found to be missing
+        self._missing: dict[tuple[str, str, str], float] = {}
+
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for sec_type, name_to_id in json.load(f).items():
+                    self._add(sec_type, name_to_id)
+
+    def _add(self, sec_type: str, name_to_id: MappingTable) -> None:
+        with self._lock:
+            ids = self._ids.setdefault(sec_type, {})
+            names = self._names.setdefault(sec_type, {})
+            for name, sec_id in name_to_id.items():
+                if (old_id := ids.get(name)) is not None and old_id != sec_id:
+                    names.pop(old_id, None)
+                if (old_name := names.get(sec_id)) is not None and old_name != name:
+                    ids.pop(old_name, None)
+                ids[name] = sec_id
+                names[sec_id] = name
+                self._missing.pop((sec_type, "names", name), None)
+                self._missing.pop((sec_type, "ids", sec_id), None)
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._ids, f)
+            os.replace(tmp, self.path)
+
+    def _is_missing(self, sec_type: str, kind: str, key: str) -> bool:
+        return (
+            found := self._missing.get((sec_type, kind, key))
+        ) is not None and time.time() - found < self.missing_ttl
+
+    def _resolve(self, sec_type: str, kind: str, keys: str | Iterable[str], refresh: bool = False) -> MappingTable:
+        """kind is "names" (returns name -> id) or "ids" (returns id -> name)"""
+        keys = list(dict.fromkeys([keys] if isinstance(keys, str) else keys))
+        index = self._ids if kind == "names" else self._names
+
+        with self._lock:
+            known = index.get(sec_type, {})
+            unknown = [k for k in keys if refresh or (k not in known and not self._is_missing(sec_type, kind, k))]
+
+        if unknown:
+            logger.debug(f"Resolving {len(unknown)} {sec_type} {kind}")
+
+            def fetch_batch(batch: list[str]) -> MappingTable:
+                if kind == "names":
+                    return self._fetch(sec_type=sec_type, sec_names=batch)
+                # id -> name; flip it into the name -> id we index by
+                return {name: sec_id for sec_id, name in self._fetch(sec_type=sec_type, sec_ids=batch).items()}
+
+            found: set[str] = set()
+            for name_to_id in iter_concurrently(
+                fetch_batch, iter_batches(unknown, self.batch_size), max_workers=self.max_workers
+            ):
+                self._add(sec_type, name_to_id)
+                found.update(name_to_id if kind == "names" else name_to_id.values())
+
+            now = time.time()
+            with self._lock:
+                for k in unknown:
+                    if k not in found:
+                        self._missing[(sec_type, kind, k)] = now
+            self._save()
+
+        with self._lock:
+            known = index.get(sec_type, {})
+            return {k: known[k] for k in keys if k in known}
+
+    def ids_for_names(self, sec_type: str, sec_names: str | Iterable[str], refresh: bool = False) -> MappingTable:
+        """
+        name -> id for the given names; names that do not exist (or are not permissioned) are left out
+        refresh: re-request the names even if they are already known (e.g. after a rename)
+        """
+        return self._resolve(sec_type, "names", sec_names, refresh=refresh)
+
+    def names_for_ids(self, sec_type: str, sec_ids: str | Iterable[str], refresh: bool = False) -> MappingTable:
+        """id -> name for the given ids; ids that do not exist (or are not permissioned) are left out"""
+        return self._resolve(sec_type, "ids", sec_ids, refresh=refresh)
+
+    def add(self, sec_type: str, name_to_id: MappingTable) -> None:
+        """records securities that are known to exist, e.g. because they were just created"""
+        self._add(sec_type, name_to_id)
+        self._save()
+
+    def load_all(self, sec_type: str) -> MappingTable:
+        """downloads every permissioned security of sec_type into the index, returns name -> id"""
+        name_to_id = self._fetch(sec_type=sec_type)
+        self._add(sec_type, name_to_id)
+        self._save()
+        return name_to_id
+
+    def invalidate(self, sec_type: str | None = None) -> None:
+        """forgets everything (for a sec_type)"""
+        with self._lock:
+            for index in (self._ids, self._names):
+                if sec_type is None:
+                    index.clear()
+                else:
+                    index.pop(sec_type, None)
+            self._missing = {k: v for k, v in self._missing.items() if sec_type is not None and k[0] != sec_type}
+        self._save()
@@ -0,0 +1,107 @@
+"""
+High-water marks for incrementally polling secapi metrics (see _SecAPIClient.watch_security_metrics)
+"""
+
+from collections import defaultdict
+from typing import Any, Iterable
+
+import pandas as pd
+
+from merqube_client_lib.secapi.frames import KEY_COLUMNS
+
+
+def _same(a: Any, b: Any) -> bool:
+    try:
+        return bool(a == b)
+    except (TypeError, ValueError):  # e.g. arrays
+        return False
+
+
+class HighWaterMarks:
+    """
+    What has been seen per (security, metric): the latest eff_ts with a value (the high-water mark), and the values of
+    the points within lookback of it.
+
+    A poll only needs to ask for data from lookback before the mark on. The points in that window are asked for again,
+    so that a value published late for a recent eff_ts, or a restatement of a recent point, is picked up; restatements
+    further back than lookback are not. A series without data has no mark, so after a successful poll it is marked at
+    the time of that poll (see advance) rather than being requested from start again on every poll.
+    """
+
+    def __init__(self, start: pd.Timestamp, lookback: pd.Timedelta = pd.Timedelta(0)):
+        self.start = start
+        self.lookback = lookback
+        # (security, metric) -> the latest eff_ts with a value, or the time of the last poll if there was none
+        self.marks: dict[tuple[str, str], pd.Timestamp] = {}
+        # (security, metric) -> {eff_ts: value} of the points that will be polled again
+        self.seen: dict[tuple[str, str], dict[pd.Timestamp, Any]] = {}
+
+    def since(self, series: tuple[str, str]) -> pd.Timestamp:
+        """the date to request this series from"""
+        mark = self.marks.get(series)
+        return self.start if mark is None else max(self.start, mark - self.lookback)
+
+    def poll_groups(
+        self, securities: Iterable[str], metrics: Iterable[str]
+    ) -> dict[pd.Timestamp, list[tuple[str, str]]]:
+        """
+        groups the (security, metric) series by the date they need to be requested from, so that series that are
+        up to date together (the usual case) are fetched in one request
+        """
+        groups: dict[pd.Timestamp, list[tuple[str, str]]] = defaultdict(list)
+        for sec in securities:
+            for metric in metrics:
+                groups[self.since((sec, metric))].append((sec, metric))
+        return dict(groups)
+
+    def new_rows(self, df: pd.DataFrame, key: str, metrics: Iterable[str]) -> pd.DataFrame:
+        """
+        the rows of a polled frame that hold a new (or changed) value for at least one metric; advances the marks
+        key: the column identifying the security ("id" or "name")
+        """
+        if df.empty:
+            return df
+
+        eff_ts = pd.to_datetime(df["eff_ts"])
+        new: set[Any] = set()
+
+        for metric in metrics:
+            if metric not in df:
+                continue
+            has_value = df[metric].notna()
+            touched: set[tuple[str, str]] = set()
+            for i, sec, ts, value in zip(
+                df.index[has_value], df.loc[has_value, key], eff_ts[has_value], df.loc[has_value, metric]
+            ):
+                seen = self.seen.setdefault((sec, metric), {})
+                if ts not in seen or not _same(seen[ts], value):
+                    new.add(i)
+                seen[ts] = value
+                touched.add((sec, metric))
+
+            for series in touched:
+                seen = self.seen[series]
+                mark = self.marks[series] = max(max(seen), self.marks.get(series, self.start))
+                # only the points that will be polled again need to be remembered
+                self.seen[series] = {ts: v for ts, v in seen.items() if ts >= mark - self.lookback}
+
+        return df[df.index.isin(new)].reset_index(drop=True)
+
+    def advance(self, securities: Iterable[str], metrics: Iterable[str], polled_at: pd.Timestamp) -> None:
+        """after a successful poll at polled_at, marks the series that have not had any data yet"""
+        for sec in securities:
+            for metric in metrics:
+                self.marks.setdefault((sec, metric), polled_at)
+
+
+def merge_new_rows(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """combines the new rows of the requests of one poll (which may hold different metrics of the same keys)"""
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    combined = pd.concat(frames, ignore_index=True)
+    return (
+        combined.groupby(KEY_COLUMNS, as_index=False, sort=False)
+        .last()
+        .sort_values(["id", "eff_ts"], ignore_index=True)
+    )
@@ -0,0 +1,24 @@
+"""
+Indexapi types
+"""
+
+from typing_extensions import TypedDict
+
+from merqube_client_lib.types import ResponseJson
+
+
+class IndexPatchSummary(TypedDict):
+    """The outcome of bulk_patch_indices; all keyed by index id"""
+
+    patched: dict[str, ResponseJson]
+    failed: dict[str, str]
+    missing: list[str]
+    conflicts: int
+
+
+class TargetPortfolioUploadSummary(TypedDict):
+    """The outcome of upload_target_portfolios; timestamps are isoformat"""
+
+    uploaded: list[str]
+    failed: dict[str, str]
+    superseded: int
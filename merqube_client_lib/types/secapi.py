@@ -2,10 +2,12 @@
 Secapi types
 """
 
-from typing import Any
+from typing import Any, Literal
 
 from typing_extensions import NotRequired, TypedDict
 
+from merqube_client_lib.pydantic_v2_types import SecurityCreationResponse
+
 
 class SecapiMetricDefinition(TypedDict):
     """The definition of a metric"""
@@ -19,3 +21,93 @@ class SecapiMetricDefinition(TypedDict):
 SecAPIRecordsResponse = list[dict[str, Any]]
 AddlSecapiOptions = dict[str, Any]
 MappingTable = dict[str, str]
+
+# the type of object get_security_metrics and friends return
+SecAPIOutput = Literal["pandas", "arrow"]
+# how metrics are sent over the wire; csv is parsed without decoding a record at a time, but only carries flat metrics
+SecAPIWireFormat = Literal["json", "csv"]
+# long: one row per (eff_ts, id); wide: one eff_ts x id frame per metric
+SecAPILayout = Literal["long", "wide"]
+
+
+class BulkBatchResult(TypedDict):
+    """The outcome of one batch of a bulk write"""
+
+    batch: int
+    rows: int
+    bytes: int
+    request_id: str
+    attempts: int
+    ok: bool
+    response: NotRequired[Any]
+    error: NotRequired[str]
+
+
+class BulkWriteSummary(TypedDict):
+    """The outcome of a bulk write (post_security_metrics etc.)"""
+
+    rows: int
+    ok_rows: int
+    failed_rows: int
+    batches: list[BulkBatchResult]
+
+
+class SecurityCreationSummary(TypedDict):
+    """The outcome of create_securities; all keyed by security name"""
+
+    created: dict[str, SecurityCreationResponse]
+    existing: MappingTable
+    duplicates: list[str]
+    failed: dict[str, str]
+    inserts: int
+
+
+class SecAPIMetricsRequest(TypedDict):
+    """One security type's part of get_security_metrics_multi: the get_security_metrics arguments for it"""
+
+    sec_type: str
+    metrics: str | list[str]
+    sec_ids: NotRequired[str | list[str] | None]
+    sec_names: NotRequired[str | list[str] | None]
+    start_date: NotRequired[Any]
+    end_date: NotRequired[Any]
+    addl_options: NotRequired[AddlSecapiOptions | None]
+    normalize_level: NotRequired[int | None]
+    metrics_chunk_size: NotRequired[int | None]
+    securities_chunk_size: NotRequired[int | None]
+    raise_perm_errors: NotRequired[bool]
+    wire_format: NotRequired[SecAPIWireFormat]
+
+
+class ExtractionChunk(TypedDict):
+    """One planned request of an extraction job, as kept in its manifest"""
+
+    chunk: int
+    securities: list[str]
+    status: Literal["pending", "done", "failed"]
+    attempts: int
+    rows: NotRequired[int]
+    file: NotRequired[str | None]
+    error: NotRequired[str]
+
+
+class ExtractionProgress(TypedDict):
+    """Progress of an extraction job, reported after each chunk"""
+
+    done: int
+    failed: int
+    total: int
+    rows: int
+    rows_per_second: float
+    eta_seconds: float
+
+
+class ExtractionSummary(TypedDict):
+    """The outcome of (one run of) an extraction job"""
+
+    path: str
+    total: int
+    done: int
+    failed: int
+    rows: int
+    errors: dict[int, str]
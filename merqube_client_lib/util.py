@@ -5,24 +5,130 @@ Misc helper utilities
 import datetime
 import json
 import os
-from typing import Any, cast
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, TypeVar, cast
 
+import numpy as np
 import pandas as pd
 
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def iter_batches(
+    rows: Iterable[T],
+    batch_size: int | None = None,
+    max_bytes: int | None = None,
+    size: Callable[[T], int] = len,  # type: ignore[assignment]
+    item_overhead: int = 0,
+    batch_overhead: int = 0,
+) -> Iterator[Any]:
+    """
+    lazily splits rows into batches of at most batch_size rows and, if max_bytes is set, at most max_bytes bytes, where
+    a batch's bytes are batch_overhead + the sum of size(row) + item_overhead over its rows
+    (e.g. a json array of serialized records: size=len, item_overhead=1 for the comma, batch_overhead=1 for the brackets).
+    A row that is larger than max_bytes on its own becomes a batch of one.
+
+    Sequences are not copied up front: lists and tuples yield slices one batch at a time, numpy arrays and
+    DataFrames / Series (by row) yield views. Any other iterable (e.g. a generator) is consumed lazily, one batch at a time.
+    """
+    if batch_size is not None and batch_size < 1:
+        raise ValueError("batch_size cannot be < 1")
+    if batch_size is None and max_bytes is None:
+        raise ValueError("batch_size and/or max_bytes must be set")
+
+    def fits(count: int, nbytes: int, row: T) -> bool:
+        if batch_size is not None and count >= batch_size:
+            return False
+        return max_bytes is None or count == 0 or nbytes + size(row) + item_overhead <= max_bytes
+
+    if isinstance(rows, (list, tuple, np.ndarray, pd.DataFrame, pd.Series)):
+        getter: Any = rows.iloc if isinstance(rows, (pd.DataFrame, pd.Series)) else rows
+        num = len(rows)
+        if max_bytes is None:
+            assert batch_size is not None
+            for start in range(0, num, batch_size):
+                yield getter[start : start + batch_size]
+            return
+
+        start, nbytes = 0, batch_overhead
+        for i in range(num):
+            row = getter[i]
+            if not fits(i - start, nbytes, row):
+                yield getter[start:i]
+                start, nbytes = i, batch_overhead
+            nbytes += size(row) + item_overhead
+        if start < num:
+            yield getter[start:num]
+        return
+
+    batch: list[T] = []
+    nbytes = batch_overhead
+    for row in rows:
+        if not fits(len(batch), nbytes, row):
+            yield batch
+            batch, nbytes = [], batch_overhead
+        batch.append(row)
+        if max_bytes is not None:
+            nbytes += size(row) + item_overhead
+    if batch:
+        yield batch
+
 
 def batch_post_payload(rows: list[Any], batch_size: int) -> list[list[Any]]:
     """
     returns a list of sublists of size <= batch_size
     used widely for POSTing large payloads to e.g., secapi
-    If you have veryy large payloads, you may want to consider doing this math virtually rather than recopying.
+    For very large payloads, prefer iter_batches, which yields the batches lazily instead of building them all at once.
     """
     # If rows is `None` or is an empty list, it doesn't need to be a list of sublist at all
     if rows is None or len(rows) == 0:
         return []
-    if len(rows) > batch_size:
-        n = batch_size
-        return [rows[i * n : (i + 1) * n] for i in range((len(rows) + n - 1) // n)]
-    return [rows]
+    return list(iter_batches(rows, batch_size))
+
+
+def iter_concurrently(
+    func: Callable[[T], R], items: Iterable[T], max_workers: int = 1, ordered: bool = True
+) -> Iterator[R]:
+    """
+    lazily maps func over items on a thread pool, yielding each result as soon as it is available
+    at most max_workers calls are in flight at any time, so memory is bounded by max_workers results (plus the one the caller holds);
+    the next call is submitted before a result is yielded, so fetching item N+1 overlaps with the caller processing item N.
+
+    ordered=True yields in the order of items (a slow item holds back the ones after it), ordered=False yields in completion order.
+    The first exception raised by func is re-raised here; calls not yet started are cancelled.
+    """
+    if max_workers < 1:
+        raise ValueError("max_workers cannot be < 1")
+
+    item_iter = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        in_flight: deque[Future[R]] = deque()
+
+        def _submit() -> None:
+            for item in item_iter:
+                in_flight.append(pool.submit(func, item))
+                return
+
+        try:
+            for _ in range(max_workers):
+                _submit()
+
+            while in_flight:
+                if ordered:
+                    fut = in_flight.popleft()
+                else:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    fut = next(f for f in in_flight if f in done)
+                    in_flight.remove(fut)
+
+                res = fut.result()
+                _submit()
+                yield res
+        finally:
+            for fut in in_flight:
+                fut.cancel()
 
 
 def freezable_now_ts(tz: str = "UTC") -> pd.Timestamp:
@@ -48,6 +154,12 @@ def freezable_utcnow_iso() -> str:
     return cast(str, freezable_utcnow_ts().isoformat())
 
 
+def to_utc_naive_ts(ts: str | pd.Timestamp) -> pd.Timestamp:
+    """returns ts as an unlocalized utc timestamp (converting it to utc first if it is localized)"""
+    res = pd.Timestamp(ts)
+    return res.tz_convert("UTC").tz_localize(None) if res.tzinfo is not None else res
+
+
 def get_token() -> str:
     """
     Gets the users token from the env var
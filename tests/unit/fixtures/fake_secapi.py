@@ -0,0 +1,53 @@
+"""
+An in memory secapi session for the tests of the secapi pull helpers (cache, watch, loader, extraction)
+"""
+
+import pandas as pd
+
+T = pd.Timestamp
+
+
+class FakeSecapiSession:
+    """
+    serves /security/{sec_type} from a list of records, honoring ids, metrics, start_date and end_date like the secapi:
+    records are returned with their keys sorted, only if they hold one of the metrics, and metrics that are None for
+    every returned record are left out
+
+    calls holds the options of every metrics request; a request for an id in fail raises fail[id]
+    """
+
+    def __init__(self, records=None, sec_types=("index",)):
+        self.records = list(records or [])
+        self.sec_types = sec_types
+        self.calls = []
+        self.fail = {}
+
+    def publish(self, day, sec_id, **metrics):
+        """adds (or replaces) the record of sec_id on day"""
+        eff_ts = T(day).isoformat()
+        self.records = [r for r in self.records if (r["eff_ts"], r["id"]) != (eff_ts, sec_id)]
+        self.records.append({"eff_ts": eff_ts, "id": sec_id, "name": f"N{sec_id}", **metrics})
+
+    def get_collection(self, url, options=None, **kwargs):
+        if url == "/security":
+            return [{"name": t} for t in self.sec_types]
+
+        self.calls.append(options)
+        ids = options["ids"].split(",")
+        for sec_id in ids:
+            if sec_id in self.fail:
+                raise self.fail[sec_id]
+
+        metrics = options["metrics"].split(",")
+        start = T(options["start_date"]) if options.get("start_date") else None
+        end = T(options["end_date"]) if options.get("end_date") else None
+        records = [
+            {k: v for k, v in sorted(rec.items()) if k in ["eff_ts", "id", "name"] + metrics}
+            for rec in self.records
+            if rec["id"] in ids
+            and any(m in rec for m in metrics)
+            and (start is None or T(rec["eff_ts"]) >= start)
+            and (end is None or T(rec["eff_ts"]) <= end)
+        ]
+        empty = [m for m in metrics if all(r.get(m) is None for r in records)]
+        return [{k: v for k, v in r.items() if k not in empty} for r in records]
@@ -0,0 +1,277 @@
+"""
+Tests for bulk index writes (patches and target portfolios)
+"""
+
+import threading
+
+import pytest
+
+from merqube_client_lib.api_client import merqube_client
+from merqube_client_lib.exceptions import APIError
+from merqube_client_lib.pydantic_v2_types import (
+    AssetType,
+    EquityBasketPortfolio,
+    EquityIdentifierType,
+    PortfolioUom,
+    RicEquityPosition,
+)
+
+
+class FakeIndexapiSession:
+    """indices whose status.last_modified is a write token that each PATCH must match, and that each PATCH advances"""
+
+    def __init__(self, n):
+        self.indices = {
+            f"id{i}": {"id": f"id{i}", "name": f"name{i}", "stage": "prod", "status": {"last_modified": "v0"}}
+            for i in range(n)
+        }
+        self.lock = threading.Lock()
+        self.gets = []
+        self.patches = []
+        self.reject = {}  # id -> status code, or a list of codes to fail the next PATCHes with
+
+    def get_collection(self, url, options=None, **kwargs):
+        assert url.startswith("/index")
+        self.gets.append(options)
+        res = list(self.indices.values())
+        if options and "names" in options:
+            res = [m for m in res if m["name"] in options["names"].split(",")]
+        fields = options["fields"].split(",")
+        return [{k: v for k, v in m.items() if k in fields} for m in res]
+
+    def get_json(self, url, **kwargs):
+        self.gets.append(url)
+        index_id = url.split("/")[-1]
+        if index_id not in self.indices:
+            raise APIError(404, {"message": "not found"})
+        return dict(self.indices[index_id])
+
+    def patch(self, url, json, headers=None, **kwargs):
+        index_id = url.split("/")[-1]
+        with self.lock:
+            self.patches.append((index_id, json))
+            code = self.reject.get(index_id)
+            if isinstance(code, list):
+                code = code.pop(0) if code else None
+            if code:
+                raise APIError(code, {"message": "rejected"})
+            current = self.indices[index_id]
+            if json["status"] != current["status"]:
+                raise APIError(409, {"message": "stale status"})
+            version = int(current["status"]["last_modified"][1:]) + 1
+            current.update({k: v for k, v in json.items() if k != "status"})
+            current["status"] = {"last_modified": f"v{version}"}
+
+        class Response:
+            def json(self):
+                return {"id": index_id}
+
+        return Response()
+
+
+def test_bulk_patch_indices():
+    sess = FakeIndexapiSession(6)
+    client = merqube_client.MerqubeAPIClient(user_session=sess)
+    client.get_index_defs(index_names=["name0", "name1"], include_nonprod=True, fields=["id", "name", "status"])
+    sess.gets.clear()
+    sess.reject["id3"] = 400
+
+    updates = {f"id{i}": {"description": f"new {i}"} for i in range(4)}
+    updates["nope"] = {"description": "x"}
+    updates["id2"] = {}  # nothing to do
+
+    # someone else writes id1 after our statuses were read, so our first PATCH of it conflicts
+    orig_get = sess.get_collection
+
+    def get_then_write(url, options=None, **kwargs):
+        res = orig_get(url, options, **kwargs)
+        if len(sess.gets) == 1:
+            sess.indices["id1"]["status"] = {"last_modified": "v5"}
+        return res
+
+    sess.get_collection = get_then_write
+
+    summary = client.bulk_patch_indices(updates, max_workers=4)
+    assert summary["patched"] == {"id0": {"id": "id0"}, "id1": {"id": "id1"}}
+    assert list(summary["failed"]) == ["id3"] and "400" in summary["failed"]["id3"]
+    assert summary["missing"] == ["nope"]
+    assert summary["conflicts"] == 1
+
+    # only the statuses of the indices being patched are read: by name where it is known, else by id
+    assert sess.gets[0] == {"names": "name0,name1", "type": "all", "fields": "id,name,status"}
+    assert sorted(sess.gets[1:3]) == ["/index/id3", "/index/nope"]
+    # then a re-read of only the conflicted index
+    assert sess.gets[3] == {"names": "name1", "type": "all", "fields": "id,name,status"}
+    assert len(sess.gets) == 4
+    assert sess.indices["id1"]["description"] == "new 1"
+    assert sess.indices["id1"]["status"] == {"last_modified": "v6"}
+    assert "status" not in updates["id0"]
+
+
+def test_bulk_patch_conflicted_index_deleted():
+    """an index that conflicts and is gone when re-read is missing, not retried; a failed read is a failure"""
+    sess = FakeIndexapiSession(3)
+    client = merqube_client.MerqubeAPIClient(user_session=sess)
+    orig_patch, orig_get_json = sess.patch, sess.get_json
+
+    def patch_then_delete(url, json, headers=None, **kwargs):
+        if url.endswith("id0"):
+            del sess.indices["id0"]
+            raise APIError(409, {"message": "stale status"})
+        return orig_patch(url, json, headers=headers, **kwargs)
+
+    def get_json(url, **kwargs):
+        if url.endswith("id2"):
+            raise APIError(500, {"message": "boom"})
+        return orig_get_json(url, **kwargs)
+
+    sess.patch, sess.get_json = patch_then_delete, get_json
+
+    summary = client.bulk_patch_indices({f"id{i}": {"description": "x"} for i in range(3)})
+    assert summary["patched"] == {"id1": {"id": "id1"}}
+    assert summary["missing"] == ["id0"]
+    assert list(summary["failed"]) == ["id2"] and "500" in summary["failed"]["id2"]
+    assert summary["conflicts"] == 1
+    assert [index_id for index_id, _ in sess.patches] == ["id1"]
+
+
+def test_bulk_patch_gives_up_on_conflicts():
+    sess = FakeIndexapiSession(1)
+    sess.reject["id0"] = 409
+    client = merqube_client.MerqubeAPIClient(user_session=sess)
+
+    summary = client.bulk_patch_indices({"id0": {"description": "x"}}, conflict_retries=2)
+    assert summary["conflicts"] == 2
+    assert "409" in summary["failed"]["id0"]
+    assert len(sess.patches) == 3
+
+
+def test_bulk_patch_conflict_after_transient_error():
+    """a 409 on a retried PATCH is a stale status like any other, not evidence that an earlier attempt landed"""
+    sess = FakeIndexapiSession(1)
+    sess.reject["id0"] = [503, 409]
+    client = merqube_client.MerqubeAPIClient(user_session=sess)
+
+    summary = client.bulk_patch_indices({"id0": {"description": "x"}})
+    assert summary["patched"] == {"id0": {"id": "id0"}}
+    assert summary["conflicts"] == 1
+    assert len(sess.patches) == 3
+    assert len(sess.gets) == 2  # re-read before the retry
+    assert sess.indices["id0"]["description"] == "x"
+
+    sess.reject["id0"] = [503, 409, 409]
+    summary = client.bulk_patch_indices({"id0": {"description": "y"}}, conflict_retries=1)
+    assert summary["patched"] == {}
+    assert "409" in summary["failed"]["id0"]
+    assert sess.indices["id0"]["description"] == "x"
+
+
+def test_optimistic_patch_index():
+    sess = FakeIndexapiSession(2)
+    client = merqube_client.MerqubeAPIClient(user_session=sess)
+
+    client.get_index_manifest(index_id="id0")
+    client.patch_index(index_id="id0", updates={"description": "a"}, optimistic=True)
+    assert sess.gets == ["/index/id0"]  # no read before the patch
+
+    # the status sent was used up, so the next one reads and retries
+    client.patch_index(index_id="id0", updates={"description": "b"}, optimistic=True)
+    assert sess.gets == ["/index/id0", "/index/id0"]
+    assert sess.indices["id0"]["description"] == "b"
+
+    # a status that went stale is rejected, then re-read
+    client.get_index_manifest(index_id="id1")
+    sess.indices["id1"]["status"] = {"last_modified": "v7"}
+    client.patch_index(index_id="id1", updates={"description": "c"}, optimistic=True)
+    assert [p[0] for p in sess.patches] == ["id0", "id0", "id1", "id1"]
+    assert sess.indices["id1"] == {
+        "id": "id1",
+        "name": "name1",
+        "stage": "prod",
+        "status": {"last_modified": "v8"},
+        "description": "c",
+    }
+
+    sess.reject["id1"] = 400
+    client.get_index_manifest(index_id="id1")
+    with pytest.raises(APIError):
+        client.patch_index(index_id="id1", updates={"description": "d"}, optimistic=True)
+
+
+def test_optimistic_bulk_patch():
+    sess = FakeIndexapiSession(3)
+    client = merqube_client.MerqubeAPIClient(user_session=sess)
+    client.get_index_defs(
+        index_names=["name0", "name1", "name2"], include_nonprod=True, fields=["id", "name", "status"]
+    )
+    sess.gets.clear()
+
+    summary = client.bulk_patch_indices({f"id{i}": {"description": "x"} for i in range(3)}, optimistic=True)
+    assert len(summary["patched"]) == 3
+    assert not sess.gets  # half the round trips: no status read at all
+    assert len(sess.patches) == 3
+
+    # the tokens were used up
+    client.bulk_patch_indices({"id0": {"description": "y"}}, optimistic=True)
+    assert sess.gets == ["/index/id0"]
+
+
+def _portfolio(timestamp, amount):
+    return EquityBasketPortfolio(
+        positions=[
+            RicEquityPosition(
+                amount=amount,
+                asset_type=AssetType.EQUITY,
+                identifier="AA.N",
+                identifier_type=EquityIdentifierType.RIC,
+            )
+        ],
+        timestamp=timestamp,
+        unit_of_measure=PortfolioUom.SHARES,
+    )
+
+
+def test_upload_target_portfolios():
+    puts = []
+    attempts = {}
+
+    class FakeSession:
+        def put(self, url, json, headers=None, **kwargs):
+            assert url == "/index/id0/target_portfolio"
+            ts = json["timestamp"]
+            attempts[ts] = attempts.get(ts, 0) + 1
+            if ts.startswith("2023-01-03") and attempts[ts] == 1:
+                raise APIError(503, {"message": "try again"})
+            if ts.startswith("2023-01-04"):
+                raise APIError(400, {"message": "bad portfolio"})
+            if ts.startswith("2023-01-05"):
+                raise APIError(503 if attempts[ts] == 1 else 409, {"message": "conflict"})
+            puts.append(json)
+
+    client = merqube_client.MerqubeAPIClient(user_session=FakeSession())
+    portfolios = [
+        _portfolio("2023-01-02T00:00:00", 1.0),
+        _portfolio("2023-01-03T00:00:00", 2.0),
+        _portfolio("2023-01-02 00:00:00", 3.0),  # the same timestamp; this one wins
+        _portfolio("2023-01-04T00:00:00", 4.0),
+        _portfolio("2023-01-05T00:00:00", 5.0),
+    ]
+    summary = client.upload_target_portfolios("id0", portfolios, max_workers=4)
+
+    assert summary["uploaded"] == ["2023-01-02T00:00:00", "2023-01-03T00:00:00"]
+    assert sorted(summary["failed"]) == ["2023-01-04T00:00:00", "2023-01-05T00:00:00"]
+    assert "400" in summary["failed"]["2023-01-04T00:00:00"]
+    # a 409 after a transient error is not taken to mean the first attempt was applied
+    assert "409" in summary["failed"]["2023-01-05T00:00:00"]
+    assert summary["superseded"] == 1
+    assert attempts == {
+        "2023-01-02T00:00:00": 1,
+        "2023-01-03T00:00:00": 2,
+        "2023-01-04T00:00:00": 1,
+        "2023-01-05T00:00:00": 2,
+    }
+    assert {p["timestamp"]: p["positions"][0]["amount"] for p in puts} == {
+        "2023-01-02T00:00:00": 3.0,
+        "2023-01-03T00:00:00": 2.0,
+    }
+    assert portfolios[2].timestamp == "2023-01-02 00:00:00"  # not modified
@@ -0,0 +1,87 @@
+"""
+Tests for the in memory index catalog
+"""
+
+from merqube_client_lib.api_client import merqube_client
+
+
+def _manifest(name, namespace="ns1", stage="prod", modified="2023-01-01T00:00:00"):
+    return {
+        "id": f"{name}id",
+        "name": name,
+        "namespace": namespace,
+        "stage": stage,
+        "status": {"last_modified": modified},
+        "description": f"the {name} index",
+    }
+
+
+class FakeIndexSession:
+    def __init__(self, manifests):
+        self.manifests = {m["id"]: m for m in manifests}
+        self.calls = []
+
+    def get_collection(self, url, options=None, **kwargs):
+        assert url == "/index"
+        self.calls.append(options)
+        res = list(self.manifests.values())
+        if "names" in options:
+            res = [m for m in res if m["name"] in options["names"].split(",")]
+            if options.get("type") != "all":
+                res = [m for m in res if m["stage"] == "prod"]
+        elif "stage" in options:
+            res = [m for m in res if m["stage"] == options["stage"]]
+        if "fields" in options:
+            fields = options["fields"].split(",")
+            res = [{k: v for k, v in m.items() if k in fields} for m in res]
+        return res
+
+
+def test_catalog_lookups_and_incremental_refresh():
+    sess = FakeIndexSession(
+        [_manifest("a"), _manifest("b", namespace="ns2"), _manifest("c", stage="test"), _manifest("d")]
+    )
+    now = [0.0]
+    client = merqube_client.MerqubeAPIClient(user_session=sess)
+    catalog = client.index_catalog(fields=["description"], include_nonprod=True, ttl=60)
+    catalog._clock = lambda: now[0]
+
+    assert catalog.by_name("a")["id"] == "aid"
+    assert catalog.by_id("bid")["name"] == "b"
+    assert [m["name"] for m in catalog.in_namespace("ns1")] == ["a", "c", "d"]
+    assert [m["name"] for m in catalog.in_stage("test")] == ["c"]
+    assert catalog.ids(["a", "nope"]) == {"a": "aid"}
+    assert catalog.by_name("nope") is None
+    assert len(catalog) == 4
+    assert sess.calls == [{"fields": "description,id,name,namespace,stage,status"}]
+
+    # within the ttl, lookups are served from memory
+    now[0] = 59
+    catalog.by_name("b")
+    assert len(sess.calls) == 1
+
+    # a changes, d is deleted, e is new
+    sess.manifests["aid"] = _manifest("a", namespace="ns3", modified="2023-02-01T00:00:00")
+    del sess.manifests["did"]
+    sess.manifests["eid"] = _manifest("e")
+    now[0] = 60
+    assert catalog.by_name("a")["namespace"] == "ns3"
+    assert sess.calls[1] == {"fields": "id,name,status"}
+    assert sorted(sess.calls[2]["names"].split(",")) == ["a", "e"]
+    assert len(sess.calls) == 3
+
+    assert catalog.by_name("d") is None
+    assert [m["name"] for m in catalog.in_namespace("ns1")] == ["c", "e"]
+    assert catalog.in_namespace("ns3")[0]["description"] == "the a index"
+
+    catalog.refresh(full=True)
+    assert len(sess.calls) == 4 and len(catalog) == 4
+
+
+def test_catalog_prod_only():
+    sess = FakeIndexSession([_manifest("a"), _manifest("c", stage="test")])
+    catalog = merqube_client.MerqubeAPIClient(user_session=sess).index_catalog()
+
+    assert catalog.by_name("c") is None
+    assert len(catalog) == 1
+    assert sess.calls == [{"stage": "prod"}]
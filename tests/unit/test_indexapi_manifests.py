@@ -0,0 +1,74 @@
+"""
+Tests for lazily validated index manifests
+"""
+
+from unittest.mock import patch
+
+import pytest
+from pydantic import ValidationError
+
+from merqube_client_lib.api_client import merqube_client
+from merqube_client_lib.indexapi import manifests as manifests_mod
+from merqube_client_lib.indexapi.manifests import LazyIndexList
+from merqube_client_lib.pydantic_v2_types import IndexDefinitionPatchPutGet as Index
+from tests.unit.fixtures.test_manifest import manifest
+
+
+def _manifests(n):
+    return [{**manifest, "id": f"id{i}", "name": f"name{i}"} for i in range(n)]
+
+
+def test_get_lazy_indices_in_namespace():
+    class FakeSession:
+        def get_collection(self, url, raise_perm_errors=False, **kwargs):
+            assert url == "/index?namespace=test" and raise_perm_errors
+            return _manifests(3) + [{"id": "broken"}]
+
+    client = merqube_client.MerqubeAPIClient(user_session=FakeSession())
+    indices = client.get_lazy_indices_in_namespace("test")
+    assert len(indices) == 4 and indices.validated == 0
+    assert indices.raw[3] == {"id": "broken"}
+
+    assert indices[1].name == "name1"
+    assert indices[-3] is indices[1]  # validated once
+    assert indices.validated == 1
+    assert [m.name for m in indices[:2]] == ["name0", "name1"]
+    with pytest.raises(IndexError):
+        indices[4]
+
+    # only the broken manifest raises, and only when it is used
+    with pytest.raises(ValidationError):
+        list(indices)
+    with pytest.raises(ValidationError):
+        client.get_lazy_indices_in_namespace("test", strict=True)
+    with pytest.raises(ValidationError):
+        client.get_indices_in_namespace("test")
+
+
+def test_get_indices_in_namespace():
+    """still a plain list of validated models"""
+
+    class FakeSession:
+        def get_collection(self, url, raise_perm_errors=False, **kwargs):
+            return _manifests(3)
+
+    client = merqube_client.MerqubeAPIClient(user_session=FakeSession())
+    indices = client.get_indices_in_namespace("test")
+    assert type(indices) is list
+    assert indices == [Index.parse_obj(m) for m in _manifests(3)]
+
+
+def test_validate_all():
+    lazy = LazyIndexList(_manifests(5))
+    assert lazy.validate_all(parallel=False) == [Index.parse_obj(m) for m in _manifests(5)]
+    assert lazy.validated == 5
+    assert lazy == list(lazy)
+
+
+def test_validate_all_parallel():
+    with patch.object(manifests_mod, "VALIDATION_BATCH_SIZE", 2):
+        lazy = LazyIndexList(_manifests(5))
+        lazy[0]
+        models = lazy.validate_all(parallel=True, max_workers=2)
+    assert [m.id for m in models] == [f"id{i}" for i in range(5)]
+    assert lazy.validated == 5
@@ -0,0 +1,116 @@
+"""
+Tests for arrow/parquet output of secapi pulls
+"""
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from merqube_client_lib.api_client.merqube_client import get_client
+from merqube_client_lib.secapi.arrow import (
+    concat_security_tables,
+    merge_metric_tables,
+    records_to_table,
+    to_parquet_dataset,
+)
+from merqube_client_lib.secapi.frames import (
+    concat_security_chunks,
+    merge_metric_chunks,
+    records_to_frame,
+)
+from tests.unit.conftest import mock_secapi
+from tests.unit.fixtures.gsm_chunked_fixtures import (
+    chunked_id,
+    chunked_metric,
+    non_chunked,
+)
+from tests.unit.fixtures.gsm_fixtures import TEST_IDS_NE, TEST_METRICS_NE
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def test_records_to_table():
+    table = records_to_table(non_chunked)
+    assert table.num_rows == len(non_chunked)
+    assert table.schema.field("price_return").type == pa.float64()
+    assert_frame_equal(table.to_pandas(), records_to_frame(non_chunked))
+
+    # ragged records and json metrics
+    table = records_to_table(
+        [{"eff_ts": "t1", "id": "a", "m": {"x": 1}}, {"eff_ts": "t2", "id": "a", "n": "s"}], fill_metrics=["m", "z"]
+    )
+    assert table.column_names == ["eff_ts", "id", "m", "n", "z"]
+    assert table.column("m").to_pylist() == [{"x": 1}, None]
+    assert table.column("z").null_count == 2
+
+
+def test_merge_metric_tables():
+    tables = [records_to_table(c, fill_metrics=TEST_METRICS_NE) for c in chunked_metric]
+    frames = [records_to_frame(c) for c in chunked_metric]
+    for df in frames:
+        for m in TEST_METRICS_NE:
+            if m not in df:
+                df[m] = None
+
+    expected = merge_metric_chunks(frames)
+    assert_frame_equal(merge_metric_tables(tables).to_pandas()[expected.columns], expected, check_dtype=False)
+
+
+def test_merge_metric_tables_unaligned():
+    """chunks with different keys fall back to the pandas merge"""
+    t1 = records_to_table([{"eff_ts": "t1", "id": "a", "m1": 1.0}, {"eff_ts": "t2", "id": "a", "m1": 2.0}])
+    t2 = records_to_table([{"eff_ts": "t2", "id": "a", "m2": 3.0}])
+
+    assert merge_metric_tables([t1, t2]).to_pydict() == {
+        "eff_ts": ["t1", "t2"],
+        "id": ["a", "a"],
+        "m1": [1.0, 2.0],
+        "m2": [None, 3.0],
+    }
+
+
+def test_merge_empty_tables():
+    """chunks with no records give the same columns as the pandas merge"""
+    tables = [records_to_table([], fill_metrics=["m1"]), records_to_table([], fill_metrics=["m2"])]
+    frames = [pd.DataFrame({"m1": []}), pd.DataFrame({"m2": []})]
+
+    merged = merge_metric_tables(tables)
+    assert merged.num_rows == 0
+    assert merged.column_names == merge_metric_chunks(frames).columns.tolist() == ["eff_ts", "id", "m1", "m2"]
+    assert concat_security_tables([records_to_table([])]).column_names == ["eff_ts", "id"]
+
+
+def test_concat_security_tables():
+    tables = [records_to_table(c) for c in chunked_id]
+    expected = concat_security_chunks([records_to_frame(c) for c in chunked_id])
+    assert_frame_equal(concat_security_tables(tables).to_pandas()[expected.columns], expected, check_dtype=False)
+
+
+def test_to_parquet_dataset(tmp_path):
+    chunks = (records_to_table(c) for c in chunked_id)
+    assert to_parquet_dataset(chunks, path=str(tmp_path), partition_by=["id"]) == 15
+
+    written = pq.read_table(str(tmp_path)).to_pandas()
+    assert len(written) == 15
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(f"id={i}" for i in set(written["id"]))
+
+    # DataFrames are accepted too
+    assert to_parquet_dataset([pd.DataFrame({"id": ["a"], "x": [1.0]})], path=str(tmp_path / "df")) == 1
+
+
+def test_get_security_metrics_arrow(monkeypatch, tmp_path):
+    mock_secapi(
+        monkeypatch, method_name_function_map={}, session_func_map={"get_collection": lambda *a, **k: non_chunked}
+    )
+    client = get_client()
+    table = client.get_security_metrics(sec_type="index", metrics=TEST_METRICS_NE, sec_ids=TEST_IDS_NE, output="arrow")
+    assert isinstance(table, pa.Table)
+    assert table.num_rows == len(non_chunked)
+
+    rows = client.security_metrics_to_parquet_dataset(
+        path=str(tmp_path), sec_type="index", metrics=TEST_METRICS_NE, sec_ids=TEST_IDS_NE, securities_chunk_size=2
+    )
+    # every chunk returns the (mocked) full fixture
+    assert rows == 2 * len(non_chunked)
+    assert pq.read_table(str(tmp_path)).num_rows == rows
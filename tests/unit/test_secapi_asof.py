@@ -0,0 +1,84 @@
+"""
+Tests for point-in-time (as-of prov_ts) secapi queries
+"""
+
+import pandas as pd
+import pytest
+
+from merqube_client_lib.api_client import merqube_client
+from merqube_client_lib.secapi.asof import PointInTimeIndex
+
+RAW = [
+    {"id": "i1", "metric": "a", "eff_ts": "2023-01-01T00:00:00", "prov_ts": "2023-01-02T00:00:00", "value": 1.0},
+    # restated twice
+    {"id": "i1", "metric": "a", "eff_ts": "2023-01-01T00:00:00", "prov_ts": "2023-01-03T12:00:00", "value": 1.5},
+    {"id": "i1", "metric": "a", "eff_ts": "2023-01-01T00:00:00", "prov_ts": "2023-01-05T00:00:00", "value": 1.7},
+    {"id": "i1", "metric": "a", "eff_ts": "2023-01-02T00:00:00", "prov_ts": "2023-01-03T00:00:00", "value": 2.0},
+    {"id": "i2", "metric": "a", "eff_ts": "2023-01-01T00:00:00", "prov_ts": "2023-01-04T00:00:00", "value": 3.0},
+    {"id": "i2", "metric": "b", "eff_ts": "2023-01-01T00:00:00", "prov_ts": "2023-01-02T00:00:00", "value": "x"},
+]
+
+
+class FakeRawSession:
+    def __init__(self):
+        self.calls = []
+
+    def get_collection(self, url, options=None, **kwargs):
+        if url == "/security":
+            return [{"name": "index"}]
+        self.calls.append(options)
+        assert options["raw"] == "true"
+        ids = options["ids"].split(",")
+        metrics = options["metrics"].split(",")
+        return [r for r in RAW if r["id"] in ids and r["metric"] in metrics]
+
+
+@pytest.mark.parametrize(
+    "as_of, expected",
+    [
+        ("2023-01-01", []),
+        ("2023-01-02", [("2023-01-01", "i1", 1.0, None), ("2023-01-01", "i2", None, "x")]),
+        (
+            "2023-01-04",
+            [("2023-01-01", "i1", 1.5, None), ("2023-01-02", "i1", 2.0, None), ("2023-01-01", "i2", 3.0, "x")],
+        ),
+        (
+            "2023-02-01",
+            [("2023-01-01", "i1", 1.7, None), ("2023-01-02", "i1", 2.0, None), ("2023-01-01", "i2", 3.0, "x")],
+        ),
+    ],
+)
+def test_as_of(as_of, expected):
+    index = PointInTimeIndex(RAW)
+    assert len(index) == len(RAW)
+
+    res = index.as_of(as_of)
+    got = [
+        (r.eff_ts[:10], r.id, *(None if pd.isna(v) else v for v in (r.get("a"), r.get("b")))) for _, r in res.iterrows()
+    ]
+    assert got == expected
+
+
+def test_as_of_many():
+    res = PointInTimeIndex(RAW).as_of_many(["2023-01-02", "2023-01-04"])
+    assert list(res.columns[:3]) == ["as_of", "eff_ts", "id"]
+    assert res.groupby("as_of").size().tolist() == [2, 3]
+
+    assert PointInTimeIndex([]).as_of("2023-01-01").empty
+
+
+def test_client_as_of_pulls_once():
+    sess = FakeRawSession()
+    client = merqube_client.MerqubeAPIClient(user_session=sess)
+
+    kwargs = {"sec_type": "index", "metrics": ["a", "b"], "sec_ids": ["i1", "i2"], "securities_chunk_size": 1}
+    one = client.get_security_metrics_as_of(as_of="2023-01-02", **kwargs)
+    assert len(sess.calls) == 2  # one per chunk
+    assert one["id"].tolist() == ["i1", "i2"]
+
+    many = client.get_security_metrics_as_of(as_of=["2023-01-04", pd.Timestamp("2023-02-01")], **kwargs)
+    assert len(sess.calls) == 2  # answered from the cached index
+    assert many.loc[many["id"] == "i1", "a"].tolist() == [1.5, 2.0, 1.7, 2.0]
+
+    client.get_security_metrics_as_of(as_of="2023-01-02", use_cache=False, **kwargs)
+    assert len(sess.calls) == 4
@@ -0,0 +1,248 @@
+"""
+Tests for bulk secapi writes
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import Timeout
+
+from merqube_client_lib.api_client import merqube_client
+from merqube_client_lib.constants import REQUEST_ID_HEADER
+from merqube_client_lib.exceptions import APIError
+from merqube_client_lib.secapi.bulk import (
+    batch_encoded,
+    encode_records,
+    iter_records,
+    send_batches,
+    send_with_retries,
+)
+from tests.unit.helpers import MockRequestsResponse
+
+
+def _metrics_frame(n):
+    return pd.DataFrame(
+        {
+            "id": [f"id{i % 3}" for i in range(n)],
+            "metric": "price_return",
+            "eff_ts": pd.date_range("2023-01-01", periods=n),
+            "prov_ts": pd.Timestamp("2023-06-01T12:00:00"),
+            "value": np.arange(n, dtype="float64"),
+        }
+    )
+
+
+def test_encode_and_batch():
+    df = _metrics_frame(10)
+    df.loc[3, "value"] = np.nan
+    encoded = list(encode_records(iter_records(df), required=["id", "value"], drop_missing="value"))
+    assert len(encoded) == 9
+    assert json.loads(encoded[0]) == {
+        "id": "id0",
+        "metric": "price_return",
+        "eff_ts": "2023-01-01T00:00:00",
+        "prov_ts": "2023-06-01T12:00:00",
+        "value": 0.0,
+    }
+
+    batches = list(batch_encoded(encoded, max_bytes=10_000, max_rows=4))
+    assert [len(b) for b in batches] == [4, 4, 1]
+
+    # the json array of every batch fits, except a single record that is too large on its own
+    max_bytes = 2 * len(encoded[0]) + 3
+    for batch in batch_encoded(encoded, max_bytes=max_bytes, max_rows=100):
+        assert len(batch) == 2 or len(batch) == 1
+        assert len(b"[" + b",".join(batch) + b"]") <= max_bytes
+    assert [len(b) for b in batch_encoded(encoded, max_bytes=1, max_rows=100)] == [1] * 9
+
+    with pytest.raises(ValueError, match="missing"):
+        list(encode_records([{"id": "a", "value": 1}], required=["id", "metric"]))
+
+
+def test_encode_records_nat():
+    """NaT (e.g. from a datetime column with gaps) is missing, like None and NaN"""
+    df = _metrics_frame(2).assign(source_ts=[pd.Timestamp("2023-01-01"), pd.NaT])
+    encoded = [json.loads(r) for r in encode_records(iter_records(df), required=["eff_ts"])]
+    assert encoded[0]["source_ts"] == "2023-01-01T00:00:00"
+    assert "source_ts" not in encoded[1]
+
+    df.loc[1, "eff_ts"] = pd.NaT
+    with pytest.raises(ValueError, match="missing"):
+        list(encode_records(iter_records(df), required=["eff_ts"]))
+
+
+def test_iter_records_arrow():
+    pa = pytest.importorskip("pyarrow")
+    df = _metrics_frame(3)
+    assert [json.loads(r) for r in encode_records(iter_records(pa.Table.from_pandas(df)), required=[])] == [
+        json.loads(r) for r in encode_records(iter_records(df), required=[])
+    ]
+
+
+def test_send_batches_retries():
+    attempts = {}
+    sleeps = []
+
+    def send(body, headers):
+        batch = json.loads(body)[0]["batch"]
+        attempts.setdefault(batch, []).append(headers[REQUEST_ID_HEADER])
+        n = len(attempts[batch])
+        if batch == 1 and n == 1:
+            raise RequestsConnectionError()
+        if batch == 1 and n == 2:
+            # the first attempt was applied after all
+            raise APIError(code=409)
+        if batch == 2:
+            raise APIError(code=503, response_json={"message": "unavailable"})
+        if batch == 3:
+            raise APIError(code=400, response_json={"message": "bad"})
+        return {"inserts": 1}
+
+    batches = [[json.dumps({"batch": i}).encode()] for i in range(4)]
+    summary = send_batches(
+        send, batches, max_workers=2, retries=2, backoff=1, sleep=sleeps.append, conflict_means_applied=True
+    )
+
+    assert summary["rows"] == 4
+    assert summary["ok_rows"] == 2
+    assert summary["failed_rows"] == 2
+    assert [(b["batch"], b["ok"], b["attempts"]) for b in summary["batches"]] == [
+        (0, True, 1),
+        (1, True, 2),
+        (2, False, 3),
+        (3, False, 1),
+    ]
+    assert summary["batches"][0]["response"] == {"inserts": 1}
+    assert summary["batches"][2]["error"] == "503: {'message': 'unavailable'}"
+    # the request id is stable across retries
+    assert len(set(attempts[1])) == 1 and len(set(attempts[2])) == 1
+    assert sorted(sleeps) == [1, 1, 2]
+
+
+@pytest.mark.parametrize(
+    "first_error, conflict_means_applied, applied",
+    [
+        (APIError(code=503), True, False),  # rejected, so nothing was applied
+        (Timeout(), True, True),  # the first attempt may have been applied
+        (RequestsConnectionError(), True, True),
+        (Timeout(), False, False),
+    ],
+)
+def test_send_with_retries_conflict(first_error, conflict_means_applied, applied):
+    """a 409 on a retry only counts as applied when asked to, and when an earlier attempt got no response"""
+    errors = [first_error, APIError(code=409, response_json={"message": "conflict"})]
+
+    def send(headers):
+        raise errors.pop(0)
+
+    response, attempts, error = send_with_retries(
+        send, retries=3, sleep=lambda _: None, conflict_means_applied=conflict_means_applied
+    )
+    assert attempts == 2 and response is None
+    assert (error is None) == applied
+    if not applied:
+        assert error.code == 409
+
+
+def test_post_security_metrics():
+    posted = []
+
+    class FakeSession:
+        def get_collection(self, url, **kwargs):
+            return [{"name": "index"}]
+
+        def post(self, url, data, headers):
+            posted.append((url, json.loads(data)))
+            return MockRequestsResponse(200, {"inserts": len(posted[-1][1])})
+
+    client = merqube_client.MerqubeAPIClient(user_session=FakeSession())
+    summary = client.post_security_metrics("index", (r for r in iter_records(_metrics_frame(25))), max_rows=10)
+
+    assert summary["ok_rows"] == 25
+    assert [b["response"] for b in summary["batches"]] == [{"inserts": 10}, {"inserts": 10}, {"inserts": 5}]
+    assert {url for url, _ in posted} == {"/security/index/metrics"}
+    assert sorted(r["value"] for _, body in posted for r in body) == list(range(25))
+
+
+def test_delete_security_metrics():
+    deleted = []
+    attempts = []
+
+    class FakeSession:
+        def get_collection(self, url, **kwargs):
+            return [{"name": "index"}]
+
+        def delete(self, url, data, headers):
+            body = json.loads(data)
+            if any(r["id"] == "id1" for r in body):
+                # a 409 after a timeout is not taken to mean the delete was applied
+                attempts.append(headers[REQUEST_ID_HEADER])
+                raise Timeout() if len(attempts) == 1 else APIError(code=409)
+            if any(r["id"] == "id2" for r in body):
+                raise APIError(code=404, response_json={"message": "not found"})
+            deleted.append((url, body))
+            return MockRequestsResponse(200, {"deletes": len(body)})
+
+    df = _metrics_frame(12)
+    df = pd.concat([df, df.head(3)])  # duplicates are only deleted once
+
+    client = merqube_client.MerqubeAPIClient(user_session=FakeSession())
+    summary = client.delete_security_metrics("index", df.sort_values("id"), max_rows=4)
+
+    assert summary["rows"] == 12
+    assert summary["ok_rows"] == 4
+    assert [b["ok"] for b in summary["batches"]] == [True, False, False]
+    assert len(attempts) == 2 and len(set(attempts)) == 1
+    assert {url for url, _ in deleted} == {"/security/index/metrics"}
+    assert set(deleted[0][1][0]) == {"id", "metric", "eff_ts", "prov_ts"}
+
+    with pytest.raises(ValueError, match="missing"):
+        client.delete_security_metrics("index", [{"id": "a", "metric": "m"}])
+
+
+def test_create_securities():
+    existing = {"old": "id-old"}
+    posted = []
+
+    class FakeSession:
+        def get_collection(self, url, options=None, **kwargs):
+            if url == "/security":
+                return [{"name": "custom"}]
+            names = options["names"].split(",")
+            return [{"name": n, "id": i} for n, i in existing.items() if n in names]
+
+        def post(self, url, json, headers):
+            posted.append(json["name"])
+            if json["name"] == "bad":
+                raise APIError(code=400, response_json={"message": "nope"})
+            if json["name"] == "raced":
+                existing["raced"] = "id-raced"
+                raise APIError(code=409)
+            existing[json["name"]] = f"id-{json['name']}"
+            return MockRequestsResponse(200, {"id": f"id-{json['name']}", "inserts": 1})
+
+    client = merqube_client.MerqubeAPIClient(user_session=FakeSession())
+
+    with pytest.raises(ValueError, match="2 invalid securities"):
+        client.create_securities(
+            "custom", [{"name": "a"}, {"name": "b", "namespace": "test", "prov_ts": "2023-01-01"}, {}]
+        )
+    assert not posted
+
+    def new(name):
+        return {"name": name, "namespace": "test", "prov_ts": "2023-01-01"}
+
+    summary = client.create_securities("custom", [new(n) for n in ["a", "b", "a", "old", "bad", "raced"]])
+
+    assert sorted(posted) == ["a", "b", "bad", "raced"]
+    assert {n: r.id for n, r in summary["created"].items()} == {"a": "id-a", "b": "id-b"}
+    assert summary["existing"] == {"old": "id-old", "raced": "id-raced"}
+    assert summary["duplicates"] == ["a"]
+    assert summary["failed"] == {"bad": "400: {'message': 'nope'}"}
+    assert summary["inserts"] == 2
+
+    # the new securities are now in the resolver
+    assert client.resolve_security_ids("custom", ["a", "b"]) == {"a": "id-a", "b": "id-b"}
@@ -0,0 +1,151 @@
+"""
+Tests for the on disk secapi metrics cache
+"""
+
+import pandas as pd
+import pytest
+from freezegun import freeze_time
+from pandas.testing import assert_frame_equal
+
+from merqube_client_lib.api_client import merqube_client
+from merqube_client_lib.secapi.cache import (
+    SecAPIMetricsCache,
+    merge_ranges,
+    subtract_ranges,
+)
+from tests.unit.fixtures.fake_secapi import FakeSecapiSession
+
+T = pd.Timestamp
+
+
+def _session():
+    """daily records for January for a and b; m2 is a JSON metric"""
+    sess = FakeSecapiSession()
+    for sec_id in ["a", "b"]:
+        for i, day in enumerate(pd.date_range("2023-01-01", "2023-01-31")):
+            sess.publish(day, sec_id, m1=float(i), m2={"x": i})
+    return sess
+
+
+@pytest.fixture
+def cached_client(tmp_path):
+    sess = _session()
+    client = merqube_client.MerqubeAPIClient(user_session=sess, metrics_cache=SecAPIMetricsCache(str(tmp_path)))
+    return client, sess
+
+
+def test_ranges():
+    assert merge_ranges([(T("2023-01-05"), T("2023-01-10")), (T("2023-01-01"), T("2023-01-05"))]) == [
+        (T("2023-01-01"), T("2023-01-10"))
+    ]
+    assert subtract_ranges(T("2023-01-01"), T("2023-01-31"), []) == [(T("2023-01-01"), T("2023-01-31"))]
+    assert subtract_ranges(
+        T("2023-01-01"), T("2023-01-31"), [(T("2023-01-05"), T("2023-01-10")), (T("2023-01-20"), T("2023-02-10"))]
+    ) == [(T("2023-01-01"), T("2023-01-05")), (T("2023-01-10"), T("2023-01-20"))]
+    assert subtract_ranges(T("2023-01-02"), T("2023-01-03"), [(T("2023-01-01"), T("2023-01-31"))]) == []
+
+
+@freeze_time("2023-03-01")
+def test_gap_filling(cached_client):
+    client, sess = cached_client
+    kwargs = {"sec_type": "index", "metrics": ["m1"], "sec_ids": ["a", "b"]}
+
+    first = client.get_security_metrics(**kwargs, start_date="2023-01-01", end_date="2023-01-10")
+    assert len(sess.calls) == 1
+    assert len(first) == 20
+
+    # fully cached
+    again = client.get_security_metrics(**kwargs, start_date="2023-01-02", end_date="2023-01-09")
+    assert len(sess.calls) == 1
+    assert_frame_equal(again, first[first["eff_ts"].between("2023-01-02", "2023-01-09T23:59")].reset_index(drop=True))
+
+    # only the new days are fetched, for both securities at once
+    extended = client.get_security_metrics(**kwargs, start_date="2023-01-01", end_date="2023-01-20")
+    assert len(sess.calls) == 2
+    assert sess.calls[-1]["start_date"] == "2023-01-10T00:00:00"
+    assert sess.calls[-1]["ids"] == "a,b"
+    assert_frame_equal(
+        extended, client.get_security_metrics(**kwargs, start_date="2023-01-01", end_date="2023-01-20", use_cache=False)
+    )
+
+
+@freeze_time("2023-03-01")
+def test_localized_dates(cached_client):
+    """localized dates are converted to utc, which is what the cache holds"""
+    client, sess = cached_client
+    kwargs = {"sec_type": "index", "metrics": ["m1"], "sec_ids": ["a"]}
+
+    res = client.get_security_metrics(
+        **kwargs, start_date=T("2023-01-01T19:00:00", tz="US/Eastern"), end_date=T("2023-01-05", tz="UTC")
+    )
+    assert sess.calls[-1]["start_date"] == "2023-01-02T00:00:00"
+    assert_frame_equal(res, client.get_security_metrics(**kwargs, start_date="2023-01-02", end_date="2023-01-05"))
+    assert len(sess.calls) == 1
+
+
+@freeze_time("2023-01-20T12:00:00")
+def test_settle_period(cached_client):
+    """the last day of a fetch is refetched, in case values were published late"""
+    client, sess = cached_client
+    kwargs = {"sec_type": "index", "metrics": ["m1"], "sec_ids": ["a"], "start_date": "2023-01-15"}
+
+    client.get_security_metrics(**kwargs)
+    client.get_security_metrics(**kwargs)
+    assert len(sess.calls) == 2
+    assert sess.calls[-1]["start_date"] == "2023-01-19T12:00:00"
+
+
+@freeze_time("2023-03-01")
+def test_json_metrics(cached_client):
+    client, _ = cached_client
+    kwargs = {"sec_type": "index", "metrics": ["m1", "m2"], "sec_ids": ["a"], "start_date": "2023-01-01"}
+
+    client.get_security_metrics(**kwargs, end_date="2023-01-03")
+    cached = client.get_security_metrics(**kwargs, end_date="2023-01-03")
+    assert cached["m2.x"].tolist() == [0, 1, 2]
+    assert_frame_equal(cached, client.get_security_metrics(**kwargs, end_date="2023-01-03", use_cache=False))
+
+
+@freeze_time("2023-03-01")
+def test_invalidate_and_evict(cached_client, tmp_path):
+    client, sess = cached_client
+    cache = client.metrics_cache
+    kwargs = {"sec_type": "index", "metrics": ["m1"], "sec_ids": ["a", "b"], "start_date": "2023-01-01"}
+
+    client.get_security_metrics(**kwargs, end_date="2023-01-31")
+    assert len(sess.calls) == 1
+
+    cache.invalidate("index", sec_ids=["a"], metrics=["m1"], start="2023-01-10", end="2023-01-12")
+    assert cache.missing_ranges("index", "b", "m1", T("2023-01-01"), T("2023-01-31")) == []
+    assert len(cache.missing_ranges("index", "a", "m1", T("2023-01-01"), T("2023-01-31"))) == 1
+
+    client.get_security_metrics(**kwargs, end_date="2023-01-31")
+    assert len(sess.calls) == 2
+    assert sess.calls[-1]["ids"] == "a"
+
+    cache.invalidate("index")
+    assert cache.size_bytes == 0
+
+    # a cache reopened from disk sees the same data
+    client.get_security_metrics(**kwargs, end_date="2023-01-31")
+    assert SecAPIMetricsCache(str(tmp_path)).size_bytes == cache.size_bytes > 0
+
+    cache.max_bytes = cache.size_bytes // 2
+    cache.put("index", "c", "m1", T("2023-01-01"), T("2023-01-02"), pd.Series([1.0], index=["2023-01-01T00:00:00"]))
+    assert cache.size_bytes <= cache.max_bytes
+
+
+@freeze_time("2023-03-01")
+def test_pull_larger_than_the_cache(tmp_path):
+    """the series of a pull are not evicted before its result is built from them"""
+    sess = _session()
+    client = merqube_client.MerqubeAPIClient(
+        user_session=sess, metrics_cache=SecAPIMetricsCache(str(tmp_path), max_bytes=1500)
+    )
+    kwargs = {"sec_type": "index", "metrics": ["m1"], "sec_ids": ["a", "b"], "start_date": "2023-01-01"}
+
+    res = client.get_security_metrics(**kwargs, end_date="2023-01-31")
+    assert len(res) == 62
+    assert_frame_equal(res, client.get_security_metrics(**kwargs, end_date="2023-01-31", use_cache=False))
+    # evicted once the result was built
+    assert client.metrics_cache.size_bytes <= 1500
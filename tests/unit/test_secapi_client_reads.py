@@ -1,3 +1,4 @@
+import threading
 from functools import partial
 from unittest.mock import MagicMock, call
 
@@ -332,6 +333,139 @@ def test_chunked_names(monkeypatch):
     assert_frame_equal(left=mult_mult, right=chunked, check_like=True)
 
 
+def test_iter_security_metrics(monkeypatch):
+    """the streaming api yields one unmerged frame per chunk, in request order"""
+    mult_mult = _get_non_chunked(monkeypatch, metrics=TEST_METRICS_NE, sec_ids=TEST_IDS_NE)
+
+    _, coll = chunked_gsm_call(monkeypatch, calls=chunked_id, mock_sec_call=False)
+
+    dfs = list(
+        get_client().iter_security_metrics(
+            sec_type="index",
+            metrics=TEST_METRICS_NE,
+            sec_ids=TEST_IDS_NE,
+            securities_chunk_size=2,
+            max_workers=2,
+        )
+    )
+
+    assert coll.call_count == 2
+    assert len(dfs) == 2
+    assert set(dfs[0]["id"]) == {ID1, ID2}
+    assert set(dfs[1]["id"]) == {ID3}
+
+    streamed = pd.concat(dfs).sort_values(["id", "eff_ts"]).reset_index(drop=True)
+    assert_frame_equal(left=mult_mult, right=streamed, check_like=True)
+
+
+def test_wide_layout(monkeypatch):
+    """layout="wide" is the per metric pivot of the long frame"""
+    mult_mult = _get_non_chunked(monkeypatch, metrics=TEST_METRICS_NE, sec_ids=TEST_IDS_NE)
+
+    sm, coll = chunked_gsm_call(monkeypatch, calls=chunked_metric, mock_sec_call=False)
+    wide = sm(metrics=TEST_METRICS_NE, sec_ids=TEST_IDS_NE, metrics_chunk_size=2, layout="wide")
+
+    assert coll.call_count == 2
+    assert list(wide) == TEST_METRICS_NE
+    for metric in TEST_METRICS_NE:
+        expected = mult_mult.pivot(index="eff_ts", columns="id", values=metric).astype("float64")
+        expected.index = pd.to_datetime(expected.index)
+        assert_frame_equal(wide[metric], expected)
+
+
+def test_csv_wire_format():
+    """wire_format="csv" gives the frame the json route gives, for flat metrics"""
+    records = {
+        "i1": [
+            {"eff_ts": "2023-01-01T00:00:00", "id": "i1", "name": "NA", "price": 1.5, "count": 3},
+            {"eff_ts": "2023-01-02T00:00:00", "id": "i1", "name": "NA", "price": 2.5, "count": 4},
+        ],
+        "i2": [{"eff_ts": "2023-01-01T00:00:00", "id": "i2", "name": "N2", "price": 10.0, "count": 5}],
+    }
+
+    class FakeSession:
+        def __init__(self):
+            self.csv_options = []
+
+        def get_collection(self, url, options=None, **kwargs):
+            if url == "/security":
+                return [{"name": "index"}]
+            return [r for i in options["ids"].split(",") for r in records[i]]
+
+        def get_data(self, url, options=None, **kwargs):
+            assert url == "/security/index"
+            self.csv_options.append(options)
+            return pd.DataFrame(self.get_collection(url, {"ids": options["ids"]})).to_csv(index=False).strip()
+
+    sess = FakeSession()
+    client = merqube_client.MerqubeAPIClient(user_session=sess)
+    kwargs = {"sec_type": "index", "metrics": ["price", "count"], "sec_ids": ["i1", "i2"], "securities_chunk_size": 1}
+
+    from_json = client.get_security_metrics(**kwargs)
+    from_csv = client.get_security_metrics(wire_format="csv", **kwargs)
+    assert [o["format"] for o in sess.csv_options] == ["csv", "csv"]
+    assert sess.csv_options[0]["metrics"] == "price,count"
+    assert_frame_equal(from_csv, from_json)
+    assert from_csv["name"].tolist() == ["NA", "NA", "N2"]
+
+    typed = client.get_security_metrics(wire_format="csv", csv_dtypes={"count": "float64"}, **kwargs)
+    assert typed["count"].dtype == "float64"
+
+    compact = client.get_security_metrics(wire_format="csv", compact=True, float32=True, **kwargs)
+    assert compact["id"].dtype == "category" and compact["count"].dtype == "float32"
+    with pytest.raises(ValueError):
+        client.get_security_metrics(compact=True, layout="wide", **kwargs)
+
+    with pytest.raises(ValueError):
+        client.get_security_metrics(wire_format="csv", output="arrow", **kwargs)
+    with pytest.raises(ValueError):
+        client.get_security_metrics(wire_format="csv", layout="wide", **kwargs)
+
+
+def test_security_metrics_multi():
+    """one call, concurrently across security types"""
+    barrier = threading.Barrier(2, timeout=5)
+
+    class FakeSession:
+        def get_collection(self, url, options=None, **kwargs):
+            if url == "/security":
+                return [{"name": "index"}, {"name": "fx"}, {"name": "equity"}]
+            sec_type = url.split("/")[-1]
+            if sec_type != "equity":
+                barrier.wait()  # both in flight at once
+                return [{"eff_ts": "2023-01-01T00:00:00", "id": i, sec_type: 1.0} for i in options["ids"].split(",")]
+            return []
+
+    client = merqube_client.MerqubeAPIClient(user_session=FakeSession())
+    requests = [
+        {"sec_type": "index", "metrics": "index", "sec_ids": ["i1", "i2"]},
+        {"sec_type": "fx", "metrics": ["fx"], "sec_ids": "f1", "start_date": "2023-01-01"},
+        {"sec_type": "equity", "metrics": ["equity"], "sec_ids": "e1"},
+    ]
+    frames = client.get_security_metrics_multi(requests)
+    assert list(frames) == ["index", "fx", "equity"]
+    assert frames["index"]["id"].tolist() == ["i1", "i2"]
+    assert frames["equity"].empty
+
+    combined = client.get_security_metrics_multi(requests, concat=True)
+    assert combined.columns.tolist() == ["sec_type", "eff_ts", "id", "index", "fx"]
+    assert combined["sec_type"].tolist() == ["index", "index", "fx"]
+
+    with pytest.raises(ValueError):
+        client.get_security_metrics_multi(requests + [requests[0]])
+    with pytest.raises(AssertionError):  # unknown type, before anything is sent
+        client.get_security_metrics_multi([{"sec_type": "bond", "metrics": "x", "sec_ids": "b1"}])
+
+
+def test_iter_security_metrics_validates_eagerly(monkeypatch):
+    """bad chunking options raise on the call, not on the first next()"""
+    mock_secapi(monkeypatch, method_name_function_map={})
+    public = get_client()
+
+    with pytest.raises(ValueError):
+        public.iter_security_metrics(sec_type="index", sec_ids=TEST_IDS, metrics="foo", metrics_chunk_size=3)
+
+
 def test_mapping_table():
     """Tests mapping table of ids to names / names to ids"""
 
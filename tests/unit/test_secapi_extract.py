@@ -0,0 +1,118 @@
+"""
+Tests for checkpointed secapi extraction jobs
+"""
+
+import json
+
+import pytest
+
+from merqube_client_lib.api_client import merqube_client
+from merqube_client_lib.exceptions import APIError
+from merqube_client_lib.secapi.extract import SecAPIExtractionJob
+from tests.unit.fixtures.fake_secapi import FakeSecapiSession
+
+pytest.importorskip("pyarrow")
+
+
+def _session(ids=("i1", "i2", "i3", "i4", "i5")):
+    """two dates of price per id"""
+    sess = FakeSecapiSession()
+    for sec_id in ids:
+        for d in (1, 2):
+            sess.publish(f"2023-01-0{d}", sec_id, price=float(d))
+    return sess
+
+
+def _ids(sess):
+    return [c["ids"] for c in sess.calls]
+
+
+def test_extraction_resumes(tmp_path):
+    sess = _session()
+    sess.fail["i3"] = APIError(503, {"message": "unavailable"})
+    client = merqube_client.MerqubeAPIClient(user_session=sess)
+    kwargs = {
+        "path": str(tmp_path),
+        "sec_type": "index",
+        "metrics": "price",
+        "sec_ids": ["i1", "i2", "i3", "i4", "i5"],
+        "start_date": "2023-01-01",
+        "securities_chunk_size": 2,
+    }
+    progress = []
+
+    summary = client.extract_security_metrics(**kwargs, retries=2, sleep=lambda _: None, progress=progress.append)
+    assert summary["total"] == 3 and summary["done"] == 2 and summary["failed"] == 1
+    assert summary["rows"] == 6
+    assert "503" in summary["errors"][1]
+    assert _ids(sess).count("i3,i4") == 3  # retried
+    assert [(p["done"], p["failed"]) for p in progress] == [(1, 0), (1, 1), (2, 1)]
+    assert progress[-1]["eta_seconds"] == 0 and progress[-1]["rows"] == 6
+
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    assert [c["status"] for c in manifest["chunks"]] == ["done", "failed", "done"]
+
+    # the restart only fetches the failed chunk
+    sess.fail.clear()
+    sess.calls.clear()
+    summary = client.extract_security_metrics(**kwargs, progress=None)
+    assert _ids(sess) == ["i3,i4"]
+    assert summary["done"] == 3 and summary["failed"] == 0 and summary["rows"] == 10
+
+    df = SecAPIExtractionJob(client, **kwargs).read()
+    assert df["id"].tolist() == ["i1", "i1", "i2", "i2", "i3", "i3", "i4", "i4", "i5", "i5"]
+    assert df["price"].tolist() == [1.0, 2.0] * 5
+
+    # a finished job does nothing
+    sess.calls.clear()
+    assert client.extract_security_metrics(**kwargs)["done"] == 3
+    assert not sess.calls
+
+    with pytest.raises(ValueError):
+        client.extract_security_metrics(**{**kwargs, "metrics": ["price", "other"]})
+
+
+def test_empty_chunks(tmp_path):
+    client = merqube_client.MerqubeAPIClient(user_session=_session())
+    job = SecAPIExtractionJob(client, str(tmp_path), sec_type="index", metrics="other", sec_ids=["i1"])
+    assert job.run(progress=None) == {
+        "path": str(tmp_path),
+        "total": 1,
+        "done": 1,
+        "failed": 0,
+        "rows": 0,
+        "errors": {},
+    }
+    assert job.read().empty
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["manifest.json"]
+
+
+def test_single_security(tmp_path):
+    sess = _session(ids=["i12"])
+    client = merqube_client.MerqubeAPIClient(user_session=sess)
+    job = SecAPIExtractionJob(client, str(tmp_path), sec_type="index", metrics="price", sec_ids="i12")
+    assert [c["securities"] for c in job.chunks] == [["i12"]]  # not split into characters
+    assert job.run(progress=None)["rows"] == 2
+    assert _ids(sess) == ["i12"]
+
+
+def test_conflict_on_retry_fails_the_chunk(tmp_path):
+    """a 409 after a transient error is an error for a read, so only its chunk fails"""
+    sess = _session()
+    codes = [503, 409]
+    get_collection = sess.get_collection
+
+    def flaky(url, options=None, **kwargs):
+        if url != "/security" and options["ids"] == "i1" and codes:
+            raise APIError(codes.pop(0), {"message": "flaky"})
+        return get_collection(url, options, **kwargs)
+
+    sess.get_collection = flaky
+    client = merqube_client.MerqubeAPIClient(user_session=sess)
+    job = SecAPIExtractionJob(
+        client, str(tmp_path), sec_type="index", metrics="price", sec_ids=["i1", "i2"], securities_chunk_size=1
+    )
+    summary = job.run(progress=None, sleep=lambda _: None)
+    assert summary["done"] == 1 and summary["failed"] == 1
+    assert "409" in summary["errors"][0]
+    assert job.chunks[0]["attempts"] == 2
@@ -0,0 +1,237 @@
+"""
+Tests for the secapi DataFrame helpers
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from merqube_client_lib.secapi.frames import (
+    compact_frame,
+    concat_security_chunks,
+    csv_dtypes,
+    csv_to_frame,
+    memory_report,
+    merge_metric_chunks,
+    records_to_frame,
+    records_to_wide,
+)
+from tests.unit.fixtures.gsm_chunked_fixtures import (
+    chunked_id,
+    chunked_metric,
+    non_chunked,
+)
+from tests.unit.fixtures.gsm_fixtures import TEST_METRICS_NE
+
+
+def _frames(calls, fill_metrics=()):
+    dfs = []
+    for data in calls:
+        df = pd.json_normalize(data)
+        for m in fill_metrics:
+            if m not in df:
+                df[m] = None
+        dfs.append(df)
+    return dfs
+
+
+def _groupby_last(dfs):
+    """the merge that was used before the join based engine; the output contract must not change"""
+    return (
+        pd.concat(dfs)
+        .groupby(["eff_ts", "id"])
+        .last()
+        .reset_index()
+        .sort_values(["id", "eff_ts"])
+        .reset_index()
+        .drop("index", axis=1)
+    )
+
+
+def test_merge_metric_chunks_matches_groupby():
+    expected = _groupby_last(_frames(chunked_metric, TEST_METRICS_NE))
+    assert_frame_equal(merge_metric_chunks(_frames(chunked_metric, TEST_METRICS_NE)), expected)
+
+
+def test_concat_security_chunks_matches_groupby():
+    expected = _groupby_last(_frames(chunked_id))
+    assert_frame_equal(concat_security_chunks(_frames(chunked_id)), expected)
+
+
+def test_merge_metric_chunks_overlapping_columns():
+    """shared columns keep the last non null value, and rows only present in one chunk are kept"""
+    c1 = pd.DataFrame({"eff_ts": ["t1", "t2"], "id": ["a", "a"], "name": ["A", "A"], "m1": [1.0, 2.0], "m2": None})
+    c2 = pd.DataFrame({"eff_ts": ["t1", "t3"], "id": ["a", "a"], "name": ["A", None], "m2": [3.0, 4.0], "m1": None})
+
+    expected = pd.DataFrame(
+        {
+            "eff_ts": ["t1", "t2", "t3"],
+            "id": ["a", "a", "a"],
+            "name": ["A", "A", None],
+            "m1": [1.0, 2.0, None],
+            "m2": [3.0, None, 4.0],
+        }
+    )
+    assert_frame_equal(merge_metric_chunks([c1, c2]), expected, check_dtype=False)
+
+
+def test_merge_empty_chunks():
+    """a chunk with no records only contributes its (filled) metric columns"""
+    c1 = pd.DataFrame({"eff_ts": ["t1"], "id": ["a"], "m1": [1.0]})
+    c2 = pd.DataFrame({"m2": []})
+
+    assert merge_metric_chunks([c1, c2]).to_dict(orient="list") == {
+        "eff_ts": ["t1"],
+        "id": ["a"],
+        "m1": [1.0],
+        "m2": [None],
+    }
+    assert merge_metric_chunks([pd.DataFrame({"m2": []})]).columns.tolist() == ["eff_ts", "id", "m2"]
+
+    # an empty first chunk keeps its place in the column order
+    c0 = pd.DataFrame({"m0": []})
+    c1 = pd.DataFrame({"eff_ts": ["t1"], "id": ["a"], "name": ["A"], "m1": [1.0]})
+    expected = _groupby_last([c0.copy(), c1.copy()])
+    assert expected.columns.tolist() == ["eff_ts", "id", "m0", "name", "m1"]
+    assert_frame_equal(merge_metric_chunks([c0, c1]), expected, check_dtype=False)
+    assert concat_security_chunks([pd.DataFrame()]).columns.tolist() == ["eff_ts", "id"]
+
+
+def test_concat_security_chunks_duplicates():
+    """a security passed twice is only returned once"""
+    c1 = pd.DataFrame({"eff_ts": ["t1"], "id": ["a"], "m1": [1.0]})
+    c2 = pd.DataFrame({"eff_ts": ["t1", "t1"], "id": ["b", "a"], "m1": [2.0, 1.0]})
+
+    assert concat_security_chunks([c1, c2]).to_dict(orient="list") == {
+        "eff_ts": ["t1", "t1"],
+        "id": ["a", "b"],
+        "m1": [1.0, 2.0],
+    }
+
+
+@pytest.mark.parametrize("normalize_level", [None, 0, 1])
+@pytest.mark.parametrize(
+    "data",
+    [
+        non_chunked,
+        [],
+        [{"eff_ts": "t1", "id": "a", "m": 1}, {"eff_ts": "t2", "id": "a", "m": 2}],
+        # ragged records
+        [{"eff_ts": "t1", "id": "a", "m": 1}, {"eff_ts": "t2", "id": "a", "n": "s"}],
+        [{"eff_ts": "t1", "id": "a", "m": True}, {"eff_ts": "t2", "id": "a", "m": None}],
+        [{"eff_ts": "t1", "id": "a", "m": [1, 2]}, {"eff_ts": "t2", "id": "a", "m": None}],
+        # nested; goes through json_normalize unless normalize_level=0
+        [{"eff_ts": "t1", "id": "a", "m": {"x": 1, "y": {"z": 2}}}, {"eff_ts": "t2", "id": "a", "m": None}],
+    ],
+)
+def test_records_to_frame_matches_json_normalize(data, normalize_level):
+    assert_frame_equal(
+        records_to_frame(data, normalize_level=normalize_level), pd.json_normalize(data, max_level=normalize_level)
+    )
+
+
+def test_records_to_frame_typed():
+    df = records_to_frame(
+        [
+            {"eff_ts": "2023-01-02T00:00:00", "id": "a", "name": "A", "i": 1, "f": 1.5, "b": True},
+            {"eff_ts": "2023-01-03T00:00:00", "id": "b", "name": "B", "i": 2, "f": None, "b": False},
+        ],
+        typed=True,
+    )
+    assert df.dtypes.astype(str).to_dict() == {
+        "eff_ts": "datetime64[ns]",
+        "id": "category",
+        "name": "object",
+        "i": "float64",
+        "f": "float64",
+        "b": "bool",
+    }
+    assert df["eff_ts"].tolist() == [pd.Timestamp("2023-01-02"), pd.Timestamp("2023-01-03")]
+
+
+def _pivot(df, metric):
+    """what consumers did with the long frame"""
+    wide = df.pivot(index="eff_ts", columns="id", values=metric)
+    wide.index = pd.to_datetime(wide.index)
+    return wide
+
+
+def test_records_to_wide_matches_pivot():
+    wide = records_to_wide([non_chunked], TEST_METRICS_NE)
+    long = pd.json_normalize(non_chunked)
+    for metric in TEST_METRICS_NE:
+        assert_frame_equal(wide[metric], _pivot(long, metric).astype("float64"))
+        assert wide[metric].index is wide[TEST_METRICS_NE[0]].index
+
+    # chunked by metrics or securities: the same frames
+    for calls in [chunked_metric, chunked_id]:
+        chunked = records_to_wide(calls, TEST_METRICS_NE)
+        for metric in TEST_METRICS_NE:
+            assert_frame_equal(chunked[metric], wide[metric])
+
+
+def test_records_to_wide_types():
+    records = [
+        {"eff_ts": "2023-01-02T00:00:00", "id": "b", "f": 1, "s": "x", "j": [1, 2]},
+        {"eff_ts": "2023-01-01T00:00:00", "id": "a", "f": 2.5, "s": "1", "j": [3, 4]},
+        {"eff_ts": "2023-01-01T00:00:00", "id": "b", "f": None},
+    ]
+    wide = records_to_wide([records], ["f", "s", "j", "missing"])
+
+    assert wide["f"].dtypes.unique().tolist() == [np.dtype("float64")]
+    assert wide["f"].loc["2023-01-02", "b"] == 1.0
+    assert np.isnan(wide["f"].loc["2023-01-02", "a"])
+    assert wide["s"].loc["2023-01-01", "a"] == "1"
+    assert wide["j"].loc["2023-01-02", "b"] == [1, 2]
+    assert wide["j"].loc["2023-01-01", "b"] is None
+    assert wide["missing"].isna().all().all()
+
+    empty = records_to_wide([[]], ["f"])
+    assert empty["f"].empty
+
+
+def test_csv_to_frame():
+    text = "eff_ts,id,name,price,flag,n\n2023-01-01T00:00:00,1,NA,1.5,True,\n2023-01-02T00:00:00,2,x,,False,3"
+    definitions = [
+        {"name": "price", "data_type": "number64"},
+        {"name": "flag", "data_type": "bool"},
+        {"name": "n", "data_type": "int64"},
+    ]
+    df = csv_to_frame(text, dtypes=csv_dtypes(definitions))
+
+    assert df["id"].tolist() == ["1", "2"]  # ids stay strings
+    assert df["name"].tolist() == ["NA", "x"]
+    assert df["price"].dtype == "float64" and np.isnan(df["price"][1])
+    assert str(df["flag"].dtype) == "boolean"
+    assert str(df["n"].dtype) == "Int64" and df["n"].isna().tolist() == [True, False]
+
+    assert csv_to_frame("").empty
+    with pytest.raises(ValueError):
+        csv_dtypes([{"name": "holdings", "data_type": "object"}])
+
+
+def test_compact_frame_and_memory_report():
+    df = pd.DataFrame(
+        {
+            "eff_ts": ["2023-01-01T00:00:00", "2023-01-02T00:00:00"] * 500,
+            "id": ["a", "b"] * 500,
+            "name": ["A", "B"] * 500,
+            "price": [1, 2.5] * 500,
+            "count": [1, 2] * 500,
+            "label": ["x", "y"] * 500,
+        }
+    )
+    before = memory_report(df)
+    compact = compact_frame(df.copy(), float32=True)
+
+    assert str(compact["eff_ts"].dtype) == "datetime64[ns]"
+    assert compact["id"].dtype == "category" and compact["name"].dtype == "category"
+    assert compact["price"].dtype == "float32" and compact["count"].dtype == "float32"
+    assert compact["label"].dtype == object  # non numeric metrics are left alone
+    assert compact["price"].tolist()[:2] == [1.0, 2.5]
+
+    after = memory_report(compact)
+    assert after.loc["Total", "bytes"] < before.loc["Total", "bytes"] / 2
+    assert after.loc["price", "dtype"] == "float32"
+    assert after["share"].iloc[:-1].sum() == pytest.approx(1.0)
@@ -0,0 +1,75 @@
+"""
+Tests for the secapi metrics dataloader
+"""
+
+import threading
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+from merqube_client_lib.api_client import merqube_client
+from tests.unit.fixtures.fake_secapi import FakeSecapiSession
+
+
+def _session():
+    """one record per id; m2 is None for a and c"""
+    sess = FakeSecapiSession()
+    for sec_id, m1, m2 in [("a", 1.0, None), ("b", 2.0, 20.0), ("c", 3.0, None)]:
+        sess.publish("2023-01-01", sec_id, m1=m1, m2=m2)
+    sess.fail["boom"] = RuntimeError("boom")
+    return sess
+
+
+def test_loader_merges_and_splits():
+    sess = _session()
+    client = merqube_client.MerqubeAPIClient(user_session=sess)
+    loader = client.security_metrics_loader(window=0.05)
+
+    kwargs = {"sec_type": "index", "metrics": ["m1", "m2"], "start_date": "2023-01-01"}
+    futures = [
+        loader.submit(sec_ids=["a"], **kwargs),
+        loader.submit(sec_ids=["b", "c"], **kwargs),
+        loader.submit(sec_ids="a", **kwargs),
+        # not compatible: other metrics
+        loader.submit(sec_ids=["a"], sec_type="index", metrics=["m1"], start_date="2023-01-01"),
+    ]
+    results = [f.result(timeout=5) for f in futures]
+
+    assert len(sess.calls) == 2
+    assert sorted(c["ids"] for c in sess.calls) == ["a", "a,b,c"]
+
+    # each caller gets what it would have gotten alone
+    sess.calls.clear()
+    for res, ids in zip(results, ["a", "b,c", "a"]):
+        alone = client.get_security_metrics(sec_ids=ids.split(","), **kwargs)
+        assert_frame_equal(res, alone)
+    assert "m2" not in results[0]
+
+
+def test_loader_threads_and_errors():
+    sess = _session()
+    client = merqube_client.MerqubeAPIClient(user_session=sess)
+    loader = client.security_metrics_loader(window=0.05, max_securities=2)
+    results = {}
+
+    def read(sec_id):
+        results[sec_id] = loader.load(sec_type="index", metrics="m1", sec_ids=[sec_id])
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in ["a", "b", "c"]]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # at most 2 securities per request
+    sizes = [len(c["ids"].split(",")) for c in sess.calls]
+    assert sum(sizes) == 3 and max(sizes) <= 2
+    assert {i: df["m1"].tolist() for i, df in results.items()} == {"a": [1.0], "b": [2.0], "c": [3.0]}
+
+    # positional arguments are in get_security_metrics' order
+    assert_frame_equal(loader.load("index", "m1", None, ["b"]), client.get_security_metrics("index", "m1", None, ["b"]))
+
+    with pytest.raises(RuntimeError, match="boom"):
+        loader.load(sec_type="index", metrics="m1", sec_ids="boom")
+    with pytest.raises(ValueError):
+        loader.load(sec_type="index", metrics="m1", sec_ids="a", output="arrow")
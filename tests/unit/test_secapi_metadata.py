@@ -0,0 +1,129 @@
+"""
+Tests for the secapi metadata cache
+"""
+
+from unittest.mock import MagicMock
+
+import pytest
+
+from merqube_client_lib.api_client import merqube_client
+from merqube_client_lib.secapi.metadata import SecAPIMetadataCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_refresh_ahead():
+    clock = FakeClock()
+    cache = SecAPIMetadataCache(ttl=100, refresh_after=0.5, clock=clock)
+    load = MagicMock(side_effect=[1, 2, 3])
+
+    assert cache.get("k", load) == 1
+    clock.now = 40
+    assert cache.get("k", load) == 1
+    assert load.call_count == 1
+
+    # stale: the old value is returned while it is reloaded in the background
+    clock.now = 60
+    assert cache.get("k", load) == 1
+    cache.wait()
+    assert load.call_count == 2
+    assert cache.get("k", load) == 2
+
+    # expired: loaded on the calling thread
+    clock.now = 200
+    assert cache.get("k", load) == 3
+    assert load.call_count == 3
+
+
+def test_failed_refresh_keeps_value():
+    clock = FakeClock()
+    cache = SecAPIMetadataCache(ttl=100, clock=clock)
+    load = MagicMock(side_effect=[1] + [ValueError("boom")] * 3)
+
+    assert cache.get("k", load) == 1
+    clock.now = 90
+    assert cache.get("k", load) == 1
+    cache.wait()
+    assert cache.get("k", load) == 1
+
+    clock.now = 100
+    with pytest.raises(ValueError):
+        cache.get("k", load)
+
+
+def test_bounded():
+    clock = FakeClock()
+    cache = SecAPIMetadataCache(ttl=100, clock=clock, maxsize=2)
+    load = MagicMock(side_effect=lambda: clock.now)
+
+    cache.get("a", load)
+    cache.get("b", load)
+    clock.now = 10
+    assert cache.get("a", load) == 0
+    cache.get("c", load)  # drops b, the least recently used
+    assert load.call_count == 3
+    assert cache.get("a", load) == 0
+    assert cache.get("b", load) == 10
+    assert load.call_count == 4
+
+
+def test_client_caches_types_and_metrics():
+    """alternating between types does not refetch the type list"""
+    metrics = [{"data_type": "float64", "description": "price return", "name": "price_return"}]
+    urls = []
+
+    def get_collection(url, **kwargs):
+        urls.append(url)
+        return [{"name": "index"}, {"name": "intraday_index"}] if url == "/security" else metrics
+
+    sess = MagicMock()
+    sess.get_collection = get_collection
+    client = merqube_client.MerqubeAPIClient(user_session=sess)
+
+    for _ in range(3):
+        for sec_type in ["index", "intraday_index"]:
+            assert client.get_metrics_for_security(sec_type=sec_type, sec_id="a") == metrics
+    assert urls == [
+        "/security",
+        "/security/index/a/metrics",
+        "/security/intraday_index/a/metrics",
+    ]
+
+    client.get_metrics_for_security(sec_type="index", sec_id="a", use_cache=False)
+    assert len(urls) == 4
+
+    # unknown types refetch the list before failing
+    with pytest.raises(AssertionError, match="sec_type must be one of"):
+        client.get_metrics_for_security(sec_type="nope", sec_id="a")
+    assert len(urls) == 5
+
+
+def test_get_metrics_for_securities():
+    price = {"data_type": "float64", "description": "price return", "name": "price_return"}
+    total = {"data_type": "float64", "description": "total return", "name": "total_return"}
+
+    def get_collection(url, **kwargs):
+        if url == "/security":
+            return [{"name": "index"}]
+        # fresh (but equal) objects on every call, like json responses
+        return [dict(price)] if "/c/" in url else [dict(price), dict(total)]
+
+    sess = MagicMock()
+    sess.get_collection = get_collection
+    client = merqube_client.MerqubeAPIClient(user_session=sess)
+
+    res = client.get_metrics_for_securities(sec_type="index", sec_ids=["a", "b", "c", "a"], max_workers=2)
+    assert list(res) == ["a", "b", "c"]
+    assert res["a"] == (price, total)
+    assert res["c"] == (price,)
+    assert res["a"] is res["b"]
+    assert res["c"][0] is res["a"][0]
+
+    with pytest.raises(AssertionError):
+        client.get_metrics_for_securities(sec_type="index")
@@ -0,0 +1,96 @@
+"""
+Tests for the security name <-> id resolver
+"""
+
+from unittest.mock import MagicMock
+
+import pytest
+
+from merqube_client_lib.api_client import merqube_client
+from merqube_client_lib.secapi.resolver import SecurityResolver
+
+CATALOG = {f"name{i}": f"id{i}" for i in range(10)}
+
+
+def fake_mapping_table(sec_type, sec_names=None, sec_ids=None):
+    if sec_names is not None:
+        return {n: CATALOG[n] for n in sec_names if n in CATALOG}
+    if sec_ids is not None:
+        return {n_id: n for n, n_id in CATALOG.items() if n_id in sec_ids}
+    return dict(CATALOG)
+
+
+@pytest.fixture
+def fetch():
+    return MagicMock(side_effect=fake_mapping_table)
+
+
+def test_batches_only_unknown(fetch):
+    resolver = SecurityResolver(fetch=fetch, batch_size=3, max_workers=2)
+
+    assert resolver.ids_for_names("index", ["name1", "name2", "name3", "name4", "nope"]) == {
+        "name1": "id1",
+        "name2": "id2",
+        "name3": "id3",
+        "name4": "id4",
+    }
+    assert fetch.call_count == 2
+    assert sorted(len(c.kwargs["sec_names"]) for c in fetch.call_args_list) == [2, 3]
+
+    # all known (or known to be missing) now, and the reverse index is filled too
+    assert resolver.ids_for_names("index", "name2") == {"name2": "id2"}
+    assert resolver.ids_for_names("index", ["nope"]) == {}
+    assert resolver.names_for_ids("index", ["id1", "id4"]) == {"id1": "name1", "id4": "name4"}
+    assert fetch.call_count == 2
+
+    # unknown ids are requested
+    assert resolver.names_for_ids("index", ["id1", "id9"]) == {"id1": "name1", "id9": "name9"}
+    assert fetch.call_count == 3
+    assert fetch.call_args.kwargs == {"sec_type": "index", "sec_ids": ["id9"]}
+
+    # other types are separate
+    resolver.ids_for_names("intraday_index", ["name1"])
+    assert fetch.call_count == 4
+
+
+def test_missing_ttl_and_refresh(fetch):
+    resolver = SecurityResolver(fetch=fetch, missing_ttl=0)
+    resolver.ids_for_names("index", ["nope"])
+    resolver.ids_for_names("index", ["nope"])
+    assert fetch.call_count == 2
+
+    resolver.ids_for_names("index", ["name1"])
+    resolver.ids_for_names("index", ["name1"], refresh=True)
+    assert fetch.call_count == 4
+
+
+def test_load_all_and_disk(fetch, tmp_path):
+    path = str(tmp_path / "resolver.json")
+    resolver = SecurityResolver(fetch=fetch, path=path)
+    assert resolver.load_all("index") == CATALOG
+
+    reloaded = SecurityResolver(fetch=fetch, path=path)
+    assert reloaded.names_for_ids("index", ["id3"]) == {"id3": "name3"}
+    assert fetch.call_count == 1
+
+    reloaded.invalidate("index")
+    assert reloaded.names_for_ids("index", ["id3"]) == {"id3": "name3"}
+    assert fetch.call_count == 2
+
+
+def test_client_resolver():
+    sess = MagicMock()
+    sess.get_collection = MagicMock(
+        side_effect=lambda url, options, **kwargs: [
+            {"name": n, "id": i} for n, i in CATALOG.items() if n in options.get("names", "").split(",")
+        ]
+    )
+
+    client = merqube_client.MerqubeAPIClient(user_session=sess)
+    client.get_supported_secapi_types = lambda: [{"name": "index"}]
+
+    assert client.resolve_security_ids("index", ["name1", "name2"]) == {"name1": "id1", "name2": "id2"}
+    assert client.resolve_security_ids("index", ["name1"]) == {"name1": "id1"}
+    assert client.resolve_security_names("index", ["id2"]) == {"id2": "name2"}
+    assert sess.get_collection.call_count == 1
+    assert sess.get_collection.call_args.kwargs["options"] == {"names": "name1,name2"}
@@ -0,0 +1,101 @@
+"""
+Tests for incremental polling of secapi metrics
+"""
+
+import pandas as pd
+from freezegun import freeze_time
+
+from merqube_client_lib.api_client import merqube_client
+from tests.unit.fixtures.fake_secapi import FakeSecapiSession
+
+
+def test_watch_security_metrics():
+    sess = FakeSecapiSession()
+    for day in ["2023-01-01", "2023-01-02"]:
+        for sec_id in ["a", "b"]:
+            sess.publish(day, sec_id, m1=1.0, m2=2.0)
+    sess.publish("2022-12-31", "a", m1=0.0, m2=0.0)
+
+    sleeps = []
+    # what gets published before each poll after the first
+    publications = iter(
+        [
+            # nothing new
+            lambda: None,
+            # a new day for a, and b's latest value is revised
+            lambda: (sess.publish("2023-01-03", "a", m1=3.0, m2=3.0), sess.publish("2023-01-02", "b", m1=1.5, m2=2.0)),
+            lambda: None,
+        ]
+    )
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        next(publications)()
+
+    client = merqube_client.MerqubeAPIClient(user_session=sess)
+    deltas = list(
+        client.watch_security_metrics(
+            sec_type="index",
+            metrics=["m1", "m2"],
+            sec_ids=["a", "b"],
+            start_date="2023-01-01",
+            poll_interval=10,
+            max_polls=4,
+            # only the latest point is polled again
+            lookback=pd.Timedelta(0),
+            sleep=sleep,
+        )
+    )
+
+    assert len(deltas) == 2
+    assert len(deltas[0]) == 4 and deltas[0]["eff_ts"].min() == "2023-01-01T00:00:00"
+    assert deltas[1][["eff_ts", "id", "m1", "m2"]].to_dict("records") == [
+        {"eff_ts": "2023-01-03T00:00:00", "id": "a", "m1": 3.0, "m2": 3.0},
+        {"eff_ts": "2023-01-02T00:00:00", "id": "b", "m1": 1.5, "m2": 2.0},
+    ]
+
+    # polls after the first only ask from the high-water marks
+    assert [c["start_date"] for c in sess.calls] == [
+        "2023-01-01T00:00:00",
+        "2023-01-02T00:00:00",
+        "2023-01-02T00:00:00",
+        # a and b are now at different marks
+        "2023-01-03T00:00:00",
+        "2023-01-02T00:00:00",
+    ]
+    # the interval backs off after an empty poll, and resets when there is new data
+    assert sleeps == [10, 20, 10]
+
+
+@freeze_time("2023-01-10T12:00:00")
+def test_watch_restatements_and_empty_series():
+    sess = FakeSecapiSession()
+    for day in pd.date_range("2023-01-01", "2023-01-05"):
+        sess.publish(day, "a", m1=1.0)
+
+    def restate(_):
+        sess.publish("2023-01-03", "a", m1=1.5)  # within lookback of the mark
+
+    client = merqube_client.MerqubeAPIClient(user_session=sess)
+    deltas = list(
+        client.watch_security_metrics(
+            sec_type="index",
+            metrics="m1",
+            sec_ids=["a", "c"],  # c has no data
+            start_date="2022-12-01",
+            lookback="3D",
+            max_polls=2,
+            sleep=restate,
+        )
+    )
+
+    assert len(deltas[0]) == 5
+    assert deltas[1][["eff_ts", "id", "m1"]].to_dict("records") == [
+        {"eff_ts": "2023-01-03T00:00:00", "id": "a", "m1": 1.5}
+    ]
+    # the second poll asks for lookback before a's mark, and before the first poll for c (not from start again)
+    assert [(c["ids"], c["start_date"]) for c in sess.calls] == [
+        ("a,c", "2022-12-01T00:00:00"),
+        ("a", "2023-01-02T00:00:00"),
+        ("c", "2023-01-07T12:00:00"),
+    ]
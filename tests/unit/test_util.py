@@ -2,6 +2,10 @@
 Tests for utilities
 """
 
+import threading
+import time
+
+import numpy as np
 import pandas as pd
 import pytest
 from freezegun import freeze_time
@@ -12,6 +16,8 @@ from merqube_client_lib.util import (
     freezable_now_ts,
     freezable_utcnow_iso,
     freezable_utcnow_ts,
+    iter_batches,
+    iter_concurrently,
 )
 
 
@@ -38,6 +44,99 @@ def test_batch_post_payload():
     ]
 
 
+def test_iter_batches():
+    """batches by count and/or bytes, lazily, with views of sequences"""
+    assert list(iter_batches((i for i in range(7)), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(iter_batches((1, 2, 3), 2)) == [(1, 2), (3,)]
+    assert list(iter_batches([], 2)) == []
+
+    arr = np.arange(10)
+    batches = list(iter_batches(arr, 4))
+    assert [b.tolist() for b in batches] == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    assert all(np.shares_memory(b, arr) for b in batches)
+
+    df = pd.DataFrame({"a": range(5)})
+    assert [b["a"].tolist() for b in iter_batches(df, 2)] == [[0, 1], [2, 3], [4]]
+
+    # json arrays of at most 8 bytes: [aa,b] is 6 bytes, [aa,b,cc] would be 9
+    rows = [b"aa", b"b", b"cc", b"dddddddddd", b"e"]
+    expected = [[b"aa", b"b"], [b"cc"], [b"dddddddddd"], [b"e"]]
+    kwargs = {"max_bytes": 8, "item_overhead": 1, "batch_overhead": 1}
+    assert list(iter_batches(rows, **kwargs)) == expected
+    assert list(iter_batches(iter(rows), **kwargs)) == expected
+    assert list(iter_batches(rows, batch_size=1, max_bytes=100)) == [[r] for r in rows]
+
+    # lazy: nothing past the first batch is consumed
+    consumed = []
+
+    def gen():
+        for i in range(100):
+            consumed.append(i)
+            yield i
+
+    assert next(iter_batches(gen(), 3)) == [0, 1, 2]
+    assert consumed == [0, 1, 2, 3]
+
+    with pytest.raises(ValueError):
+        list(iter_batches([1], 0))
+    with pytest.raises(ValueError):
+        list(iter_batches([1]))
+
+
+@pytest.mark.parametrize("max_workers", [1, 2, 5])
+def test_iter_concurrently_ordered(max_workers):
+    """results come back in input order, regardless of which finishes first"""
+
+    def slow_square(x):
+        time.sleep(0.01 * (5 - x))
+        return x * x
+
+    assert list(iter_concurrently(slow_square, range(5), max_workers=max_workers)) == [0, 1, 4, 9, 16]
+    assert sorted(iter_concurrently(slow_square, range(5), max_workers=max_workers, ordered=False)) == [0, 1, 4, 9, 16]
+
+
+def test_iter_concurrently_bounded_and_lazy():
+    """at most max_workers calls are in flight, and the input is consumed lazily"""
+    lock = threading.Lock()
+    in_flight = [0]
+    max_seen = [0]
+    consumed = []
+
+    def gen():
+        for i in range(10):
+            consumed.append(i)
+            yield i
+
+    def func(x):
+        with lock:
+            in_flight[0] += 1
+            max_seen[0] = max(max_seen[0], in_flight[0])
+        time.sleep(0.005)
+        with lock:
+            in_flight[0] -= 1
+        return x
+
+    it = iter_concurrently(func, gen(), max_workers=2)
+    assert next(it) == 0
+    # two submitted up front, then one more before the first result was yielded
+    assert len(consumed) == 3
+    assert list(it) == list(range(1, 10))
+    assert max_seen[0] <= 2
+
+
+def test_iter_concurrently_raises():
+    def func(x):
+        if x == 2:
+            raise ValueError("boom")
+        return x
+
+    with pytest.raises(ValueError):
+        list(iter_concurrently(func, range(5), max_workers=2))
+
+    with pytest.raises(ValueError):
+        list(iter_concurrently(func, range(5), max_workers=0))
+
+
 @freeze_time("2023-06-06T06:06:09")
 @pytest.mark.parametrize(
     "tz, expec, expec_iso",